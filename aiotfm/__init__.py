@@ -1,14 +1,18 @@
 from aiotfm import enums, errors, utils
 from aiotfm.__version__ import __author__, __credits__, __description__, __license__, __title__, __url__, __version__
-from aiotfm.client import Client
+from aiotfm.client import Client, cp_handler, packet_handler
 from aiotfm.connection import Connection
 from aiotfm.enums import GameMode
 from aiotfm.packet import Packet
 from aiotfm.player import Player, Profile, Stats
+from aiotfm.pool import ClientPool
+from aiotfm.schema import Schema
+from aiotfm.supervisor import Supervisor
 from aiotfm.tribe import Member, Rank, Tribe
 
 __all__ = [
 	"__author__", "__credits__", "__description__", "__license__", "__title__", "__url__",
-	"__version__", "enums", "errors", "utils", "Client", "Connection", "Member", "Packet",
-	"Player", "Profile", "Rank", "Stats", "Tribe", "GameMode",
+	"__version__", "enums", "errors", "utils", "Client", "ClientPool", "Connection", "Member", "Packet",
+	"Player", "Profile", "Rank", "Schema", "Stats", "Supervisor", "Tribe", "GameMode", "cp_handler",
+	"packet_handler",
 ]  # fmt:off
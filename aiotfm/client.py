@@ -2,10 +2,10 @@ import asyncio
 import logging
 import random
 import warnings
-from typing import AnyStr, ByteString, Callable, List, Optional, Union
+from typing import Any, AnyStr, ByteString, Callable, Dict, List, Optional, Tuple, Union
 
 from aiotfm.connection import Connection
-from aiotfm.enums import Community, GameMode, TradeError
+from aiotfm.enums import Community, GameMode, Priority, TradeError, TrafficClass
 from aiotfm.errors import (
 	AiotfmException,
 	AlreadyConnected,
@@ -19,8 +19,9 @@ from aiotfm.errors import (
 from aiotfm.friend import Friend, FriendList
 from aiotfm.inventory import Inventory, InventoryItem, Trade
 from aiotfm.message import Channel, ChannelMessage, Message, Whisper
-from aiotfm.packet import Packet
+from aiotfm.packet import Packet, PacketPool, PrebuiltPacket
 from aiotfm.player import Player, Profile
+from aiotfm.ratelimit import RateLimiter
 from aiotfm.room import Room, RoomList
 from aiotfm.shop import Shop
 from aiotfm.tribe import Tribe
@@ -28,6 +29,45 @@ from aiotfm.utils import Keys, Locale, get_ip, get_keys, shakikoo
 
 logger = logging.getLogger("aiotfm")
 
+KEEP_ALIVE = PrebuiltPacket(Packet.new(26, 26))
+
+
+def packet_handler(c: int, cc: int) -> Callable:
+	"""A decorator that registers a method of a :class:`Client` (sub)class as the handler of a packet.
+
+	The handler is called with the connection that received the packet and the packet itself,
+	positioned after its code. It can be a coroutine function and returns False if it did not
+	handle the packet.
+
+	The packets of a connection are handled in order: the packets received while a coroutine
+	handler runs wait for it to return. A coroutine handler must therefore not wait for a packet
+	of the same connection (e.g. with :meth:`Client.wait_for`), it would only get it after timing
+	out. Spawn a task for such work instead.
+
+	:param c: :class:`int` the packet's C code.
+	:param cc: :class:`int` the packet's CC code.
+	"""
+
+	def decorator(func: Callable) -> Callable:
+		func.__dict__.setdefault("_packet_codes", []).append((c << 8) | cc)
+		return func
+
+	return decorator
+
+
+def cp_handler(tc: int) -> Callable:
+	"""A decorator that registers a method of a :class:`Client` (sub)class as the handler of a
+	community platform packet. See :func:`packet_handler`.
+
+	:param tc: :class:`int` the community platform packet's code.
+	"""
+
+	def decorator(func: Callable) -> Callable:
+		func.__dict__.setdefault("_cp_codes", []).append(tc)
+		return func
+
+	return decorator
+
 
 class Client:
 	"""Represents a client that connects to Transformice.
@@ -50,6 +90,20 @@ class Client:
 
 	max_retries: Optional[:class:`int`]
 		The maximum number of retries the client should attempt while connecting to the game.
+	max_cp_requests: Optional[:class:`int`]
+		The maximum number of :meth:`Client.request_cp` requests waiting for their response at once.
+	coalesce_writes: Optional[:class:`bool`]
+		Whether the packets sent during one iteration of the event loop should be written
+		together, in a single call. Saves system calls for bots that send bursts of packets.
+	max_send_queue: Optional[:class:`int`]
+		The maximum number of packets waiting to be written on each connection while the
+		server doesn't keep up. Sending more waits for the queue to drain.
+	send_overflow: Optional[:class:`str`]
+		What happens to low priority packets (emotes, smileys) once the send queue is full:
+		``"block"`` (defaults) waits for the queue to drain, ``"drop"`` drops them.
+	rate_limits: Optional[:class:`dict`]
+		The ``(rate, burst)`` of the :class:`aiotfm.enums.TrafficClass` to rate limit, e.g.
+		:attr:`aiotfm.ratelimit.RateLimiter.DEFAULT_RATES`. Nothing is rate limited by default.
 
 	Attributes
 	----------
@@ -68,9 +122,57 @@ class Client:
 		The bot's locale (translations).
 	friends: Optional[:class:`aiotfm.friends.FriendList`]
 		The bot's friend list
+	packet_pool: :class:`aiotfm.packet.PacketPool`
+		The pool of the packets the client sends on its own (pings, community platform,
+		chat). Its counters show how many packets were reused instead of allocated.
+	rate_limiter: :class:`aiotfm.ratelimit.RateLimiter`
+		Paces the chat messages, community platform requests and lua loads.
+	bulle_switch_latency: Optional[:class:`float`]
+		How long (in seconds) the last bulle switch took, from the switch packet to the new bulle
+		being ready. None until the client switched bulle once.
+	keep_alive: :class:`bool`
+		Whether the client sends its own keep-alive packets while running. A
+		:class:`aiotfm.pool.ClientPool` turns it off and keeps its clients alive itself.
 	"""
 
 	LOG_UNHANDLED_PACKETS = False
+	# How often (in seconds) the keep-alive packets are sent.
+	KEEP_ALIVE_INTERVAL = 15
+	# How long (in seconds) a server message waits for the translations still loading.
+	LOCALE_TIMEOUT = 5
+	# How long (in seconds) the previous bulle gets to handle the packets it received before being closed.
+	BULLE_DRAIN_TIMEOUT = 3
+
+	# The events that can be waited for by key, and how to get the key from the event's arguments.
+	WAITER_KEYS: Dict[str, Callable] = {
+		"on_raw_cp": lambda tc, packet: tc,
+		"on_channel_who": lambda sequence_id, players: sequence_id,
+		"on_room_list": lambda roomlist: roomlist.gamemode,
+	}
+
+	_packet_handlers: Dict[int, Callable] = {}
+	_cp_handlers: Dict[int, Callable] = {}
+
+	def __init_subclass__(cls, **kwargs):
+		super().__init_subclass__(**kwargs)
+		cls._register_handlers()
+
+	@classmethod
+	def _register_handlers(cls):
+		"""Builds the class' registries of packet handlers, from the parent's ones and the decorated methods."""
+		cls._packet_handlers = dict(cls._packet_handlers)
+		cls._cp_handlers = dict(cls._cp_handlers)
+
+		for value in vars(cls).values():
+			for code in getattr(value, "_packet_codes", ()):
+				cls._packet_handlers[code] = value
+			for code in getattr(value, "_cp_codes", ()):
+				cls._cp_handlers[code] = value
+
+		# A handler overridden without the decorator keeps its registration
+		for registry in (cls._packet_handlers, cls._cp_handlers):
+			for code, handler in registry.items():
+				registry[code] = getattr(cls, handler.__name__)
 
 	def __init__(
 		self,
@@ -79,25 +181,45 @@ class Client:
 		bot_role: bool = False,
 		loop: Optional[asyncio.AbstractEventLoop] = None,
 		max_retries: int = 6,
+		max_cp_requests: int = 64,
+		coalesce_writes: bool = False,
+		max_send_queue: int = 256,
+		send_overflow: str = "block",
+		rate_limits: Optional[Dict[TrafficClass, Optional[Tuple[float, int]]]] = None,
 	):
 		self.loop: asyncio.AbstractEventLoop = loop or asyncio.get_event_loop()
 
-		self.main: Connection = Connection("main", self, self.loop)
+		self._connection_options: dict = {
+			"coalesce": coalesce_writes,
+			"max_queue": max_send_queue,
+			"overflow": send_overflow,
+		}
+		self.main: Connection = Connection("main", self, self.loop, **self._connection_options)
 		self.bulle: Connection = None
 
 		self._waiters: dict = {}
+		self._keyed_waiters: dict = {}
 		self._close_event: asyncio.Future = None
+		self._bulle_task: asyncio.Task = None
+		self._locale_task: asyncio.Task = None
+		self.bulle_switch_latency: Optional[float] = None
 		self._sequenceId: int = 0
+		self._cp_requests: Dict[int, tuple] = {}
+		self._cp_semaphore: asyncio.Semaphore = asyncio.Semaphore(max_cp_requests)
 		self._channels: List[Channel] = []
 		self._restarting: bool = False
 		self._closed: bool = False
 		self._logged: bool = False
 		self._max_retries: int = max_retries
 
+		self.packet_pool: PacketPool = PacketPool()
+		self.rate_limiter: RateLimiter = RateLimiter(rate_limits)
+
 		self.room: Room = None
 		self.trade: Trade = None
 		self.trades: dict = {}
-		self.inventory: Inventory = None
+		self._inventory: Inventory = None
+		self._inventory_packet: Packet = None
 
 		self.username: str = None
 		self.locale: Locale = Locale()
@@ -109,10 +231,31 @@ class Client:
 		self.authkey: int = 0
 
 		self.auto_restart: bool = auto_restart
+		self.keep_alive: bool = True
 		self.api_tfmid: int = None
 		self.api_token: str = None
 		self.bot_role: bool = bot_role
 
+	@property
+	def inventory(self) -> Optional[Inventory]:
+		"""The bot's inventory. It is parsed on first access if nothing listened to its update."""
+		if self._inventory_packet is not None:
+			packet, self._inventory_packet = self._inventory_packet, None
+			self._inventory = Inventory.from_packet(packet)
+			self._inventory.client = self
+
+		return self._inventory
+
+	@inventory.setter
+	def inventory(self, inventory: Optional[Inventory]):
+		self._inventory = inventory
+		self._inventory_packet = None
+
+	@property
+	def pending_cp_requests(self) -> int:
+		"""The number of :meth:`Client.request_cp` requests waiting for their response."""
+		return len(self._cp_requests)
+
 	@property
 	def restarting(self) -> bool:
 		return self._restarting
@@ -125,11 +268,11 @@ class Client:
 		"""Returns the numbers of seconds to wait until the n-th connection attempt. Capped at 10 minutes."""
 		return random.uniform(20, 30 * 2 ** min(n, 5))
 
-	def data_received(self, data: bytes, connection: Connection):
-		"""|coro|
-		Dispatches the received data.
+	def data_received(self, data: Union[bytes, memoryview], connection: Connection):
+		"""Dispatches the received data.
 
-		:param data: :class:`bytes` the received data.
+		:param data: :class:`bytes` or :class:`memoryview` the received data. A :class:`memoryview`
+			is only valid for the duration of this call and must be copied to be kept.
 		:param connection: :class:`aiotfm.Connection` the connection that received
 			the data.
 		"""
@@ -138,13 +281,38 @@ class Client:
 		# :param connection: :class:`aiotfm.Connection` the connection that received
 		# the packet.
 		# :param packet: :class:`aiotfm.Packet` a copy of the packet.
-		self.dispatch("raw_socket", connection, Packet(data))
-		self.loop.create_task(self.handle_packet(connection, Packet(data)))
+		packet = Packet(data)
+		self.dispatch("raw_socket", connection, packet.copy())
+
+		if type(self).handle_packet is not Client.handle_packet or not connection.idle:
+			# Either a subclass overrides handle_packet or a previous packet is still being handled.
+			connection.schedule(self.handle_packet(connection, packet))
+			return
+
+		try:
+			result = self._handle_packet(connection, packet)
+			if asyncio.iscoroutine(result):
+				connection.schedule(result)
+		except Exception as e:
+			logger.error("An error occurred while handling the packet %r:", packet, exc_info=e)
 
 	async def handle_packet(self, connection: Connection, packet: Packet) -> bool:
 		"""|coro|
 		Handles the known packets and dispatches events.
-		Subclasses should handle only the unhandled packets from this method.
+
+		The packets are handled by the methods registered with :func:`packet_handler` and
+		:func:`cp_handler`, which subclasses can use to handle new packets or override the
+		existing handlers: ::
+			class Bot(aiotfm.Client):
+				@aiotfm.packet_handler(5, 2)  # New map
+				def handle_new_map(self, conn, packet):
+					...
+
+		Subclasses can also override this method to handle only the unhandled packets.
+		Note that doing so disables the inline handling of the packets: they will be handled
+		one after the other by the connection's consumer task instead. An override must not
+		wait for another packet of the same connection, which would only be handled after it
+		returns.
 
 		Example: ::
 			class Bot(aiotfm.Client):
@@ -160,523 +328,633 @@ class Client:
 		:param packet: :class:`aiotfm.Packet` the packet.
 		:return: True if the packet got handled, False otherwise.
 		"""
-		CCC = packet.readCode()
-		if CCC == (1, 1):  # Old packets
-			oldCCC, *data = packet.readString().split(b"\x01")
-			data = list(map(bytes.decode, data))
-			oldCCC = tuple(oldCCC[:2])
-
-			# :desc: Called when an old packet is received. Does not interfere
-			# with :meth:`Client.handle_old_packet`.
-			# :param connection: :class:`aiotfm.Connection` the connection that received
-			# the packet.
-			# :param oldCCC: :class:`tuple` the packet identifiers on the old protocol.
-			# :param data: :class:`list` the packet data.
-			self.dispatch("old_packet", connection, oldCCC, data)
-			return await self.handle_old_packet(connection, oldCCC, data)
-
-		if CCC == (5, 21):  # Joined room
-			self.room = Room(official=packet.readBool(), name=packet.readUTF())
-
-			# :desc: Called when the client has joined a room.
-			# :param room: :class:`aiotfm.room.Room` the room the client has entered.
-			self.dispatch("joined_room", self.room)
-
-		elif CCC == (5, 39):  # Password required for the room
-			# :desc: Called when a password is required to enter a room
-			# :param room: :class:`aiotfm.room.Room` the room the server is asking for a password.
-			self.dispatch("room_password", Room(packet.readUTF()))
-
-		elif CCC == (6, 6):  # Room message
-			username = packet.readUTF()
-			message = packet.readUTF()
-			player = self.room.get_player(username=username)
+		result = self._handle_packet(connection, packet)
+		if asyncio.iscoroutine(result):
+			result = await result
+		return result is not False
 
-			if player is None:
-				player = Player(username)
+	def _handle_packet(self, connection: Connection, packet: Packet):
+		"""Calls the handler registered for the packet.
+
+		:return: the handler's result, which is awaitable if the handler is a coroutine function,
+			or False if the packet is unknown.
+		"""
+		code = packet.read16()
+		handler = self._packet_handlers.get(code)
+		if handler is None:
+			if self.LOG_UNHANDLED_PACKETS:
+				print((code >> 8, code & 0xFF), bytes(packet.buffer)[2:])
+			return False
 
-			# :desc: Called when the client receives a message from the room.
-			# :param message: :class:`aiotfm.message.Message` the message.
-			self.dispatch("room_message", Message(player, message, self))
+		return handler(self, connection, packet)
 
-		elif CCC == (6, 20):  # Server message
-			packet.readBool()  # if False then the message will appear in the #Server channel
-			t_key = packet.readUTF()
-			t_args = [packet.readUTF() for i in range(packet.read8())]
+	@packet_handler(1, 1)  # Old packets
+	def _handle_old_protocol(self, connection: Connection, packet: Packet):
+		oldCCC, *data = packet.readString().split(b"\x01")
+		data = list(map(bytes.decode, data))
+		oldCCC = tuple(oldCCC[:2])
 
-			# :desc: Called when the client receives a message from the server that needs to be translated.
-			# :param message: :class:`aiotfm.locale.Translation` the message translated with the
-			# current locale.
-			# :param *args: a list of string used as replacement inside the message.
+		# :desc: Called when an old packet is received. Does not interfere
+		# with :meth:`Client.handle_old_packet`.
+		# :param connection: :class:`aiotfm.Connection` the connection that received
+		# the packet.
+		# :param oldCCC: :class:`tuple` the packet identifiers on the old protocol.
+		# :param data: :class:`list` the packet data.
+		self.dispatch("old_packet", connection, oldCCC, data)
+		if type(self).handle_old_packet is not Client.handle_old_packet:
+			return self.handle_old_packet(connection, oldCCC, data)
+		return self._handle_old_packet(connection, oldCCC, data)
+
+	@packet_handler(5, 21)  # Joined room
+	def _handle_joined_room(self, connection: Connection, packet: Packet):
+		self.room = Room(official=packet.readBool(), name=packet.readUTF())
+
+		# :desc: Called when the client has joined a room.
+		# :param room: :class:`aiotfm.room.Room` the room the client has entered.
+		self.dispatch("joined_room", self.room)
+
+	@packet_handler(5, 39)  # Password required for the room
+	def _handle_room_password(self, connection: Connection, packet: Packet):
+		# :desc: Called when a password is required to enter a room
+		# :param room: :class:`aiotfm.room.Room` the room the server is asking for a password.
+		self.dispatch("room_password", Room(packet.readUTF()))
+
+	@packet_handler(6, 6)  # Room message
+	def _handle_room_message(self, connection: Connection, packet: Packet):
+		username = packet.readUTF()
+		message = packet.readUTF()
+		player = self.room.get_player(username=username)
+
+		if player is None:
+			player = Player(username)
+
+		# :desc: Called when the client receives a message from the room.
+		# :param message: :class:`aiotfm.message.Message` the message.
+		self.dispatch("room_message", Message(player, message, self))
+
+	@packet_handler(6, 20)  # Server message
+	def _handle_server_message(self, connection: Connection, packet: Packet):
+		packet.readBool()  # if False then the message will appear in the #Server channel
+		t_key = packet.readUTF()
+		t_args = [packet.readUTF() for i in range(packet.read8())]
+
+		# :desc: Called when the client receives a message from the server that needs to be translated.
+		# :param message: :class:`aiotfm.locale.Translation` the message translated with the
+		# current locale.
+		# :param *args: a list of string used as replacement inside the message.
+		if self._locale_task is not None and not self._locale_task.done():
+			# Wait for the translations without holding the packets back.
+			self.loop.create_task(self._dispatch_server_message(t_key, t_args))
+		else:
 			self.dispatch("server_message", self.locale[t_key], *t_args)
 
-		elif CCC == (8, 1):  # Play emote
-			player = self.room.get_player(pid=packet.read32())
-			emote = packet.read8()
-			flag = packet.readUTF() if emote == 10 else ""
+	async def _dispatch_server_message(self, t_key: str, t_args: List[str]):
+		"""|coro|
+		Dispatches a server message once the locale is loaded, or untranslated if it takes too long.
+		"""
+		await asyncio.wait((self._locale_task,), timeout=self.LOCALE_TIMEOUT)
+		self.dispatch("server_message", self.locale[t_key], *t_args)
+
+	@packet_handler(8, 1)  # Play emote
+	def _handle_emote(self, connection: Connection, packet: Packet):
+		player = self.room.get_player(pid=packet.read32())
+		emote = packet.read8()
+		flag = packet.readUTF() if emote == 10 else ""
+
+		# :desc: Called when a player plays an emote.
+		# :param player: :class:`aiotfm.Player` the player.
+		# :param emote: :class:`int` the emote's id.
+		# :param flag: :class:`str` the flag's id.
+		self.dispatch("emote", player, emote, flag)
+
+	@packet_handler(8, 5)  # Show emoji
+	def _handle_emoji(self, connection: Connection, packet: Packet):
+		player = self.room.get_player(pid=packet.read32())
+		emoji = packet.read8()
+
+		# :desc: Called when a player is showing an emoji above its head.
+		# :param player: :class:`aiotfm.Player` the player.
+		# :param emoji: :class:`int` the emoji's id.
+		self.dispatch("emoji", player, emoji)
+
+	@packet_handler(8, 6)  # Player won
+	def _handle_player_won(self, connection: Connection, packet: Packet):
+		packet.read8()
+		player = self.room.get_player(pid=packet.read32())
+		player.score = packet.read16()
+		order = packet.read8()
+		player_time = packet.read16() / 100
+
+		# :desc: Called when a player get the cheese to the hole.
+		# :param player: :class:`aiotfm.Player` the player.
+		# :param order: :class:`int` the order of the player in the hole.
+		# :param player_time: :class:`float` player's time in the hole in seconds.
+		self.dispatch("player_won", player, order, player_time)
+
+	@packet_handler(8, 16)  # Profile
+	def _handle_profile(self, connection: Connection, packet: Packet):
+		if not self._has_listener("profile"):
+			return
 
-			# :desc: Called when a player plays an emote.
-			# :param player: :class:`aiotfm.Player` the player.
-			# :param emote: :class:`int` the emote's id.
-			# :param flag: :class:`str` the flag's id.
-			self.dispatch("emote", player, emote, flag)
+		# :desc: Called when the client receives the result of a /profile command.
+		# :param profile: :class:`aiotfm.player.Profile` the profile.
+		self.dispatch("profile", Profile(packet))
 
-		elif CCC == (8, 5):  # Show emoji
-			player = self.room.get_player(pid=packet.read32())
-			emoji = packet.read8()
+	@packet_handler(8, 20)  # Shop
+	def _handle_shop(self, connection: Connection, packet: Packet):
+		if not self._has_listener("shop"):
+			return
 
-			# :desc: Called when a player is showing an emoji above its head.
-			# :param player: :class:`aiotfm.Player` the player.
-			# :param emoji: :class:`int` the emoji's id.
-			self.dispatch("emoji", player, emoji)
+		# :desc: Called when the client receives the content of the shop.
+		# :param shop: :class:`aiotfm.shop.Shop` the shop.
+		self.dispatch("shop", Shop(packet))
+
+	@packet_handler(8, 22)  # Skills
+	def _handle_skills(self, connection: Connection, packet: Packet):
+		skills = {}
+		for _ in range(packet.read8()):
+			key, value = packet.read8(), packet.read8()
+			skills[key] = value
+
+		# :desc: Called when the client receives its skill tree.
+		# :param skills: :class:`dict` the skills.
+		self.dispatch("skills", skills)
+
+	@packet_handler(16, 2)  # Tribe invitation received
+	def _handle_tribe_invitation(self, connection: Connection, packet: Packet):
+		author = packet.readUTF()
+		tribe = packet.readUTF()
+
+		# :desc: Called when the client receives an invitation to a tribe. (/inv)
+		# :param author: :class:`str` the player that invited you.
+		# :param tribe: :class:`str` the tribe.
+		self.dispatch("tribe_inv", author, tribe)
+
+	@packet_handler(26, 2)  # Logged in successfully
+	def _handle_logged(self, connection: Connection, packet: Packet):
+		player_id = packet.read32()
+		self.username = username = packet.readUTF()
+		played_time = packet.read32()
+		community = Community(packet.read8())
+		pid = packet.read32()
+
+		# :desc: Called when the client successfully logged in.
+		# :param uid: :class:`int` the client's unique id.
+		# :param username: :class:`str` the client's username.
+		# :param played_time: :class:`int` the total number of minutes the client has played.
+		# :param community: :class:`aiotfm.enums.Community` the community the client has connected to.
+		# :param pid: :class:`int` the client's player id.
+		self.dispatch("logged", player_id, username, played_time, community, pid)
+
+	@packet_handler(26, 3)  # Handshake OK
+	def _handle_handshake_ok(self, connection: Connection, packet: Packet):
+		online_players = packet.read32()
+		language = packet.readUTF()
+		country = packet.readUTF()
+		self.authkey = packet.read32()
+		self._logged = False
+
+		os_info = Packet.new(28, 17).writeString("en").writeString("Linux")
+		os_info.writeString("LNX 29,0,0,140").write8(0)
+
+		connection.schedule(connection.send(os_info))
+
+		# :desc: Called when the client can login through the game.
+		# :param online_players: :class:`int` the number of player connected to the game.
+		# :param language: :class:`str` the language the server is suggesting.
+		# :param country: :class:`str` the country detected from your ip.
+		self.dispatch("login_ready", online_players, language, country)
+
+	@packet_handler(26, 12)  # Login result
+	def _handle_login_result(self, connection: Connection, packet: Packet):
+		self._logged = False
+		# :desc: Called when the client failed logging.
+		# :param code: :class:`int` the error code.
+		# :param error1: :class:`str` error messages.
+		# :param error2: :class:`str` error messages.
+		self.dispatch("login_result", packet.read8(), packet.readUTF(), packet.readUTF())
+
+	@packet_handler(26, 25)  # Ping
+	def _handle_ping(self, connection: Connection, packet: Packet):
+		# :desc: Called when the client receives the ping response from the server.
+		self.dispatch("ping")
+
+	@packet_handler(26, 35)  # Room list
+	def _handle_room_list(self, connection: Connection, packet: Packet):
+		if not self._has_listener("room_list"):
+			return
 
-		elif CCC == (8, 6):  # Player won
-			packet.read8()
-			player = self.room.get_player(pid=packet.read32())
-			player.score = packet.read16()
-			order = packet.read8()
-			player_time = packet.read16() / 100
+		roomlist = RoomList.from_packet(packet)
+		# :desc: Dispatched when the client receives the room list
+		self.dispatch("room_list", roomlist)
+
+	@packet_handler(28, 6)  # Server ping
+	def _handle_server_ping(self, connection: Connection, packet: Packet):
+		# The reply skips the packets waiting to be handled or sent.
+		connection.send_control(self.packet_pool.acquire(28, 6).write8(packet.read8()))
+
+	@packet_handler(29, 6)  # Lua logs
+	def _handle_lua_log(self, connection: Connection, packet: Packet):
+		# :desc: Called when the client receives lua logs from #Lua.
+		# :param log: :class:`str` a log message.
+		self.dispatch("lua_log", packet.readUTF())
+
+	@packet_handler(31, 1)  # Inventory data
+	def _handle_inventory(self, connection: Connection, packet: Packet):
+		# Defer the parsing until the inventory is actually accessed
+		self.inventory = None
+		self._inventory_packet = packet
+		if not self._has_listener("inventory_update"):
+			return
 
-			# :desc: Called when a player get the cheese to the hole.
-			# :param player: :class:`aiotfm.Player` the player.
-			# :param order: :class:`int` the order of the player in the hole.
-			# :param player_time: :class:`float` player's time in the hole in seconds.
-			self.dispatch("player_won", player, order, player_time)
-
-		elif CCC == (8, 16):  # Profile
-			# :desc: Called when the client receives the result of a /profile command.
-			# :param profile: :class:`aiotfm.player.Profile` the profile.
-			self.dispatch("profile", Profile(packet))
-
-		elif CCC == (8, 20):  # Shop
-			# :desc: Called when the client receives the content of the shop.
-			# :param shop: :class:`aiotfm.shop.Shop` the shop.
-			self.dispatch("shop", Shop(packet))
-
-		elif CCC == (8, 22):  # Skills
-			skills = {}
-			for _ in range(packet.read8()):
-				key, value = packet.read8(), packet.read8()
-				skills[key] = value
-
-			# :desc: Called when the client receives its skill tree.
-			# :param skills: :class:`dict` the skills.
-			self.dispatch("skills", skills)
-
-		elif CCC == (16, 2):  # Tribe invitation received
-			author = packet.readUTF()
-			tribe = packet.readUTF()
-
-			# :desc: Called when the client receives an invitation to a tribe. (/inv)
-			# :param author: :class:`str` the player that invited you.
-			# :param tribe: :class:`str` the tribe.
-			self.dispatch("tribe_inv", author, tribe)
-
-		elif CCC == (26, 2):  # Logged in successfully
-			player_id = packet.read32()
-			self.username = username = packet.readUTF()
-			played_time = packet.read32()
-			community = Community(packet.read8())
-			pid = packet.read32()
-
-			# :desc: Called when the client successfully logged in.
-			# :param uid: :class:`int` the client's unique id.
-			# :param username: :class:`str` the client's username.
-			# :param played_time: :class:`int` the total number of minutes the client has played.
-			# :param community: :class:`aiotfm.enums.Community` the community the client has connected to.
-			# :param pid: :class:`int` the client's player id.
-			self.dispatch("logged", player_id, username, played_time, community, pid)
-
-		elif CCC == (26, 3):  # Handshake OK
-			online_players = packet.read32()
-			language = packet.readUTF()
-			country = packet.readUTF()
-			self.authkey = packet.read32()
-			self._logged = False
-
-			os_info = Packet.new(28, 17).writeString("en").writeString("Linux")
-			os_info.writeString("LNX 29,0,0,140").write8(0)
-
-			await connection.send(os_info)
-
-			# :desc: Called when the client can login through the game.
-			# :param online_players: :class:`int` the number of player connected to the game.
-			# :param language: :class:`str` the language the server is suggesting.
-			# :param country: :class:`str` the country detected from your ip.
-			self.dispatch("login_ready", online_players, language, country)
-
-		elif CCC == (26, 12):  # Login result
-			self._logged = False
-			# :desc: Called when the client failed logging.
-			# :param code: :class:`int` the error code.
-			# :param error1: :class:`str` error messages.
-			# :param error2: :class:`str` error messages.
-			self.dispatch("login_result", packet.read8(), packet.readUTF(), packet.readUTF())
-
-		elif CCC == (26, 25):  # Ping
-			# :desc: Called when the client receives the ping response from the server.
-			self.dispatch("ping")
-
-		elif CCC == (26, 35):  # Room list
-			roomlist = RoomList.from_packet(packet)
-			# :desc: Dispatched when the client receives the room list
-			self.dispatch("room_list", roomlist)
-
-		elif CCC == (28, 6):  # Server ping
-			await connection.send(Packet.new(28, 6).write8(packet.read8()))
-
-		elif CCC == (29, 6):  # Lua logs
-			# :desc: Called when the client receives lua logs from #Lua.
-			# :param log: :class:`str` a log message.
-			self.dispatch("lua_log", packet.readUTF())
-
-		elif CCC == (31, 1):  # Inventory data
-			self.inventory = Inventory.from_packet(packet)
-			self.inventory.client = self
-
-			# :desc: Called when the client receives its inventory's content.
-			# :param inventory: :class:`aiotfm.inventory.Inventory` the client's inventory.
-			self.dispatch("inventory_update", self.inventory)
-
-		elif CCC == (31, 2):  # Update inventory item
-			item_id = packet.read16()
-			quantity = packet.read8()
-
-			if item_id in self.inventory.items:
-				item = self.inventory.items[item_id]
-				previous = item.quantity
-				item.quantity = quantity
-
-				# :desc: Called when the quantity of an item has been updated.
-				# :param item: :class:`aiotfm.inventory.InventoryItem` the new item.
-				# :param previous: :class:`int` the previous quantity.
-				self.dispatch("item_update", item, previous)
+		# :desc: Called when the client receives its inventory's content.
+		# :param inventory: :class:`aiotfm.inventory.Inventory` the client's inventory.
+		self.dispatch("inventory_update", self.inventory)
 
-			else:
-				item = InventoryItem(item_id=item_id, quantity=quantity)
-				self.inventory.items[item.id] = item
+	@packet_handler(31, 2)  # Update inventory item
+	def _handle_inventory_item(self, connection: Connection, packet: Packet):
+		item_id = packet.read16()
+		quantity = packet.read8()
 
-				# :desc: Called when the client receives a new item in its inventory.
-				# :param item: :class:`aiotfm.inventory.InventoryItem` the new item.
-				self.dispatch("new_item", item)
+		if item_id in self.inventory.items:
+			item = self.inventory.items[item_id]
+			previous = item.quantity
+			item.quantity = quantity
 
-		elif CCC == (31, 5):  # Trade invite
-			pid = packet.read32()
+			# :desc: Called when the quantity of an item has been updated.
+			# :param item: :class:`aiotfm.inventory.InventoryItem` the new item.
+			# :param previous: :class:`int` the previous quantity.
+			self.dispatch("item_update", item, previous)
 
-			self.trades[pid] = Trade(self, self.room.get_player(pid=pid))
+		else:
+			item = InventoryItem(item_id=item_id, quantity=quantity)
+			self.inventory.items[item.id] = item
 
-			# :desc: Called when received an invitation to trade.
-			# :param trade: :class:`aiotfm.inventory.Trade` the trade object.
-			self.dispatch("trade_invite", self.trades[pid])
+			# :desc: Called when the client receives a new item in its inventory.
+			# :param item: :class:`aiotfm.inventory.InventoryItem` the new item.
+			self.dispatch("new_item", item)
 
-		elif CCC == (31, 6):  # Trade error
-			name = packet.readUTF().lower()
-			error = packet.read8()
+	@packet_handler(31, 5)  # Trade invite
+	def _handle_trade_invite(self, connection: Connection, packet: Packet):
+		pid = packet.read32()
 
-			if name == self.username.lower():
-				trade = self.trade
-			else:
-				for t in self.trades.values():
-					if t.trader.lower() == name:
-						trade = t
-						break
+		self.trades[pid] = Trade(self, self.room.get_player(pid=pid))
 
-			# :desc: Called when an error occurred with a trade.
-			# :param trade: :class:`aiotfm.inventory.Trade` the trade that failed.
-			# :param error: :class:`aiotfm.enums.TradeError` the error.
-			self.dispatch("trade_error", trade, TradeError(error))
-			trade._close()
-
-		elif CCC == (31, 7):  # Trade start
-			pid = packet.read32()
-			trade = self.trades.get(pid)
-
-			if trade is None:
-				raise AiotfmException(f"Cannot find the trade from pid {pid}.")
-
-			trade._start()
-			self.trade = trade
-
-			# :desc: Called when a trade starts. You can access the trade object with `Client.trade`.
-			self.dispatch("trade_start")
-
-		elif CCC == (31, 8):  # Trade items
-			export = packet.readBool()
-			id_ = packet.read16()
-			quantity = (1 if packet.readBool() else -1) * packet.read8()
-
-			items = self.trade.exports if export else self.trade.imports
-			items.add(id_, quantity)
-
-			trader = self if export else self.trade.trader
-			self.trade.locked = [False, False]
-
-			# :desc: Called when an item has been added/removed from the current trade.
-			# :param trader: :class:`aiotfm.Player` the player that triggered the event.
-			# :param id: :class:`int` the item's id.
-			# :param quantity: :class:`int` the quantity added/removed. Can be negative.
-			# :param item: :class:`aiotfm.inventory.InventoryItem` the item after the change.
-			self.dispatch("trade_item_change", trader, id_, quantity, items.get(id_))
-
-		elif CCC == (31, 9):  # Trade lock
-			index = packet.read8()
-			locked = packet.readBool()
-			if index > 1:
-				self.trade.locked = [locked, locked]
-				who = "both"
-			else:
-				self.trade.locked[index] = locked
-				who = self.trade.trader if index == 0 else self
+		# :desc: Called when received an invitation to trade.
+		# :param trade: :class:`aiotfm.inventory.Trade` the trade object.
+		self.dispatch("trade_invite", self.trades[pid])
 
-			# :desc: Called when the trade got (un)locked.
-			# :param who: :class:`aiotfm.Player` the player that triggered the event.
-			# :param locked: :class:`bool` either the trade got locked or unlocked.
-			self.dispatch("trade_lock", who, locked)
+	@packet_handler(31, 6)  # Trade error
+	def _handle_trade_error(self, connection: Connection, packet: Packet):
+		name = packet.readUTF().lower()
+		error = packet.read8()
 
-		elif CCC == (31, 10):  # Trade complete
+		if name == self.username.lower():
 			trade = self.trade
-			self.trade._close(succeed=True)
-
-		elif CCC == (44, 1):  # Bulle switching
-			timestamp = packet.read32()
-			uid = packet.read32()
-			pid = packet.read32()
-			bulle_ip = packet.readUTF()
-			ports = packet.readUTF().split("-")
-
-			if self.bulle is not None:
-				self.bulle.close()
+		else:
+			for t in self.trades.values():
+				if t.trader.lower() == name:
+					trade = t
+					break
+
+		# :desc: Called when an error occurred with a trade.
+		# :param trade: :class:`aiotfm.inventory.Trade` the trade that failed.
+		# :param error: :class:`aiotfm.enums.TradeError` the error.
+		self.dispatch("trade_error", trade, TradeError(error))
+		trade._close()
+
+	@packet_handler(31, 7)  # Trade start
+	def _handle_trade_start(self, connection: Connection, packet: Packet):
+		pid = packet.read32()
+		trade = self.trades.get(pid)
+
+		if trade is None:
+			raise AiotfmException(f"Cannot find the trade from pid {pid}.")
+
+		trade._start()
+		self.trade = trade
+
+		# :desc: Called when a trade starts. You can access the trade object with `Client.trade`.
+		self.dispatch("trade_start")
+
+	@packet_handler(31, 8)  # Trade items
+	def _handle_trade_items(self, connection: Connection, packet: Packet):
+		export = packet.readBool()
+		id_ = packet.read16()
+		quantity = (1 if packet.readBool() else -1) * packet.read8()
+
+		items = self.trade.exports if export else self.trade.imports
+		items.add(id_, quantity)
+
+		trader = self if export else self.trade.trader
+		self.trade.locked = [False, False]
+
+		# :desc: Called when an item has been added/removed from the current trade.
+		# :param trader: :class:`aiotfm.Player` the player that triggered the event.
+		# :param id: :class:`int` the item's id.
+		# :param quantity: :class:`int` the quantity added/removed. Can be negative.
+		# :param item: :class:`aiotfm.inventory.InventoryItem` the item after the change.
+		self.dispatch("trade_item_change", trader, id_, quantity, items.get(id_))
+
+	@packet_handler(31, 9)  # Trade lock
+	def _handle_trade_lock(self, connection: Connection, packet: Packet):
+		index = packet.read8()
+		locked = packet.readBool()
+		if index > 1:
+			self.trade.locked = [locked, locked]
+			who = "both"
+		else:
+			self.trade.locked[index] = locked
+			who = self.trade.trader if index == 0 else self
+
+		# :desc: Called when the trade got (un)locked.
+		# :param who: :class:`aiotfm.Player` the player that triggered the event.
+		# :param locked: :class:`bool` either the trade got locked or unlocked.
+		self.dispatch("trade_lock", who, locked)
+
+	@packet_handler(31, 10)  # Trade complete
+	def _handle_trade_complete(self, connection: Connection, packet: Packet):
+		self.trade._close(succeed=True)
+
+	@packet_handler(44, 1)  # Bulle switching
+	def _handle_bulle_switch(self, connection: Connection, packet: Packet):
+		timestamp = packet.read32()
+		uid = packet.read32()
+		pid = packet.read32()
+		bulle_ip = packet.readUTF()
+		ports = packet.readUTF().split("-")
+
+		self._cancel_bulle_task()
+		previous = self.bulle
+
+		# The room-bound packets sent while connecting wait in the new bulle's queue.
+		self.bulle = Connection("bulle", self, self.loop, **self._connection_options)
+		self.bulle.hold()
+		handshake = Packet.new(44, 1).write32(timestamp).write32(uid).write32(pid)
+		# Do not hold the main connection's consumer while connecting to the bulle.
+		# The task is kept so that it isn't garbage collected while connecting.
+		self._bulle_task = self.loop.create_task(
+			self._switch_bulle(previous, self.bulle, bulle_ip, int(random.choice(ports)), handshake)
+		)
 
-			self.bulle = Connection("bulle", self, self.loop)
-			await self.bulle.connect(bulle_ip, int(random.choice(ports)))
-			await self.bulle.send(Packet.new(44, 1).write32(timestamp).write32(uid).write32(pid))
+	@packet_handler(44, 22)  # Fingerprint offset changed
+	def _handle_fingerprint_offset(self, connection: Connection, packet: Packet):
+		connection.fingerprint = packet.read8()
 
-		elif CCC == (44, 22):  # Fingerprint offset changed
-			connection.fingerprint = packet.read8()
+	@packet_handler(60, 3)  # Community platform
+	def _handle_community_platform(self, connection: Connection, packet: Packet):
+		TC = packet.read16()
 
-		elif CCC == (60, 3):  # Community platform
-			TC = packet.read16()
+		# :desc: Called when the client receives a packet from the community platform.
+		# :param TC: :class:`int` the packet's code.
+		# :param packet: :class:`aiotfm.Packet` the packet.
+		if self._cp_requests and len(packet.buffer) >= packet.pos + 4:
+			self._resolve_cp_request(TC, packet)
 
-			# :desc: Called when the client receives a packet from the community platform.
-			# :param TC: :class:`int` the packet's code.
-			# :param packet: :class:`aiotfm.Packet` the packet.
+		if self._has_listener("raw_cp"):
 			self.dispatch("raw_cp", TC, packet.copy(copy_pos=True))
 
-			if TC == 3:  # Connected to the community platform
-				await self.sendCP(28)  # Request friend list
-
-				# :desc: Called when the client is successfully connected to the community platform.
-				self.dispatch("ready")
-
-			elif TC == 32:  # Friend connected
-				if self.friends is None:
-					return True
-
-				friend = self.friends.get_friend(packet.readUTF())
-				friend.isConnected = True
-
-				# :desc: Called when a friend connects to the game (not entirely fetched)
-				# :param friend: :class:`aiotfm.friend.Friend` friend after this update
-				self.dispatch("friend_connected", friend)
-
-			elif TC == 33:  # Friend disconnected
-				if self.friends is None:
-					return True
-
-				friend = self.friends.get_friend(packet.readUTF())
-				friend.isConnected = False
-
-				# :desc: Called when a friend disconnects from the game (not entirely fetched)
-				# :param friend: :class:`aiotfm.friend.Friend` friend after this update
-				self.dispatch("friend_disconnected", friend)
-
-			elif TC == 34:  # Friend list loaded
-				self.friends = FriendList(self, packet)
-
-				# :desc: Called when the friend list is loaded.
-				# :param friends: :class:`aiotfm.friend.FriendList` the friend list
-				self.dispatch("friends_loaded", self.friends)
-
-			elif TC == 35 or TC == 36:  # Friend update / addition
-				if self.friends is None:
-					return True
-
-				new = Friend(self.friends, packet)
-				old = self.friends.get_friend(new.name)
-
-				if old is not None:
-					if old.isSoulmate:  # Not sent by the server, checked locally.
-						self.friends.soulmate = new
-						new.isSoulmate = True
-
-					self.friends.friends.remove(old)
-				self.friends.friends.append(new)
-
-				if old is None:
-					# :desc: Called when a friend is added
-					# :param friend: :class:`aiotfm.friend.Friend` the friend
-					self.dispatch("new_friend", new)
-
-				else:
-					# :desc: Called when a friend is updated
-					# :param before: :class:`aiotfm.friend.Friend` friend before this update
-					# :param after: :class:`aiotfm.friend.Friend` friend after this update
-					self.dispatch("friend_update", old, new)
-
-			elif TC == 37:  # Remove friend
-				if self.friends is None:
-					return True
-
-				friend = self.friends.get_friend(packet.read32())
-				if friend is not None:
-					if friend == self.friends.soulmate:
-						self.friends.soulmate = None
-
-					self.friends.friends.remove(friend)
-
-					# :desc: Called when a friend is removed
-					# :param friend: :class:`aiotfm.friend.Friend` the friend
-					self.dispatch("friend_remove", friend)
-
-			elif TC == 55:  # Channel join result
-				sequenceId = packet.read32()
-				result = packet.read8()
-
-				# :desc: Called when the client receives the result of joining a channel.
-				# :param sequenceId: :class:`int` identifier returned by :meth:`Client.sendCP`.
-				# :param result: :class:`int` result code.
-				self.dispatch("channel_joined_result", sequenceId, result)
-
-			elif TC == 57:  # Channel leave result
-				sequenceId = packet.read32()
-				result = packet.read8()
-
-				# :desc: Called when the client receives the result of leaving a channel.
-				# :param sequenceId: :class:`int` identifier returned by :meth:`Client.sendCP`.
-				# :param result: :class:`int` result code.
-				self.dispatch("channel_left_result", sequenceId, result)
-
-			elif TC == 59:  # Channel /who result
-				idSequence = packet.read32()
-				result = packet.read8()
-				players = [Player(packet.readUTF()) for _ in range(packet.read16())]
-
-				# :desc: Called when the client receives the result of the /who command in a channel.
-				# :param idSequence: :class:`int` the reference to the packet that performed the request.
-				# :param players: List[:class:`aiotfm.Player`] the list of players inside the channel.
-				self.dispatch("channel_who", idSequence, players)
-
-			elif TC == 62:  # Joined a channel
-				name = packet.readUTF()
-
-				if name in self._channels:
-					channel = [c for c in self._channels if c == name][0]
-				else:
-					channel = Channel(name, self)
-					self._channels.append(channel)
+		handler = self._cp_handlers.get(TC)
+		if handler is None:
+			if self.LOG_UNHANDLED_PACKETS:
+				print((60, 3), TC, bytes(packet.buffer)[4:])
+			return False
 
-				# :desc: Called when the client joined a channel.
-				# :param channel: :class:`aiotfm.message.Channel` the channel.
-				self.dispatch("channel_joined", channel)
+		return handler(self, connection, packet)
+
+	def _resolve_cp_request(self, TC: int, packet: Packet):
+		"""Resolves the :meth:`Client.request_cp` request the packet is the response of, if any."""
+		sid = packet.read32()
+		packet.pos -= 4
+
+		request = self._cp_requests.get(sid)
+		if request is not None and request[0] == TC and not request[1].done():
+			response = packet.copy(copy_pos=True)
+			response.pos += 4
+			request[1].set_result(response)
+
+	@packet_handler(144, 1)  # Set player list
+	def _handle_player_list(self, connection: Connection, packet: Packet):
+		before = self.room.players
+		self.room.players = {}
+
+		for _ in range(packet.read16()):
+			player = Player.from_packet(packet)
+			self.room.players[player.pid] = player
+
+		# :desc: Called when the client receives an update of all player in the room.
+		# :param before: Dict[:class:`aiotfm.Player`] the list of player before the update.
+		# :param players: Dict[:class:`aiotfm.Player`] the list of player updated.
+		self.dispatch("bulk_player_update", before, self.room.players)
+
+	@packet_handler(144, 2)  # Add a player
+	def _handle_add_player(self, connection: Connection, packet: Packet):
+		after = Player.from_packet(packet)
+		before = self.room.players.pop(after.pid, None)
+
+		self.room.players[after.pid] = after
+		if before is None:
+			# :desc: Called when a player joined the room.
+			# :param player: :class:`aiotfm.Player` the player.
+			self.dispatch("player_join", after)
+		else:
+			# :desc: Called when a player's data on the room has been updated.
+			# :param before: :class:`aiotfm.Player` the player before the update.
+			# :param player: :class:`aiotfm.Player` the player updated.
+			self.dispatch("player_update", before, after)
 
-			elif TC == 63:  # Quit a channel
-				name = packet.readUTF()
-				if name in self._channels:
-					self._channels.remove(name)
+	@cp_handler(3)  # Connected to the community platform
+	def _handle_cp_connected(self, connection: Connection, packet: Packet):
+		connection.schedule(self.sendCP(28))  # Request friend list
 
-				# :desc: Called when the client leaves a channel.
-				# :param name: :class:`str` the channel's name.
-				self.dispatch("channel_closed", name)
+		# :desc: Called when the client is successfully connected to the community platform.
+		self.dispatch("ready")
 
-			elif TC == 64:  # Channel message
-				username, community = packet.readUTF(), packet.read32()
-				channel_name, message = packet.readUTF(), packet.readUTF()
-				channel = self.get_channel(channel_name)
-				author = self.room.get_player(username=username)
+	@cp_handler(32)  # Friend connected
+	def _handle_friend_connected(self, connection: Connection, packet: Packet):
+		if self.friends is None:
+			return
 
-				if author is None:
-					author = Player(username)
+		friend = self.friends.get_friend(packet.readUTF())
+		friend.isConnected = True
 
-				if channel is None:
-					channel = Channel(channel_name, self)
-					self._channels.append(channel)
+		# :desc: Called when a friend connects to the game (not entirely fetched)
+		# :param friend: :class:`aiotfm.friend.Friend` friend after this update
+		self.dispatch("friend_connected", friend)
 
-				channel_message = ChannelMessage(author, community, message, channel)
+	@cp_handler(33)  # Friend disconnected
+	def _handle_friend_disconnected(self, connection: Connection, packet: Packet):
+		if self.friends is None:
+			return
 
-				# :desc: Called when the client receives a message from a channel.
-				# :param message: :class:`aiotfm.message.ChannelMessage` the message.
-				self.dispatch("channel_message", channel_message)
+		friend = self.friends.get_friend(packet.readUTF())
+		friend.isConnected = False
 
-			elif TC == 65:  # Tribe message
-				author, message = packet.readUTF(), packet.readUTF()
+		# :desc: Called when a friend disconnects from the game (not entirely fetched)
+		# :param friend: :class:`aiotfm.friend.Friend` friend after this update
+		self.dispatch("friend_disconnected", friend)
 
-				# :desc: Called when the client receives a message from the tribe.
-				# :param author: :class:`str` the message's author.
-				# :param message: :class:`str` the message's content.
-				self.dispatch("tribe_message", author, message)
+	@cp_handler(34)  # Friend list loaded
+	def _handle_friend_list(self, connection: Connection, packet: Packet):
+		self.friends = FriendList(self, packet)
 
-			elif TC == 66:  # Whisper
-				author = Player(packet.readUTF())
-				commu = packet.read32()
-				receiver = Player(packet.readUTF())
-				message = packet.readUTF()
+		# :desc: Called when the friend list is loaded.
+		# :param friends: :class:`aiotfm.friend.FriendList` the friend list
+		self.dispatch("friends_loaded", self.friends)
 
-				author = self.room.get_player(name=author, default=author)
-				receiver = self.room.get_player(name=receiver, default=receiver)
+	@cp_handler(35)  # Friend update / addition
+	@cp_handler(36)
+	def _handle_friend_update(self, connection: Connection, packet: Packet):
+		if self.friends is None:
+			return
 
-				# :desc: Called when the client receives a whisper.
-				# :param message: :class:`aiotfm.message.Whisper` the message.
-				self.dispatch("whisper", Whisper(author, commu, receiver, message, self))
+		new = Friend(self.friends, packet)
+		old = self.friends.get_friend(new.name)
 
-			elif TC == 88:  # tribe member connected
-				# :desc: Called when a tribe member connected.
-				# :param name: :class:`str` the member's name.
-				self.dispatch("member_connected", packet.readUTF())
+		if old is not None:
+			if old.isSoulmate:  # Not sent by the server, checked locally.
+				self.friends.soulmate = new
+				new.isSoulmate = True
 
-			elif TC == 90:  # tribe member disconnected
-				# :desc: Called when a tribe member disconnected.
-				# :param name: :class:`str` the member's name.
-				self.dispatch("member_disconnected", packet.readUTF())
+			self.friends.friends.remove(old)
+		self.friends.friends.append(new)
 
-			else:
-				if self.LOG_UNHANDLED_PACKETS:
-					print(CCC, TC, bytes(packet.buffer)[4:])
-				return False
-
-		elif CCC == (144, 1):  # Set player list
-			before = self.room.players
-			self.room.players = {}
-
-			for _ in range(packet.read16()):
-				player = Player.from_packet(packet)
-				self.room.players[player.pid] = player
-
-			# :desc: Called when the client receives an update of all player in the room.
-			# :param before: Dict[:class:`aiotfm.Player`] the list of player before the update.
-			# :param players: Dict[:class:`aiotfm.Player`] the list of player updated.
-			self.dispatch("bulk_player_update", before, self.room.players)
-
-		elif CCC == (144, 2):  # Add a player
-			after = Player.from_packet(packet)
-			before = self.room.players.pop(after.pid, None)
-
-			self.room.players[after.pid] = after
-			if before is None:
-				# :desc: Called when a player joined the room.
-				# :param player: :class:`aiotfm.Player` the player.
-				self.dispatch("player_join", after)
-			else:
-				# :desc: Called when a player's data on the room has been updated.
-				# :param before: :class:`aiotfm.Player` the player before the update.
-				# :param player: :class:`aiotfm.Player` the player updated.
-				self.dispatch("player_update", before, after)
+		if old is None:
+			# :desc: Called when a friend is added
+			# :param friend: :class:`aiotfm.friend.Friend` the friend
+			self.dispatch("new_friend", new)
 
 		else:
-			if self.LOG_UNHANDLED_PACKETS:
-				print(CCC, bytes(packet.buffer)[2:])
-			return False
+			# :desc: Called when a friend is updated
+			# :param before: :class:`aiotfm.friend.Friend` friend before this update
+			# :param after: :class:`aiotfm.friend.Friend` friend after this update
+			self.dispatch("friend_update", old, new)
+
+	@cp_handler(37)  # Remove friend
+	def _handle_friend_remove(self, connection: Connection, packet: Packet):
+		if self.friends is None:
+			return
 
-		return True
+		friend = self.friends.get_friend(packet.read32())
+		if friend is not None:
+			if friend == self.friends.soulmate:
+				self.friends.soulmate = None
+
+			self.friends.friends.remove(friend)
+
+			# :desc: Called when a friend is removed
+			# :param friend: :class:`aiotfm.friend.Friend` the friend
+			self.dispatch("friend_remove", friend)
+
+	@cp_handler(55)  # Channel join result
+	def _handle_channel_join_result(self, connection: Connection, packet: Packet):
+		sequenceId = packet.read32()
+		result = packet.read8()
+
+		# :desc: Called when the client receives the result of joining a channel.
+		# :param sequenceId: :class:`int` identifier returned by :meth:`Client.sendCP`.
+		# :param result: :class:`int` result code.
+		self.dispatch("channel_joined_result", sequenceId, result)
+
+	@cp_handler(57)  # Channel leave result
+	def _handle_channel_leave_result(self, connection: Connection, packet: Packet):
+		sequenceId = packet.read32()
+		result = packet.read8()
+
+		# :desc: Called when the client receives the result of leaving a channel.
+		# :param sequenceId: :class:`int` identifier returned by :meth:`Client.sendCP`.
+		# :param result: :class:`int` result code.
+		self.dispatch("channel_left_result", sequenceId, result)
+
+	@cp_handler(59)  # Channel /who result
+	def _handle_channel_who(self, connection: Connection, packet: Packet):
+		idSequence = packet.read32()
+		packet.read8()  # result
+		players = [Player(packet.readUTF()) for _ in range(packet.read16())]
+
+		# :desc: Called when the client receives the result of the /who command in a channel.
+		# :param idSequence: :class:`int` the reference to the packet that performed the request.
+		# :param players: List[:class:`aiotfm.Player`] the list of players inside the channel.
+		self.dispatch("channel_who", idSequence, players)
+
+	@cp_handler(62)  # Joined a channel
+	def _handle_channel_joined(self, connection: Connection, packet: Packet):
+		name = packet.readUTF()
+
+		if name in self._channels:
+			channel = [c for c in self._channels if c == name][0]
+		else:
+			channel = Channel(name, self)
+			self._channels.append(channel)
+
+		# :desc: Called when the client joined a channel.
+		# :param channel: :class:`aiotfm.message.Channel` the channel.
+		self.dispatch("channel_joined", channel)
+
+	@cp_handler(63)  # Quit a channel
+	def _handle_channel_closed(self, connection: Connection, packet: Packet):
+		name = packet.readUTF()
+		if name in self._channels:
+			self._channels.remove(name)
+
+		# :desc: Called when the client leaves a channel.
+		# :param name: :class:`str` the channel's name.
+		self.dispatch("channel_closed", name)
+
+	@cp_handler(64)  # Channel message
+	def _handle_channel_message(self, connection: Connection, packet: Packet):
+		username, community = packet.readUTF(), packet.read32()
+		channel_name, message = packet.readUTF(), packet.readUTF()
+		channel = self.get_channel(channel_name)
+		author = self.room.get_player(username=username)
+
+		if author is None:
+			author = Player(username)
+
+		if channel is None:
+			channel = Channel(channel_name, self)
+			self._channels.append(channel)
+
+		channel_message = ChannelMessage(author, community, message, channel)
+
+		# :desc: Called when the client receives a message from a channel.
+		# :param message: :class:`aiotfm.message.ChannelMessage` the message.
+		self.dispatch("channel_message", channel_message)
+
+	@cp_handler(65)  # Tribe message
+	def _handle_tribe_message(self, connection: Connection, packet: Packet):
+		author, message = packet.readUTF(), packet.readUTF()
+
+		# :desc: Called when the client receives a message from the tribe.
+		# :param author: :class:`str` the message's author.
+		# :param message: :class:`str` the message's content.
+		self.dispatch("tribe_message", author, message)
+
+	@cp_handler(66)  # Whisper
+	def _handle_whisper(self, connection: Connection, packet: Packet):
+		author = Player(packet.readUTF())
+		commu = packet.read32()
+		receiver = Player(packet.readUTF())
+		message = packet.readUTF()
+
+		author = self.room.get_player(name=author, default=author)
+		receiver = self.room.get_player(name=receiver, default=receiver)
+
+		# :desc: Called when the client receives a whisper.
+		# :param message: :class:`aiotfm.message.Whisper` the message.
+		self.dispatch("whisper", Whisper(author, commu, receiver, message, self))
+
+	@cp_handler(88)  # tribe member connected
+	def _handle_member_connected(self, connection: Connection, packet: Packet):
+		# :desc: Called when a tribe member connected.
+		# :param name: :class:`str` the member's name.
+		self.dispatch("member_connected", packet.readUTF())
+
+	@cp_handler(90)  # tribe member disconnected
+	def _handle_member_disconnected(self, connection: Connection, packet: Packet):
+		# :desc: Called when a tribe member disconnected.
+		# :param name: :class:`str` the member's name.
+		self.dispatch("member_disconnected", packet.readUTF())
 
 	async def handle_old_packet(self, connection: Connection, oldCCC: tuple, data: list) -> bool:
 		"""|coro|
@@ -698,6 +976,10 @@ class Client:
 		:param data: :class:`list` the packet data.
 		:return: True if the packet got handled, False otherwise.
 		"""
+		return self._handle_old_packet(connection, oldCCC, data)
+
+	def _handle_old_packet(self, connection: Connection, oldCCC: tuple, data: list) -> bool:
+		"""Handles the known packets from the old protocol synchronously."""
 		if oldCCC == (8, 5):  # Player died
 			player = self.room.get_player(pid=data[0])
 			if player is not None:
@@ -722,6 +1004,44 @@ class Client:
 
 		return True
 
+	async def _switch_bulle(
+		self, previous: Optional[Connection], bulle: Connection, host: str, port: int, handshake: Packet
+	):
+		"""|coro|
+		Connects to a bulle, sends the handshake packet then the packets queued meanwhile.
+		The previous bulle is closed once it handled the packets it received.
+		"""
+		start = self.loop.time()
+		try:
+			try:
+				await bulle.connect(host, port)
+				bulle.send_control(handshake)
+			except Exception as e:
+				logger.error("Unable to connect to the bulle %s:%s.", host, port, exc_info=e)
+				bulle.close()
+				return
+
+			bulle.release()
+			self.bulle_switch_latency = self.loop.time() - start
+			logger.debug("Switched to the bulle %s:%s in %.3fs.", host, port, self.bulle_switch_latency)
+			# :desc: Called when the client is connected to a new bulle.
+			# :param connection: :class:`aiotfm.connection.Connection` the new bulle.
+			# :param latency: :class:`float` how long the switch took, in seconds.
+			self.dispatch("bulle_switch", bulle, self.bulle_switch_latency)
+
+			if previous is not None and not await previous.drain(self.BULLE_DRAIN_TIMEOUT):
+				logger.warning("The previous bulle still had packets to handle after %ss.", self.BULLE_DRAIN_TIMEOUT)
+		finally:
+			if previous is not None:
+				previous.close()
+
+	def _cancel_bulle_task(self):
+		"""Cancels the connection to a bulle that is still in progress, if any."""
+		if self._bulle_task is not None:
+			if not self._bulle_task.done():
+				self._bulle_task.cancel()
+			self._bulle_task = None
+
 	def get_channel(self, name: str) -> Optional[Channel]:
 		"""Returns a channel from it's name or None if not found.
 		:param name: :class:`str` the name of the channel.
@@ -771,9 +1091,13 @@ class Client:
 		condition: Optional[Callable] = None,
 		timeout: Optional[float] = None,
 		stopPropagation: bool = False,
+		key: Optional[Any] = None,
 	) -> asyncio.Future:
 		"""Wait for an event.
 
+		Some events can be waited for by key, so the waiter is only woken by the matching events,
+		see :attr:`Client.WAITER_KEYS`. A list of keys can be given to wait for any of them.
+
 		Example: ::
 			@client.event
 			async def on_room_message(author, message):
@@ -787,6 +1111,7 @@ class Client:
 			The arguments must meet the parameters of the event being waited for.
 		:param timeout: Optionnal[:class:`float`] the number of seconds before
 			throwing asyncio.TimeoutError
+		:param key: Optionnal[`Any`] the key of the event to wait for, or a list of keys.
 		:return: [`asyncio.Future`](https://docs.python.org/3/library/asyncio-future.html#asyncio.Future)
 			a future that you must await.
 		"""
@@ -800,13 +1125,40 @@ class Client:
 
 			condition = everything
 
-		if event not in self._waiters:
-			self._waiters[event] = []
+		if key is None:
+			waiters = [self._waiters.setdefault(event, [])]
+		elif event in self.WAITER_KEYS:
+			keyed = self._keyed_waiters.setdefault(event, {})
+			waiters = [keyed.setdefault(k, []) for k in (key if isinstance(key, list) else [key])]
+		else:
+			raise InvalidEvent(f"The event {event!r} can not be waited for by key.")
 
-		self._waiters[event].append((condition, future, stopPropagation))
+		waiter = (condition, future, stopPropagation)
+		for w in waiters:
+			w.append(waiter)
 
+		# Remove the waiter as soon as it's done, including when it times out.
+		future.add_done_callback(lambda _: self._remove_waiter(event, key, waiter))
 		return asyncio.wait_for(future, timeout)
 
+	def _remove_waiter(self, event: str, key: Optional[Any], waiter: tuple):
+		"""Removes a waiter added by :meth:`Client.wait_for`."""
+		if key is None:
+			containers = [(self._waiters, event)]
+		else:
+			keyed = self._keyed_waiters.get(event, {})
+			containers = [(keyed, k) for k in (key if isinstance(key, list) else [key])]
+
+		for container, k in containers:
+			waiters = container.get(k)
+			if waiters is not None and waiter in waiters:
+				waiters.remove(waiter)
+				if not waiters:
+					del container[k]
+
+		if key is not None and not self._keyed_waiters.get(event, True):
+			del self._keyed_waiters[event]
+
 	async def _run_event(self, coro: Callable, event_name: str, *args, **kwargs):
 		"""|coro|
 		Runs an event and handle the error if any.
@@ -837,6 +1189,15 @@ class Client:
 
 		return False
 
+	def _has_listener(self, event: str) -> bool:
+		"""Whether an event has a handler or someone waiting for it.
+		Used to avoid decoding packets that nobody listens to.
+
+		:param event: :class:`str` event's name. (without 'on_')
+		"""
+		method = "on_" + event
+		return method in self._waiters or method in self._keyed_waiters or hasattr(self, method)
+
 	def dispatch(self, event: str, *args, **kwargs):
 		"""Dispatches events
 
@@ -849,37 +1210,41 @@ class Client:
 		"""
 		method = "on_" + event
 
-		if method in self._waiters:
-			to_remove = []
-			waiters = self._waiters[method]
-			for i, (cond, fut, stop) in enumerate(waiters):
-				if fut.cancelled():
-					to_remove.append(i)
-					continue
+		if method in self._keyed_waiters:
+			waiters = self._keyed_waiters[method].get(self.WAITER_KEYS[method](*args))
+			if waiters is not None and self._wake_waiters(waiters, args):
+				return None
 
-				try:
-					result = bool(cond(*args))
-				except Exception as e:
-					fut.set_exception(e)
-				else:
-					if result:
-						fut.set_result(args[0] if len(args) == 1 else args if len(args) > 0 else None)
-						if stop:
-							del waiters[i]
-							return None
-						to_remove.append(i)
-
-			if len(to_remove) == len(waiters):
-				del self._waiters[method]
-			else:
-				for i in to_remove[::-1]:
-					del waiters[i]
+		if method in self._waiters and self._wake_waiters(self._waiters[method], args):
+			return None
 
 		coro = getattr(self, method, None)
 		if coro is not None:
 			dispatch = self._run_event(coro, method, *args, **kwargs)
 			return asyncio.ensure_future(dispatch, loop=self.loop)
 
+	def _wake_waiters(self, waiters: list, args: tuple) -> bool:
+		"""Resolves the waiters whose condition is met by the event's arguments.
+		The resolved waiters are removed by their future's callback.
+
+		:return: :class:`bool` whether the event should stop propagating.
+		"""
+		for cond, fut, stop in waiters:
+			if fut.done():
+				continue
+
+			try:
+				result = bool(cond(*args))
+			except Exception as e:
+				fut.set_exception(e)
+			else:
+				if result:
+					fut.set_result(args[0] if len(args) == 1 else args if len(args) > 0 else None)
+					if stop:
+						return True
+
+		return False
+
 	async def on_error(self, event: str, err: Exception, *a, **kw):
 		"""Default on_error event handler. Prints the traceback of the error."""
 		logger.error('An error occurred while dispatching the event "%s":', event, exc_info=-3)
@@ -904,18 +1269,14 @@ class Client:
 		if self._close_event is None:
 			raise AiotfmException(f"{self._connect.__name__} should not be called directly. Use start() instead.")
 
-		for port in random.sample(self.keys.server_ports, 4):
-			try:
-				await self.main.connect(self.keys.server_ip, port)
-			except Exception:
-				logger.debug("Unable to connect to the server %s:%s.", self.keys.server_ip, port)
-			else:
-				break
-		else:
-			raise ServerUnreachable("Unable to connect to the server.")
+		try:
+			# Race the ports, a dead one must not delay the connection.
+			await self.main.connect_any(self.keys.server_ip, random.sample(self.keys.server_ports, 4))
+		except Exception as e:
+			logger.debug("Unable to connect to the server %s.", self.keys.server_ip, exc_info=e)
+			raise ServerUnreachable("Unable to connect to the server.") from e
 
-		while not self.main.open:
-			await asyncio.sleep(0)
+		await self.main.wait_ready()
 
 	async def sendHandshake(self):
 		"""|coro|
@@ -970,14 +1331,14 @@ class Client:
 
 		retries = 0
 		on_started = None
-		keep_alive = Packet.new(26, 26)
 		while True:
 			self._close_event = asyncio.Future()
 			try:
 				logger.info("Connecting to the game.")
+				# The translations are downloaded while connecting, they don't delay the login.
+				self._load_locale()
 				await self._connect()
 				await self.sendHandshake()
-				await self.locale.load()
 				retries = 0  # Connection successful
 				self._restarting = False
 			except Exception as e:
@@ -997,9 +1358,10 @@ class Client:
 					on_started.set_result(None)
 
 			while not self._close_event.done():
-				# Keep the connection(s) alive
-				await asyncio.gather(*[c.send(keep_alive) for c in (self.main, self.bulle) if c])
-				await asyncio.wait((self._close_event,), timeout=15)
+				# Keep the connection(s) alive, unless a pool does it.
+				if self.keep_alive:
+					self.send_keep_alive()
+				await asyncio.wait((self._close_event,), timeout=self.KEEP_ALIVE_INTERVAL if self.keep_alive else None)
 
 			reason, delay, on_started = self._close_event.result()
 			self._close_event = asyncio.Future()
@@ -1008,6 +1370,7 @@ class Client:
 			logger.debug("Will restart: %s", reason != "stop" and self.auto_restart)
 
 			# clean up
+			self._cancel_bulle_task()
 			for conn in (self.main, self.bulle):
 				if conn is not None:
 					conn.close()
@@ -1018,7 +1381,7 @@ class Client:
 			await asyncio.sleep(delay)
 
 			# If we don't recreate the connection, we won't be able to connect.
-			self.main = Connection("main", self, self.loop)
+			self.main = Connection("main", self, self.loop, **self._connection_options)
 			self.bulle = None
 
 			# Fetch some fresh keys
@@ -1035,6 +1398,26 @@ class Client:
 				else:
 					raise MaintenanceError("The game is under heavy maintenance.")
 
+	def _load_locale(self):
+		"""Starts loading the locale in the background, unless it is already loaded or loading."""
+		if self._locale_task is None or (self._locale_task.done() and self.locale.locale not in self.locale.locales):
+			self._locale_task = self.loop.create_task(self._run_locale_load())
+
+	async def _run_locale_load(self):
+		"""|coro|
+		Loads the locale. Until it is loaded, the translations fall back to their keys.
+		"""
+		try:
+			await self.locale.load()
+		except Exception as e:
+			logger.warning("Unable to load the locale %s, messages stay untranslated.", self.locale.locale, exc_info=e)
+
+	def send_keep_alive(self):
+		"""Keeps the connection(s) alive."""
+		for conn in (self.main, self.bulle):
+			if conn:
+				conn.send_control(KEEP_ALIVE)
+
 	async def restart_soon(self, delay: float = 5.0, **kwargs):
 		"""|coro|
 		Restarts the client in several seconds.
@@ -1126,6 +1509,9 @@ class Client:
 			return
 
 		self._closed = True
+		self._cancel_bulle_task()
+		if self._locale_task is not None and not self._locale_task.done():
+			self._locale_task.cancel()
 		self._close_event.set_result(("stop", 0, None))
 
 	async def sendCP(self, code: int, data: Union[Packet, ByteString] = b"") -> int:
@@ -1138,11 +1524,56 @@ class Client:
 		"""
 		self._sequenceId = sid = (self._sequenceId + 1) % 0xFFFFFFFF
 
-		packet = Packet.new(60, 3).write16(code)
-		packet.write32(self._sequenceId).writeBytes(data)
+		await self._send_cp(code, sid, data)
+		return sid
+
+	async def _send_cp(self, code: int, sid: int, data: Union[Packet, ByteString]):
+		"""|coro|
+		Send a packet to the community platform with the given sequence id.
+		"""
+		packet = self.packet_pool.acquire(60, 3).write16(code)
+		packet.write32(sid).writeBytes(data)
+		if isinstance(data, Packet):
+			data.release()
 		await self.main.send(packet, cipher=True)
 
-		return sid
+	async def request_cp(
+		self,
+		code: int,
+		data: Union[Packet, ByteString] = b"",
+		response: Optional[int] = None,
+		timeout: Optional[float] = 5,
+	) -> Packet:
+		"""|coro|
+		Send a request to the community platform and wait for its response, which is matched
+		by sequence id. At most `max_cp_requests` requests wait for their response at once,
+		the other ones wait for a slot before being sent.
+
+		Example: ::
+			packet = await client.request_cp(18, Packet().writeString(name))  # Add a friend
+			result = packet.read8()
+
+		:param code: :class:`int` the community platform code.
+		:param data: :class:`aiotfm.Packet` or :class:`bytes` the data.
+		:param response: Optional[:class:`int`] the code of the response. Defaults to `code + 1`.
+		:param timeout: Optional[:class:`float`] the number of seconds before throwing asyncio.TimeoutError
+		:return: :class:`aiotfm.Packet` the response, positioned after its sequence id.
+		"""
+		if response is None:
+			response = code + 1
+
+		# Wait for a token first, so that a throttled request doesn't hold an in-flight slot.
+		await self.rate_limiter.acquire(TrafficClass.CP_REQUEST)
+		async with self._cp_semaphore:
+			self._sequenceId = sid = (self._sequenceId + 1) % 0xFFFFFFFF
+			future = self.loop.create_future()
+			self._cp_requests[sid] = (response, future)
+
+			try:
+				await self._send_cp(code, sid, data)
+				return await asyncio.wait_for(future, timeout)
+			finally:
+				del self._cp_requests[sid]
 
 	async def sendRoomMessage(self, message: str):
 		"""|coro|
@@ -1150,7 +1581,8 @@ class Client:
 
 		:param message: :class:`str` the content of the message.
 		"""
-		packet = Packet.new(6, 6).writeString(message)
+		await self.rate_limiter.acquire(TrafficClass.ROOM_MESSAGE)
+		packet = self.packet_pool.acquire(6, 6).writeString(message)
 
 		await self.bulle.send(packet, cipher=True)
 
@@ -1160,7 +1592,8 @@ class Client:
 
 		:param message: :class:`str` the content of the message.
 		"""
-		await self.sendCP(50, Packet().writeString(message))
+		await self.rate_limiter.acquire(TrafficClass.CHANNEL_MESSAGE)
+		await self.sendCP(50, self.packet_pool.acquire().writeString(message))
 
 	async def sendChannelMessage(self, channel: Union[Channel, str], message: str):
 		"""|coro|
@@ -1172,7 +1605,8 @@ class Client:
 		if isinstance(channel, Channel):
 			channel = channel.name
 
-		return await self.sendCP(48, Packet().writeString(channel).writeString(message))
+		await self.rate_limiter.acquire(TrafficClass.CHANNEL_MESSAGE)
+		return await self.sendCP(48, self.packet_pool.acquire().writeString(channel).writeString(message))
 
 	async def whisper(self, username: Union[Player, str], message: AnyStr, overflow: bool = False):
 		"""|coro|
@@ -1187,7 +1621,8 @@ class Client:
 			username = username.username
 
 		async def send(msg):
-			await self.sendCP(52, Packet().writeString(username).writeString(msg))
+			await self.rate_limiter.acquire(TrafficClass.WHISPER)
+			await self.sendCP(52, self.packet_pool.acquire().writeString(username).writeString(msg))
 
 		if isinstance(message, str):
 			message = message.encode()
@@ -1196,7 +1631,7 @@ class Client:
 		await send(message[:255])
 		for i in range(255, len(message), 255):
 			await asyncio.sleep(1)
-			await self.whisper(username, message[i : i + 255])
+			await send(message[i : i + 255])
 
 	async def getTribe(self, disconnected: bool = True) -> Optional[Tribe]:
 		"""|coro|
@@ -1210,11 +1645,11 @@ class Client:
 		def is_tribe(tc, packet):
 			return (tc == 109 and packet.read32() == sid) or tc == 130
 
-		tc, packet = await self.wait_for("on_raw_cp", is_tribe, timeout=5)
+		tc, packet = await self.wait_for("on_raw_cp", is_tribe, timeout=5, key=[109, 130])
 		if tc == 109:
 			result = packet.read8()
 			if result == 1:
-				tc, packet = await self.wait_for("on_raw_cp", lambda tc, p: tc == 130, timeout=5)
+				tc, packet = await self.wait_for("on_raw_cp", timeout=5, key=130)
 			elif result == 17:
 				return None
 			else:
@@ -1231,11 +1666,8 @@ class Client:
 		"""
 		await self.main.send(Packet.new(26, 35).write8(int(gamemode)))
 
-		def predicate(roomlist):
-			return gamemode == 0 or roomlist.gamemode == gamemode
-
 		try:
-			return await self.wait_for("on_room_list", predicate, timeout=timeout)
+			return await self.wait_for("on_room_list", timeout=timeout, key=gamemode or None)
 		except asyncio.TimeoutError:
 			return None
 
@@ -1250,7 +1682,7 @@ class Client:
 		if emote == 10:
 			packet.writeString(flag)
 
-		await self.bulle.send(packet)
+		await self.bulle.send(packet, priority=Priority.LOW)
 
 	async def sendSmiley(self, smiley: int):
 		"""|coro|
@@ -1263,7 +1695,7 @@ class Client:
 
 		packet = Packet.new(8, 5).write8(smiley)
 
-		await self.bulle.send(packet)
+		await self.bulle.send(packet, priority=Priority.LOW)
 
 	async def loadLua(self, lua_code: AnyStr):
 		"""|coro|
@@ -1274,6 +1706,7 @@ class Client:
 		if isinstance(lua_code, str):
 			lua_code = lua_code.encode()
 
+		await self.rate_limiter.acquire(TrafficClass.LUA)
 		await self.bulle.send(Packet.new(29, 1).write24(len(lua_code)).writeBytes(lua_code))
 
 	async def sendCommand(self, command: str):
@@ -1393,3 +1826,6 @@ class Client:
 		"""|coro|
 		Send a request to the server to get the bot's inventory."""
 		await self.main.send(Packet.new(31, 1))
+
+
+Client._register_handlers()
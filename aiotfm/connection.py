@@ -2,13 +2,17 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from asyncio import AbstractEventLoop, BaseTransport, Protocol, Transport
-from typing import TYPE_CHECKING
+import socket
+from asyncio import AbstractEventLoop, BaseTransport, BufferedProtocol, Protocol, Transport
+from collections import deque
+from typing import TYPE_CHECKING, ByteString, Coroutine, Iterable, Sequence
 
-from aiotfm.errors import AiotfmException
+from aiotfm.enums import Priority
+from aiotfm.errors import AiotfmException, InvalidSocketData, PacketError
+from aiotfm.packet import Packet, PrebuiltPacket
 
 if TYPE_CHECKING:
-	from aiotfm import Client, Packet
+	from aiotfm import Client
 
 logger = logging.getLogger("aiotfm")
 
@@ -18,35 +22,72 @@ class TFMProtocol(Protocol):
 		self.buffer: bytearray = bytearray()
 		self.client: Client = conn.client
 		self.connection: Connection = conn
-		self.length: int = 0
 
 	def data_received(self, data: bytes):
 		self.buffer.extend(data)
 
-		while len(self.buffer) > self.length:
-			if self.length == 0:
+		consumed = self.parse_frames(self.buffer, len(self.buffer))
+		if consumed > 0:
+			# Compact the buffer only once, no matter how many frames were in the burst.
+			del self.buffer[:consumed]
+
+	def parse_frames(self, buffer: bytearray, size: int) -> int:
+		"""Splits the complete frames contained in ``buffer[:size]`` and hands them to the client.
+
+		Each frame is given as a :class:`memoryview` slice of the buffer, which is only valid
+		for the duration of :meth:`aiotfm.Client.data_received`.
+
+		:param buffer: :class:`bytearray` the buffer to read the frames from.
+		:param size: :class:`int` the number of bytes available in the buffer.
+		:return: :class:`int` the number of bytes consumed.
+		"""
+		pos = 0
+		with memoryview(buffer) as view:
+			while pos < size:
+				length = 0
 				for i in range(5):
-					byte = self.buffer.pop(0)
-					self.length |= (byte & 127) << (i * 7)
+					if pos + i >= size:
+						return pos  # The header is incomplete
+
+					byte = buffer[pos + i]
+					length |= (byte & 127) << (i * 7)
 
 					if not byte & 0x80:
 						break
 				else:
-					raise Exception("wtf")  # pragma: no cover
+					raise InvalidSocketData("The packet's length is encoded on more than 5 bytes.")
+
+				start = pos + i + 1
+				end = start + length
+				if end > size:
+					break
 
-			if len(self.buffer) >= self.length:
-				self.client.data_received(self.buffer[: self.length], self.connection)
-				del self.buffer[: self.length]
-				self.length = 0
+				frame = view[start:end]
+				try:
+					self.client.data_received(frame, self.connection)
+				finally:
+					frame.release()
+				pos = end
+
+		return pos
 
 	def connection_made(self, transport: BaseTransport):
 		# :desc: Called when a connection has been successfully made with the server.
 		# :param connection: :class:`Connection` the connection that has been made.
 		self.connection.open = True
+		self.connection._ready.set()
 		self.client.dispatch("connection_made", self.connection)
 
+	def pause_writing(self):
+		self.connection.pause_writing()
+
+	def resume_writing(self):
+		self.connection.resume_writing()
+
 	def connection_lost(self, exc: Exception | None = None):
 		self.connection.open = False
+		self.connection._ready.clear()
+		self.connection._discard_pending()
 
 		if exc is None:
 			logger.info("Connection %s has been lost.", self.connection.name)
@@ -61,15 +102,88 @@ class TFMProtocol(Protocol):
 			self.client._close_event.set_result(("connection_lost", 10, None))
 
 
+class TFMBufferedProtocol(TFMProtocol, BufferedProtocol):
+	"""A :class:`TFMProtocol` that lets the event loop read straight into a preallocated buffer,
+	instead of allocating a new :class:`bytes` object for every read.
+
+	Select it with ``Connection.PROTOCOL = TFMBufferedProtocol``.
+	"""
+
+	BUFFER_SIZE = 0x10000
+	MIN_FREE_SPACE = 0x1000
+
+	def __init__(self, conn):
+		super().__init__(conn)
+		self.buffer = bytearray(self.BUFFER_SIZE)
+		self.size: int = 0
+
+	def get_buffer(self, sizehint: int) -> memoryview:
+		free = len(self.buffer) - self.size
+		needed = max(sizehint, self.MIN_FREE_SPACE)
+
+		if free < needed:
+			# The buffer might still be exported by the transport, so it can't be resized in place.
+			buffer = bytearray(max(len(self.buffer) * 2, self.size + needed))
+			buffer[: self.size] = self.buffer[: self.size]
+			self.buffer = buffer
+
+		return memoryview(self.buffer)[self.size :]
+
+	def buffer_updated(self, nbytes: int):
+		self.size += nbytes
+
+		consumed = self.parse_frames(self.buffer, self.size)
+		if consumed > 0:
+			# Move the incomplete frame at the start of the buffer, without resizing it.
+			self.size -= consumed
+			self.buffer[: self.size] = self.buffer[consumed : consumed + self.size]
+
+
 class Connection:
-	"""Represents the connection between the client and the host."""
+	"""Represents the connection between the client and the host.
+
+	When `coalesce` is True, the packets sent during one iteration of the event loop are
+	written together, with a single call to the transport, at the end of the iteration.
+
+	While the transport's buffer is above its high-water mark, the packets wait in the
+	connection's send queue. Once `max_queue` packets are waiting, :meth:`send` blocks until
+	the queue drains; with the ``"drop"`` overflow policy, low priority packets are dropped
+	instead.
+
+	The send queue has a lane per :class:`aiotfm.enums.Priority`: normal packets are written
+	before the low priority ones, and control packets (keep-alives, ping replies, handshakes)
+	skip the queue altogether so that bulk traffic can't make the connection time out.
+
+	While the connection is held (see :meth:`hold`), the packets stay in the send queue, even
+	before the connection is made, until :meth:`release` is called.
+	"""
 
 	PROTOCOL = TFMProtocol
+	# Jobs of the consumer task running longer than this (in seconds) are logged, as they hold the packets back.
+	SLOW_JOB_THRESHOLD = 1.0
+	OVERFLOW_POLICIES = ("block", "drop")
+	# Delay (in seconds) before racing the next port in :meth:`connect_any`, as recommended by RFC 8305.
+	CONNECT_STAGGER = 0.25
+	CONNECT_TIMEOUT = 3
+
+	def __init__(
+		self,
+		name: str,
+		client: Client,
+		loop: AbstractEventLoop,
+		coalesce: bool = False,
+		max_queue: int = 256,
+		overflow: str = "block",
+	):
+		if overflow not in self.OVERFLOW_POLICIES:
+			raise ValueError(f"Invalid overflow policy {overflow!r}, expected one of {self.OVERFLOW_POLICIES}.")
 
-	def __init__(self, name: str, client: Client, loop: AbstractEventLoop):
 		self.name: str = name
 		self.client: Client = client
 		self.loop: AbstractEventLoop = loop
+		self.coalesce: bool = coalesce
+		self.max_queue: int = max_queue
+		self.overflow: str = overflow
 
 		self.address: tuple[str, int] = None
 		self.protocol: Protocol = None
@@ -77,12 +191,73 @@ class Connection:
 
 		self.fingerprint: int = 0
 		self.open: bool = False
+		self.dropped: int = 0
+		self._ready: asyncio.Event = asyncio.Event()
+
+		self._jobs: asyncio.Queue = asyncio.Queue()
+		self._consumer: asyncio.Task = None
+		self._busy: bool = False
+		self._drained: asyncio.Event = asyncio.Event()
+		self._drained.set()
+
+		# The send queue has a lane per priority, the most urgent lane is written first.
+		self._lanes: dict[Priority, deque[tuple[Packet | PrebuiltPacket, bool]]] = {
+			Priority.NORMAL: deque(),
+			Priority.LOW: deque(),
+		}
+		self._flush_handle: asyncio.Handle = None
+		self._paused: bool = False
+		self._held: bool = False
+		self._not_full: asyncio.Event = asyncio.Event()
+		self._not_full.set()
 
 	def __bool__(self):
 		return self.open
 
+	@property
+	def idle(self) -> bool:
+		"""Whether the connection's consumer task has nothing left to run."""
+		return not self._busy and self._jobs.empty()
+
+	@property
+	def queue_depth(self) -> int:
+		"""The number of packets waiting in the send queue."""
+		return sum(map(len, self._lanes.values()))
+
+	@property
+	def writing_paused(self) -> bool:
+		"""Whether the transport asked to stop writing, its buffer being above the high-water mark."""
+		return self._paused
+
+	@property
+	def held(self) -> bool:
+		"""Whether the packets sent are kept in the send queue until :meth:`release` is called."""
+		return self._held
+
+	def hold(self):
+		"""Keeps the packets sent from now on in the send queue, until :meth:`release` is called.
+		The connection doesn't need to be made: the packets sent while connecting are queued.
+		"""
+		self._held = True
+
+	def release(self):
+		"""Writes the packets queued since :meth:`hold`, in order."""
+		self._held = False
+		if self.queue_depth and not self._paused and self._flush_handle is None:
+			self._flush_handle = self.loop.call_soon(self._flush)
+
+	def pause_writing(self):
+		"""Called by the protocol when the transport's buffer goes over the high-water mark."""
+		self._paused = True
+
+	def resume_writing(self):
+		"""Called by the protocol when the transport's buffer drains below the low-water mark."""
+		self._paused = False
+		if self.queue_depth and self._flush_handle is None:
+			self._flush_handle = self.loop.call_soon(self._flush)
+
 	def _factory(self):
-		return Connection.PROTOCOL(self)
+		return self.PROTOCOL(self)
 
 	async def connect(self, host: str, port: int):
 		"""|coro|
@@ -91,28 +266,282 @@ class Connection:
 		self.address = (host, port)
 		self.transport, self.protocol = await asyncio.wait_for(
 			self.loop.create_connection(self._factory, host, port),
-			timeout=3,
+			timeout=self.CONNECT_TIMEOUT,
 		)
 
-	async def send(self, packet: Packet, cipher: bool = False):
+	async def wait_ready(self):
+		"""|coro|
+		Waits until the connection with the host is made, without polling :attr:`open`.
+		"""
+		await self._ready.wait()
+
+	async def connect_any(self, host: str, ports: Sequence[int], stagger: float | None = None):
+		"""|coro|
+		Connect the client to the host, racing the given ports.
+
+		The attempts start one after the other, every `stagger` seconds or as soon as the previous
+		one failed, and run concurrently. The first port to accept the connection is kept and the
+		other attempts are cancelled, so a dead port doesn't delay the connection.
+
+		:param host: :class:`str` the host.
+		:param ports: Sequence[:class:`int`] the ports to try, in order of preference.
+		:param stagger: Optional[:class:`float`] the delay between two attempts, defaults to
+			:attr:`CONNECT_STAGGER`.
+		:raise: :class:`ConnectionError` if none of the ports accepted the connection.
+		"""
+		if stagger is None:
+			stagger = self.CONNECT_STAGGER
+
+		family, _, proto, _, sockaddr = (await self.loop.getaddrinfo(host, None, type=socket.SOCK_STREAM))[0]
+
+		async def attempt(port: int) -> tuple[int, socket.socket]:
+			sock = socket.socket(family, socket.SOCK_STREAM, proto)
+			try:
+				sock.setblocking(False)
+				await asyncio.wait_for(
+					self.loop.sock_connect(sock, (sockaddr[0], port, *sockaddr[2:])),
+					timeout=self.CONNECT_TIMEOUT,
+				)
+			except BaseException:
+				sock.close()
+				raise
+			return port, sock
+
+		remaining = list(ports)
+		attempts: dict[asyncio.Task, int] = {}
+		pending: set[asyncio.Task] = set()
+		winner: tuple[int, socket.socket] | None = None
+		try:
+			while winner is None and (remaining or pending):
+				if remaining:
+					port = remaining.pop(0)
+					task = self.loop.create_task(attempt(port))
+					attempts[task] = port
+					pending.add(task)
+
+				done, pending = await asyncio.wait(
+					pending,
+					timeout=stagger if remaining else None,
+					return_when=asyncio.FIRST_COMPLETED,
+				)
+				for task in done:
+					if task.exception() is not None:
+						logger.debug("Unable to connect to %s:%s.", host, attempts[task], exc_info=task.exception())
+					elif winner is None:
+						winner = task.result()
+					else:
+						task.result()[1].close()
+		finally:
+			for task in pending:
+				task.cancel()
+			if pending:
+				await asyncio.wait(pending)
+				for task in pending:
+					if not task.cancelled() and task.exception() is None:
+						task.result()[1].close()
+
+		if winner is None:
+			raise ConnectionError(f"Unable to connect to {host} on any of the ports {list(ports)}.")
+
+		port, sock = winner
+		self.address = (host, port)
+		try:
+			self.transport, self.protocol = await self.loop.create_connection(self._factory, sock=sock)
+		except BaseException:
+			sock.close()
+			raise
+
+	async def send(self, packet: Packet | PrebuiltPacket, cipher: bool = False, priority: Priority = Priority.NORMAL):
 		"""|coro|
 		Send a packet to the socket
 
+		:param packet: :class:`aiotfm.Packet` the packet to send. Packets acquired from a
+			:class:`aiotfm.packet.PacketPool` are released once written.
+		:param cipher: :class:`bool` whether or not the packet should be ciphered before sending it.
+		:param priority: :class:`aiotfm.enums.Priority` the packet's priority. Control packets
+			are written right away, ahead of the queued packets, even when the transport paused
+			writing. Low priority packets are queued behind the normal ones, and dropped when the
+			send queue is full and the overflow policy is ``"drop"``.
+		"""
+		if not self.open and (not self._held or priority == Priority.CONTROL):
+			raise AiotfmException("Cannot send a packet to a closed Connection.")
+
+		if cipher and isinstance(packet, PrebuiltPacket):
+			raise PacketError("A prebuilt packet can't be ciphered.")
+
+		queued = self.coalesce or self._paused or self._held or self.queue_depth
+		if priority == Priority.CONTROL or not queued:
+			self._write(packet, cipher)
+			return
+
+		while self.queue_depth >= self.max_queue:
+			if self.overflow == "drop" and priority >= Priority.LOW:
+				self.dropped += 1
+				return
+
+			self._not_full.clear()
+			await self._not_full.wait()
+			if not self.open and not self._held:
+				raise AiotfmException("Cannot send a packet to a closed Connection.")
+
+		self._lanes[priority].append((packet, cipher))
+		if not self._paused and not self._held and self._flush_handle is None:
+			self._flush_handle = self.loop.call_soon(self._flush)
+
+	def send_control(self, packet: Packet | PrebuiltPacket, cipher: bool = False):
+		"""Writes a control packet right away, ahead of the queued packets.
+		Same as ``await send(packet, cipher, Priority.CONTROL)``, without the need for a coroutine.
+
 		:param packet: :class:`aiotfm.Packet` the packet to send.
 		:param cipher: :class:`bool` whether or not the packet should be ciphered before sending it.
 		"""
 		if not self.open:
 			raise AiotfmException("Cannot send a packet to a closed Connection.")
 
+		if cipher and isinstance(packet, PrebuiltPacket):
+			raise PacketError("A prebuilt packet can't be ciphered.")
+
+		self._write(packet, cipher)
+
+	def _write(self, packet: Packet | PrebuiltPacket, cipher: bool):
+		"""Writes a packet right away."""
+		self.transport.writelines(self._finalize(packet, cipher))
+		self._recycle((packet,))
+
+	def _finalize(self, packet: Packet | PrebuiltPacket, cipher: bool) -> Sequence[ByteString]:
+		"""Assigns the next fingerprint to a packet and returns the buffers to write."""
+		fp = self.fingerprint
+		self.fingerprint = (fp + 1) % 100
+
+		if isinstance(packet, PrebuiltPacket):
+			return (packet.frames[fp],)
+
 		if not self.client.bot_role and cipher:
-			packet.xor_cipher(self.client.keys.msg, self.fingerprint)
+			packet.xor_cipher(self.client.keys.msg, fp)
+
+		# The header and the payload are written separately so the payload is never copied.
+		return packet.export_parts(fp)
+
+	def _flush(self):
+		"""Writes the pending packets at once, unless the transport paused writing or the connection is held."""
+		self._flush_handle = None
+		if not self._paused and not self._held:
+			self._write_pending()
+
+	def _write_pending(self):
+		"""Writes the pending packets at once. Their fingerprints are assigned in order."""
+		pending = [item for lane in self._lanes.values() for item in lane]
+		for lane in self._lanes.values():
+			lane.clear()
+		self._not_full.set()
+		if not pending or self.transport is None or self.transport.is_closing():
+			return
 
-		self.transport.write(packet.export(self.fingerprint))
-		self.fingerprint = (self.fingerprint + 1) % 100
+		buffers: list[ByteString] = []
+		for packet, cipher in pending:
+			buffers.extend(self._finalize(packet, cipher))
+
+		self.transport.writelines(buffers)
+		self._recycle(packet for packet, _ in pending)
+
+	def _discard_pending(self):
+		"""Drops the pending packets, the transport being gone, and wakes up the waiting senders."""
+		if self._flush_handle is not None:
+			self._flush_handle.cancel()
+			self._flush_handle = None
+
+		for lane in self._lanes.values():
+			lane.clear()
+		self._paused = False
+		self._held = False
+		self._not_full.set()
+
+	def _recycle(self, packets: Iterable[Packet | PrebuiltPacket]):
+		"""Releases the pooled packets that were written."""
+		# The transport keeps a reference to what it couldn't write yet, the packets can't be reused then.
+		if self.transport.get_write_buffer_size():
+			return
+
+		for packet in packets:
+			if isinstance(packet, Packet) and packet._pool is not None:
+				packet.release()
+
+	def schedule(self, coro: Coroutine):
+		"""Schedules a coroutine to be run by the connection's consumer task.
+		The scheduled coroutines are run one after the other, in order.
+
+		:param coro: the coroutine to run.
+		"""
+		self._jobs.put_nowait(coro)
+		self._drained.clear()
+
+		if self._consumer is None or self._consumer.done():
+			self._consumer = self.loop.create_task(self._consume())
+
+	async def _consume(self):
+		"""|coro|
+		Runs the scheduled coroutines in order.
+		"""
+		while True:
+			coro = await self._jobs.get()
+			self._busy = True
+			start = self.loop.time()
+			try:
+				await coro
+			except Exception as e:
+				logger.error("An error occurred in the connection %s's consumer:", self.name, exc_info=e)
+			finally:
+				self._busy = False
+				if self._jobs.empty():
+					self._drained.set()
+
+			elapsed = self.loop.time() - start
+			if elapsed > self.SLOW_JOB_THRESHOLD:
+				logger.warning(
+					"%s took %.2fs in the connection %s's consumer, the packets received meanwhile were held back.",
+					getattr(coro, "__qualname__", coro),
+					elapsed,
+					self.name,
+				)
+
+	async def drain(self, timeout: float | None = None) -> bool:
+		"""|coro|
+		Waits for the consumer task to run the jobs scheduled so far, so that the connection can be
+		closed without dropping the packets received.
+
+		:param timeout: Optional[:class:`float`] the number of seconds after which the jobs left are
+			given up on. Waits forever by default.
+		:return: :class:`bool` whether the connection has been drained.
+		"""
+		if self._drained.is_set():
+			return True
+
+		try:
+			await asyncio.wait_for(self._drained.wait(), timeout)
+		except asyncio.TimeoutError:
+			return False
+		return True
 
 	def close(self):
 		"""Closes the connection."""
 		self.open = False
+		self._held = False
+		self._ready.clear()
+
+		if self._consumer is not None:
+			self._consumer.cancel()
+			self._consumer = None
+
+		while not self._jobs.empty():
+			self._jobs.get_nowait().close()
+		self._drained.set()
+
+		if self._flush_handle is not None:
+			self._flush_handle.cancel()
+			self._flush_handle = None
+		# Write what is left, the senders waiting for room in the queue are woken up.
+		self._write_pending()
+
 		if self.transport is not None and not self.transport.is_closing():
 			self.transport.write_eof()
 			self.transport.close()
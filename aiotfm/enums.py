@@ -151,3 +151,21 @@ class Game(IntEnum):
 	@classmethod
 	def _missing_(cls, value):
 		return cls.INVALID
+
+
+class Priority(IntEnum):
+	"""Enumerates the priorities of the outgoing packets. Lower values are more urgent."""
+
+	CONTROL = 0
+	NORMAL = 1
+	LOW = 2
+
+
+class TrafficClass(IntEnum):
+	"""Enumerates the classes of outgoing traffic that are rate limited."""
+
+	ROOM_MESSAGE = 1
+	WHISPER = 2
+	CHANNEL_MESSAGE = 3
+	CP_REQUEST = 4
+	LUA = 5
@@ -6,6 +6,7 @@ from aiotfm.enums import Game
 from aiotfm.errors import CantFriendPlayerError, CommunityPlatformError, FriendLimitError, InvalidAccountError
 from aiotfm.packet import Packet
 from aiotfm.player import Player
+from aiotfm.schema import Schema
 from aiotfm.utils import Date
 
 if TYPE_CHECKING:
@@ -71,16 +72,12 @@ class FriendList:
 				return
 
 		if friend.isSoulmate:
-			sid = await self._client.sendCP(26, Packet())
-			result, error = 27, 36
+			packet = await self._client.request_cp(26, Packet())
+			error = 36
 		else:
-			sid = await self._client.sendCP(20, Packet().writeString(friend.name.lower()))
-			result, error = 21, 30
+			packet = await self._client.request_cp(20, Packet().writeString(friend.name.lower()))
+			error = 30
 
-		def is_deletion(tc, packet):
-			return tc == result and packet.read32() == sid
-
-		tc, packet = await self._client.wait_for("on_raw_cp", is_deletion, timeout=5)
 		result = packet.read8()
 
 		if result != 1:
@@ -106,12 +103,7 @@ class FriendList:
 		if friend is not None:
 			return friend
 
-		sid = await self._client.sendCP(18, Packet().writeString(name))
-
-		def is_addition(tc, packet):
-			return tc == 19 and packet.read32() == sid
-
-		tc, packet = await self._client.wait_for("on_raw_cp", is_addition, timeout=5)
+		packet = await self._client.request_cp(18, Packet().writeString(name))
 		result = packet.read8()
 
 		if result == 12:
@@ -156,17 +148,31 @@ class Friend:
 		The last connection of the player
 	"""
 
+	SCHEMA = Schema(
+		"Friend",
+		("id", "u32"),
+		("name", "utf"),
+		("gender", "u8"),
+		("avatar", "u32"),
+		("isAddedBack", "bool"),
+		("isConnected", "bool"),
+		("game", "u32"),
+		("roomName", "utf"),
+		("lastConnection", "u32"),
+	)
+
 	def __init__(self, flist: FriendList, packet: Packet, isSoulmate: bool = False):
-		self.id: int = packet.read32()
-		self.name: str = packet.readUTF()
-		self.gender: int = packet.read8()
-		self.hasAvatar: bool = packet.read32() != 0
+		id_, name, gender, avatar, isAddedBack, isConnected, game, roomName, lastConnection = self.SCHEMA.decode(packet)
+		self.id: int = id_
+		self.name: str = name
+		self.gender: int = gender
+		self.hasAvatar: bool = avatar != 0
 		self.isSoulmate: bool = isSoulmate
-		self.isAddedBack: bool = packet.readBool()
-		self.isConnected: bool = packet.readBool()
-		self.game: Game = Game(packet.read32())
-		self.roomName: str = packet.readUTF()
-		self.lastConnection: Date = Date.fromtimestamp(packet.read32())
+		self.isAddedBack: bool = isAddedBack
+		self.isConnected: bool = isConnected
+		self.game: Game = Game(game)
+		self.roomName: str = roomName
+		self.lastConnection: Date = Date.fromtimestamp(lastConnection)
 
 		self._flist: FriendList = flist
 
@@ -4,9 +4,10 @@ from typing import TYPE_CHECKING
 
 from aiotfm.enums import ChatCommunity
 from aiotfm.packet import Packet
+from aiotfm.player import Player
 
 if TYPE_CHECKING:
-	from aiotfm import Client, Player
+	from aiotfm import Client
 
 
 class Message:
@@ -112,12 +113,9 @@ class Channel:
 		:throws: :class:`asyncio.TimeoutError`
 		:return: List[:class:`aiotfm.Player`]"""
 
-		def check(idseq, players):
-			return idseq == idSequence
-
-		idSequence = await self._client.sendCP(58, Packet().writeString(self.name))
-		_, players = await self._client.wait_for("on_channel_who", check, timeout=3)
-		return players
+		packet = await self._client.request_cp(58, Packet().writeString(self.name), timeout=3)
+		packet.read8()  # result
+		return [Player(packet.readUTF()) for _ in range(packet.read16())]
 
 
 class ChannelMessage(Message):
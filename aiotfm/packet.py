@@ -1,8 +1,20 @@
 import struct
-from typing import ByteString, List, Optional, Tuple, Union
+from functools import lru_cache
+from typing import ByteString, Dict, List, Optional, Tuple, Union
 
 from aiotfm.errors import XXTEAInvalidKeys, XXTEAInvalidPacket
 
+U16 = struct.Struct(">H")
+U32 = struct.Struct(">I")
+
+
+@lru_cache(maxsize=128)
+def compile_format(fmt: str) -> struct.Struct:
+	"""Returns the (cached) :class:`struct.Struct` for a format string. Big endian is used by default."""
+	if fmt[:1] not in "@=<>!":
+		fmt = ">" + fmt
+	return struct.Struct(fmt)
+
 
 class Packet:
 	"""Represents a network packet.
@@ -29,6 +41,7 @@ class Packet:
 
 		self.buffer: bytearray = buffer
 		self.pos: int = 0
+		self._pool: Optional[PacketPool] = None
 
 	def __repr__(self):
 		return f"<Packet {bytes(self)!r}>"
@@ -46,6 +59,22 @@ class Packet:
 
 		return cls().write8(c).write8(cc)
 
+	def reset(self) -> "Packet":
+		"""Empties the packet so that it can be written again."""
+		self.buffer.clear()
+		self.pos = 0
+		return self
+
+	def release(self) -> bool:
+		"""Gives the packet back to the :class:`PacketPool` it was acquired from, if any.
+		The packet must not be used afterwards.
+
+		:return: :class:`bool` whether the packet went back to its pool.
+		"""
+		if self._pool is None:
+			return False
+		return self._pool.release(self)
+
 	def copy(self, copy_pos: bool = False) -> "Packet":
 		"""Returns a copy of the Packet"""
 		p = Packet()
@@ -71,15 +100,32 @@ class Packet:
 
 	def read16(self) -> int:
 		"""Read a short (two bytes) from the buffer"""
-		return struct.unpack(">H", self.readBytes(2))[0]
+		value = U16.unpack_from(self.buffer, self.pos)[0]
+		self.pos += 2
+		return value
 
 	def read24(self) -> int:
 		"""Read three bytes from the buffer"""
-		return int.from_bytes(self.readBytes(3), "big")
+		high, low = U16.unpack_from(self.buffer, self.pos)[0], self.buffer[self.pos + 2]
+		self.pos += 3
+		return high << 8 | low
 
 	def read32(self) -> int:
 		"""Read an int (four bytes) from the buffer"""
-		return struct.unpack(">I", self.readBytes(4))[0]
+		value = U32.unpack_from(self.buffer, self.pos)[0]
+		self.pos += 4
+		return value
+
+	def read_many(self, fmt: str) -> Tuple:
+		"""Read a whole record of fixed size fields at once.
+
+		:param fmt: :class:`str` a :mod:`struct` format string, big endian by default (e.g. ``"IHB"``).
+		:return: :class:`tuple` the decoded values.
+		"""
+		record = compile_format(fmt)
+		values = record.unpack_from(self.buffer, self.pos)
+		self.pos += record.size
+		return values
 
 	def readBool(self) -> bool:
 		"""Read a boolean (one byte) from the buffer"""
@@ -112,7 +158,7 @@ class Packet:
 
 	def write16(self, value: int) -> "Packet":
 		"""Write a short (two bytes) to the buffer"""
-		self.buffer.extend(struct.pack(">H", value & 0xFFFF))
+		self.buffer.extend(U16.pack(value & 0xFFFF))
 		return self
 
 	def write24(self, value: int) -> "Packet":
@@ -122,7 +168,16 @@ class Packet:
 
 	def write32(self, value: int) -> "Packet":
 		"""Write an int (four bytes) to the buffer"""
-		self.buffer.extend(struct.pack(">I", value & 0xFFFFFFFF))
+		self.buffer.extend(U32.pack(value & 0xFFFFFFFF))
+		return self
+
+	def write_many(self, fmt: str, *values: int) -> "Packet":
+		"""Write a whole record of fixed size fields at once.
+
+		:param fmt: :class:`str` a :mod:`struct` format string, big endian by default (e.g. ``"IHB"``).
+		:param values: the values to write, matching the format.
+		"""
+		self.buffer.extend(compile_format(fmt).pack(*values))
 		return self
 
 	def writeBool(self, value: bool) -> "Packet":
@@ -139,23 +194,45 @@ class Packet:
 		"""Write a string to the buffer. Alias for .writeString"""
 		return self.writeString(string)
 
-	def export(self, fp: int = 0) -> bytes:
-		"""Generates the header then converts the whole packet to bytes and returns it."""
-		m = Packet()
+	def header(self, fp: int = 0) -> bytes:
+		"""Generates the packet's header: its size (as a varint) followed by the fingerprint."""
+		header = bytearray()
 		size = len(self.buffer)
-		size_type = size >> 7
-		while size_type != 0:
-			m.write8(size & 0x7F | 0x80)
-			size = size_type
-			size_type >>= 7
-		m.write8(size & 0x7F)
-		m.write8(fp)
+		while size > 0x7F:
+			header.append(size & 0x7F | 0x80)
+			size >>= 7
+		header.append(size)
+		header.append(fp)
 
-		return bytes(m.buffer + self.buffer)
+		return bytes(header)
+
+	def export_parts(self, fp: int = 0) -> Tuple[bytes, bytearray]:
+		"""Generates the header and returns it along with the packet's buffer, without copying it.
+		Meant to be given to :meth:`asyncio.WriteTransport.writelines`: the packet must not be
+		modified afterwards, as the transport may keep a reference to its buffer.
+		"""
+		return self.header(fp), self.buffer
+
+	def export(self, fp: int = 0) -> bytes:
+		"""Generates the header then converts the whole packet to bytes and returns it."""
+		return self.header(fp) + self.buffer
 
 	def xor_cipher(self, key: List[int], fp: int) -> "Packet":
 		"""Cipher the packet with the XOR algorithm."""
-		self.buffer[2:] = (byte ^ key[i % 20] for i, byte in enumerate(self.buffer[2:], fp + 1))
+		size = len(self.buffer) - 2
+		if size <= 0:
+			return self
+
+		# Rotate the key to start at the right index, then repeat it to cover the whole payload
+		start = (fp + 1) % 20
+		key = bytes(key[start:20]) + bytes(key[:start])
+		keystream = key * (size // 20 + 1)
+
+		# XOR the whole payload at once, as big integers
+		with memoryview(self.buffer) as view, memoryview(keystream) as stream:
+			payload = int.from_bytes(view[2:], "big") ^ int.from_bytes(stream[:size], "big")
+
+		self.buffer[2:] = payload.to_bytes(size, "big")
 		return self
 
 	def cipher(self, key: List[int]) -> "Packet":
@@ -172,7 +249,7 @@ class Packet:
 			self.buffer.extend(bytes(pad))
 			length += pad
 
-		chunks = struct.unpack(f">{length // 4}I", self.buffer[2:])
+		chunks = struct.unpack_from(f">{length // 4}I", self.buffer, 2)
 		chunks = xxtea_encode(list(chunks), len(chunks), key)
 
 		packet = Packet(header).write16(len(chunks))
@@ -182,20 +259,157 @@ class Packet:
 		return self
 
 
+class PacketPool:
+	"""A pool of reusable :class:`Packet` instances.
+
+	Packets acquired from the pool are given back with :meth:`Packet.release`, which
+	:meth:`aiotfm.Connection.send` does once the packet is written.
+
+	Parameters
+	----------
+	size: :class:`int`
+		The maximum number of idle packets kept in the pool.
+
+	Attributes
+	----------
+	size: :class:`int`
+		The maximum number of idle packets kept in the pool.
+	created: :class:`int`
+		The number of packets the pool had to allocate.
+	reused: :class:`int`
+		The number of packets served from the pool without allocating.
+	released: :class:`int`
+		The number of packets given back to the pool.
+	"""
+
+	def __init__(self, size: int = 32):
+		self.size: int = size
+		self.created: int = 0
+		self.reused: int = 0
+		self.released: int = 0
+
+		self._packets: List[Packet] = []
+
+	def __len__(self):
+		return len(self._packets)
+
+	def __repr__(self):
+		return f"<PacketPool idle={len(self)} created={self.created} reused={self.reused} released={self.released}>"
+
+	@property
+	def stats(self) -> Dict[str, int]:
+		"""The pool's allocation counters."""
+		return {"idle": len(self), "created": self.created, "reused": self.reused, "released": self.released}
+
+	def acquire(self, c: Union[int, List[int], Tuple[int, int], None] = None, cc: Optional[int] = None) -> Packet:
+		"""Returns an empty packet, initialized by c and cc if given (see :meth:`Packet.new`)."""
+		if self._packets:
+			packet = self._packets.pop()
+			self.reused += 1
+		else:
+			packet = Packet()
+			self.created += 1
+		packet._pool = self
+
+		if isinstance(c, (tuple, list)):
+			c, cc = c
+		if c is None:
+			return packet
+		if cc is None:
+			return packet.write16(c)
+		return packet.write8(c).write8(cc)
+
+	def release(self, packet: Packet) -> bool:
+		"""Puts a packet acquired from this pool back in it.
+
+		:param packet: :class:`Packet` the packet.
+		:return: :class:`bool` whether the packet went back to the pool.
+		"""
+		if packet._pool is not self:
+			return False
+
+		# An idle packet doesn't belong to the pool, so releasing it twice is a no-op.
+		packet._pool = None
+		if len(self._packets) >= self.size:
+			return False
+
+		self._packets.append(packet.reset())
+		self.released += 1
+		return True
+
+
+class PrebuiltPacket:
+	"""A constant packet, exported once for every fingerprint so that sending it doesn't
+	allocate anything. Prebuilt packets can't be ciphered.
+
+	Parameters
+	----------
+	packet: :class:`Packet`
+		The packet's content.
+
+	Attributes
+	----------
+	packet: :class:`Packet`
+		The packet's content.
+	frames: Tuple[:class:`bytes`]
+		The ready to write packet, indexed by fingerprint.
+	"""
+
+	def __init__(self, packet: Packet):
+		self.packet: Packet = packet
+		self.frames: Tuple[bytes, ...] = tuple(packet.export(fp) for fp in range(100))
+
+	def __repr__(self):
+		return f"<PrebuiltPacket {bytes(self.packet)!r}>"
+
+
 DELTA = 0x9E3779B9
 
 
+@lru_cache(maxsize=16)
+def xxtea_key_schedule(key: Tuple[int, int, int, int]) -> Tuple[Tuple[int, ...], ...]:
+	"""Precompute the key words used by each round: ``schedule[e][p & 3] == key[(p & 3) ^ e]``."""
+	return tuple(tuple(key[p ^ e] for p in range(4)) for e in range(4))
+
+
 def xxtea_encode(v: List[int], n: int, key: List[int]):
 	"""https://en.wikipedia.org/wiki/XXTEA"""
-	cycles = 6 + 52 // n
+	schedule = xxtea_key_schedule(tuple(key[:4]))
+	last = n - 1
 	sum_ = 0
-	z = v[-1]
-	for _ in range(cycles):
+	z = v[last]
+	for _ in range(6 + 52 // n):
 		sum_ = (sum_ + DELTA) & 0xFFFFFFFF
-		e = sum_ >> 2 & 3
-		for p in range(n):
-			y = v[(p + 1) % n]
-			z = v[p] = (
-				v[p] + (((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4)) ^ ((sum_ ^ y) + (key[(p & 3) ^ e] ^ z)))
-			) & 0xFFFFFFFF
+		k = schedule[sum_ >> 2 & 3]
+		for p in range(last):
+			y = v[p + 1]
+			z = v[p] = (v[p] + (((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4)) ^ ((sum_ ^ y) + (k[p & 3] ^ z)))) & 0xFFFFFFFF
+
+		y = v[0]
+		z = v[last] = (
+			v[last] + (((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4)) ^ ((sum_ ^ y) + (k[last & 3] ^ z)))
+		) & 0xFFFFFFFF
+	return v
+
+
+def xxtea_decode(v: List[int], n: int, key: List[int]):
+	"""https://en.wikipedia.org/wiki/XXTEA"""
+	if n < 2:
+		# A single word is ciphered with itself as both neighbours, it can't be deciphered.
+		raise XXTEAInvalidPacket("XXTEA can only decipher blocks of two words or more.")
+
+	schedule = xxtea_key_schedule(tuple(key[:4]))
+	last = n - 1
+	rounds = 6 + 52 // n
+	sum_ = (rounds * DELTA) & 0xFFFFFFFF
+	y = v[0]
+	for _ in range(rounds):
+		k = schedule[sum_ >> 2 & 3]
+		for p in range(last, 0, -1):
+			z = v[p - 1]
+			y = v[p] = (v[p] - (((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4)) ^ ((sum_ ^ y) + (k[p & 3] ^ z)))) & 0xFFFFFFFF
+
+		z = v[last]
+		y = v[0] = (v[0] - (((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4)) ^ ((sum_ ^ y) + (k[0] ^ z)))) & 0xFFFFFFFF
+		sum_ = (sum_ - DELTA) & 0xFFFFFFFF
 	return v
@@ -1,4 +1,5 @@
 from aiotfm.packet import Packet
+from aiotfm.schema import Schema
 
 
 class Player:
@@ -56,6 +57,27 @@ class Player:
 		True if the player is jumping.
 	"""
 
+	SCHEMA = Schema(
+		"Player",
+		("name", "utf"),
+		("pid", "u32"),
+		("isShaman", "bool"),
+		("isDead", "u8"),
+		("score", "u16"),
+		("cheeses", "u8"),
+		("title", "u16"),
+		("title_stars", "u8"),
+		("gender", "u8"),
+		("_", "utf"),  # ???
+		("look", "utf"),
+		("_", "bool"),  # rasterisation ? wth
+		("mouseColor", "u32"),
+		("shamanColor", "u32"),
+		("_", "u32"),  # ???
+		("color", "u32"),
+		("_", "u8"),  # respawn id?
+	)
+
 	def __init__(self, username, uid=-1, pid=-1, **kwargs):
 		self.gender = kwargs.get("gender", 0)
 		self.look = kwargs.get("look", "")
@@ -98,37 +120,12 @@ class Player:
 		:param packet: :class:`aiotfm.Packet` the packet.
 		:return: :class:`aiotfm.Player` the player.
 		"""
-		name = packet.readUTF()
-		pid = packet.read32()
-		kwargs = {
-			"isShaman": packet.readBool(),
-			"isDead": packet.read8() > 0,  # may be bigger than 1?
-			"score": packet.read16(),
-			"cheeses": packet.read8(),
-			"title": packet.read16(),
-			"title_stars": packet.read8() - 1,
-			"gender": packet.read8(),
-		}
-		packet.readUTF()  # ???
-
-		look = packet.readUTF()
-		packet.readBool()  # rasterisation ? wth
-		mouseColor = packet.read32()
-		shamanColor = packet.read32()
-		packet.read32()  # ???
-		color = packet.read32()
-		packet.read8()  # respawn id?
-		nameColor = -1 if color == 0xFFFFFFFF else color
-
-		kwargs.update({
-			"look": look,
-			"mouseColor": mouseColor,
-			"shamanColor": shamanColor,
-			"color": color,
-			"nameColor": nameColor,
-		})
-
-		return cls(name, pid=pid, **kwargs)
+		kwargs = cls.SCHEMA.decode_dict(packet)
+		kwargs["isDead"] = kwargs["isDead"] > 0  # may be bigger than 1?
+		kwargs["title_stars"] -= 1
+		kwargs["nameColor"] = -1 if kwargs["color"] == 0xFFFFFFFF else kwargs["color"]
+
+		return cls(kwargs.pop("name"), **kwargs)
 
 	def __str__(self):
 		return self.username.capitalize().replace("#0000", "")
@@ -196,22 +193,29 @@ class Profile:
 		Number of adventure points the player has.
 	"""
 
-	def __init__(self, packet: Packet):
-		self.username = packet.readUTF()
-		self.id = packet.read32()
+	SCHEMA = Schema(
+		"Profile",
+		("username", "utf"),
+		("id", "u32"),
+		("registration_date", "u32"),
+		("privLevel", "u8"),
+		("gender", "u8"),
+		("tribe", "utf"),
+		("soulmate", "utf"),
+	)
 
-		self.registration_date = packet.read32()
-		self.privLevel = packet.read8()
-		self.gender = packet.read8()
-		self.tribe = packet.readUTF() or None
-		self.soulmate = packet.readUTF() or None
-		stats = [packet.read32() for i in range(10)]
-		self.title = packet.read16()
+	def __init__(self, packet: Packet):
+		self.username, self.id, self.registration_date, self.privLevel, self.gender, tribe, soulmate = (
+			self.SCHEMA.decode(packet)
+		)
+		self.tribe = tribe or None
+		self.soulmate = soulmate or None
+		*stats, self.title = packet.read_many("10IH")
 
 		self.titles = set()
 		self.titles_stars = {}
 		for _ in range(packet.read16()):
-			title_id, stars = packet.read16(), packet.read8()
+			title_id, stars = packet.read_many("HB")
 			self.titles.add(title_id)
 			if stars > 1:
 				self.titles_stars[title_id] = stars
@@ -221,18 +225,16 @@ class Profile:
 
 		self.badges = {}
 		for _ in range(round(packet.read16() / 2)):
-			badge, quantity = packet.read16(), packet.read16()
+			badge, quantity = packet.read_many("HH")
 			self.badges[badge] = quantity
 
 		modeStats = []
 		for _ in range(packet.read8()):
-			modeStats.append((packet.read8(), packet.read32(), packet.read32(), packet.read16()))
+			modeStats.append(packet.read_many("BIIH"))
 		self.stats = Stats(stats, modeStats)
 
 		self.equippedOrb = packet.read8()
-		self.orbs = set()
-		for _ in range(packet.read8()):
-			self.orbs.add(packet.read8())
+		self.orbs = set(packet.readBytes(packet.read8()))
 
 		self.isOnline = packet.readBool()
 		self.adventurePoints = packet.read32()
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+from aiotfm.client import Client
+from aiotfm.errors import AiotfmException
+
+logger = logging.getLogger("aiotfm")
+
+
+@dataclass(slots=True)
+class PoolHealth:
+	"""The aggregate state of the clients of a :class:`ClientPool`.
+
+	Attributes
+	----------
+	clients: :class:`int`
+		The number of clients in the pool.
+	starting: :class:`int`
+		The clients waiting for their turn to start.
+	connected: :class:`int`
+		The clients connected to the game.
+	in_room: :class:`int`
+		The clients connected to a bulle (a room's server).
+	stopped: :class:`int`
+		The clients that stopped running.
+	failed: :class:`int`
+		The clients that stopped because of an error.
+	queued_packets: :class:`int`
+		The number of packets waiting in the clients' send queues.
+	dropped_packets: :class:`int`
+		The number of low priority packets dropped by the clients' send queues.
+	"""
+
+	clients: int = 0
+	starting: int = 0
+	connected: int = 0
+	in_room: int = 0
+	stopped: int = 0
+	failed: int = 0
+	queued_packets: int = 0
+	dropped_packets: int = 0
+
+
+class ClientPool:
+	"""Runs many :class:`aiotfm.Client` on a single event loop.
+
+	The clients are started one after the other, so that a fleet doesn't log in all at once.
+	Instead of a keep-alive loop per client, the pool keeps all its clients alive with a
+	single timer wheel: the clients are spread over the wheel's slots, and one slot is
+	handled per tick.
+
+	Parameters
+	----------
+	loop: Optional[event loop]
+		The event loop shared by the clients. Defaults to ``asyncio.get_event_loop()``.
+	login_interval: Optional[:class:`float`]
+		The delay (in seconds) between two clients starting. Defaults to 1 second.
+	keep_alive_interval: Optional[:class:`float`]
+		How often (in seconds) each client sends a keep-alive packet. Defaults to
+		:attr:`aiotfm.Client.KEEP_ALIVE_INTERVAL`.
+	tick: Optional[:class:`float`]
+		How often (in seconds) the timer wheel turns. Defaults to 1 second.
+
+	Attributes
+	----------
+	clients: List[:class:`aiotfm.Client`]
+		The clients of the pool.
+	"""
+
+	def __init__(
+		self,
+		loop: Optional[asyncio.AbstractEventLoop] = None,
+		login_interval: float = 1.0,
+		keep_alive_interval: float = Client.KEEP_ALIVE_INTERVAL,
+		tick: float = 1.0,
+	):
+		self.loop: asyncio.AbstractEventLoop = loop or asyncio.get_event_loop()
+		self.login_interval: float = login_interval
+		self.keep_alive_interval: float = keep_alive_interval
+
+		self.clients: List[Client] = []
+		self._tasks: Dict[Client, asyncio.Task] = {}
+		self._pending: asyncio.Queue = asyncio.Queue()
+
+		self._slots: List[Set[Client]] = [set() for _ in range(max(1, round(keep_alive_interval / tick)))]
+		self._slot_of: Dict[Client, int] = {}
+
+		self._runners: List[asyncio.Task] = []
+		self._close_event: asyncio.Event = asyncio.Event()
+
+	def __len__(self):
+		return len(self.clients)
+
+	def __iter__(self):
+		return iter(self.clients)
+
+	def add(self, client: Client, **kwargs) -> Client:
+		"""Adds a client to the pool. It is started once the clients added before it are.
+
+		:param client: :class:`aiotfm.Client` the client, running on the pool's loop.
+		:param kwargs: the arguments of :meth:`aiotfm.Client.start`.
+		:return: :class:`aiotfm.Client` the client.
+		"""
+		if client.loop is not self.loop:
+			raise AiotfmException("The client must run on the pool's event loop.")
+		if client in self._slot_of:
+			raise AiotfmException("The client is already in the pool.")
+
+		client.keep_alive = False
+		# Spread the clients evenly over the wheel.
+		slot = min(range(len(self._slots)), key=lambda i: len(self._slots[i]))
+		self._slots[slot].add(client)
+		self._slot_of[client] = slot
+
+		self.clients.append(client)
+		self._pending.put_nowait((client, kwargs))
+		return client
+
+	def remove(self, client: Client):
+		"""Removes a client from the pool, closing it if it is running and releasing its locale.
+
+		:param client: :class:`aiotfm.Client` the client.
+		"""
+		self._slots[self._slot_of.pop(client)].discard(client)
+		self.clients.remove(client)
+		client.keep_alive = True
+		client.locale.unload()
+
+		task = self._tasks.pop(client, None)
+		if task is not None and not task.done():
+			self._stop(client, task)
+
+	def health(self) -> PoolHealth:
+		"""Returns the aggregate state of the clients.
+
+		:return: :class:`PoolHealth` the state of the pool.
+		"""
+		health = PoolHealth(clients=len(self.clients))
+		for client in self.clients:
+			task = self._tasks.get(client)
+			if task is None:
+				health.starting += 1
+			elif task.done():
+				health.stopped += 1
+				if not task.cancelled() and task.exception() is not None:
+					health.failed += 1
+			elif client.main:
+				health.connected += 1
+				if client.bulle:
+					health.in_room += 1
+
+			for conn in (client.main, client.bulle):
+				if conn is not None:
+					health.queued_packets += conn.queue_depth
+					health.dropped_packets += conn.dropped
+
+		return health
+
+	async def start(self):
+		"""|coro|
+		Starts the clients, one every :attr:`login_interval` seconds, and keeps them alive until
+		:meth:`close` is called. The clients added meanwhile are started too.
+		"""
+		if self._runners:
+			raise AiotfmException("The pool is already running.")
+
+		self._close_event.clear()
+		self._runners = [self.loop.create_task(self._launch()), self.loop.create_task(self._keep_alive())]
+		try:
+			await self._close_event.wait()
+		finally:
+			for runner in self._runners:
+				runner.cancel()
+			self._runners = []
+
+			for client, task in self._tasks.items():
+				if not task.done():
+					self._stop(client, task)
+			if self._tasks:
+				await asyncio.wait(self._tasks.values())
+
+	def close(self):
+		"""Closes every client of the pool."""
+		self._close_event.set()
+
+	async def _launch(self):
+		"""|coro|
+		Starts the pending clients, one after the other.
+		"""
+		while True:
+			client, kwargs = await self._pending.get()
+			if client not in self._slot_of:
+				continue  # Removed before its turn
+
+			task = self.loop.create_task(client.start(**kwargs))
+			task.add_done_callback(self._on_stopped)
+			self._tasks[client] = task
+			await asyncio.sleep(self.login_interval)
+
+	async def _keep_alive(self):
+		"""|coro|
+		Turns the timer wheel: every tick, the clients of the next slot send a keep-alive packet.
+		"""
+		tick = self.keep_alive_interval / len(self._slots)
+		deadline = self.loop.time()
+		index = 0
+		while True:
+			for client in self._slots[index]:
+				if client in self._tasks:
+					try:
+						client.send_keep_alive()
+					except Exception as e:
+						logger.debug("Unable to keep the client %s alive.", client.username, exc_info=e)
+
+			index = (index + 1) % len(self._slots)
+			# The deadlines don't depend on how long a tick took, the wheel doesn't drift.
+			deadline += tick
+			await asyncio.sleep(max(0, deadline - self.loop.time()))
+
+	def _on_stopped(self, task: asyncio.Task):
+		if not task.cancelled() and task.exception() is not None:
+			logger.error("A client of the pool stopped because of an error.", exc_info=task.exception())
+
+	@staticmethod
+	def _stop(client: Client, task: asyncio.Task):
+		# A client that is restarting stops instead.
+		client.auto_restart = False
+		if client._close_event is None:
+			task.cancel()  # Still fetching its keys
+		elif not client._close_event.done():
+			client.close()
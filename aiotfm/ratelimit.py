@@ -0,0 +1,124 @@
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+from aiotfm.enums import TrafficClass
+
+
+class TokenBucket:
+	"""A token bucket: allows `burst` actions at once, then `rate` actions per second.
+
+	Parameters
+	----------
+	rate: :class:`float`
+		The number of tokens added each second.
+	burst: :class:`int`
+		The maximum number of tokens the bucket holds.
+
+	Attributes
+	----------
+	rate: :class:`float`
+		The number of tokens added each second.
+	burst: :class:`int`
+		The maximum number of tokens the bucket holds.
+	tokens: :class:`float`
+		The number of tokens currently available.
+	throttled: :class:`int`
+		The number of acquisitions that had to wait for a token.
+	"""
+
+	def __init__(self, rate: float, burst: int = 1):
+		if rate <= 0 or burst < 1:
+			raise ValueError("A token bucket needs a positive rate and a burst of at least one token.")
+
+		self.rate: float = rate
+		self.burst: int = burst
+		self.tokens: float = burst
+		self.throttled: int = 0
+
+		self._updated: float = time.monotonic()
+		self._lock: asyncio.Lock = asyncio.Lock()
+
+	def __repr__(self):
+		return f"<TokenBucket rate={self.rate} burst={self.burst} tokens={self.tokens:.2f}>"
+
+	def _refill(self):
+		now = time.monotonic()
+		self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+		self._updated = now
+
+	def delay(self) -> float:
+		"""Returns the number of seconds before a token is available."""
+		self._refill()
+		return max(0.0, (1 - self.tokens) / self.rate)
+
+	async def acquire(self):
+		"""|coro|
+		Takes a token, waiting for one if the bucket is empty. The waiters are served in order.
+		"""
+		async with self._lock:
+			delay = self.delay()
+			if delay > 0:
+				self.throttled += 1
+				while delay > 0:
+					await asyncio.sleep(delay)
+					delay = self.delay()
+
+			self.tokens -= 1
+
+
+class RateLimiter:
+	"""Paces the outgoing traffic with a :class:`TokenBucket` per :class:`aiotfm.enums.TrafficClass`.
+
+	Each class has its own budget, so flooding one of them (e.g. whispers) doesn't delay the
+	others (e.g. room messages). Only the classes given a rate are limited: an empty limiter
+	lets everything through.
+
+	Parameters
+	----------
+	rates: Optional[Dict[:class:`aiotfm.enums.TrafficClass`, Optional[Tuple[:class:`float`, :class:`int`]]]]
+		The ``(rate, burst)`` of the classes to limit, e.g. :attr:`DEFAULT_RATES`.
+		``None`` leaves a class unlimited.
+
+	Attributes
+	----------
+	buckets: Dict[:class:`aiotfm.enums.TrafficClass`, :class:`TokenBucket`]
+		The bucket of each rate limited class.
+	"""
+
+	# (messages per second, burst). Conservative rates, below the game's flood limits.
+	DEFAULT_RATES: Dict[TrafficClass, Tuple[float, int]] = {
+		TrafficClass.ROOM_MESSAGE: (1, 3),
+		TrafficClass.WHISPER: (1, 3),
+		TrafficClass.CHANNEL_MESSAGE: (1, 3),
+		TrafficClass.CP_REQUEST: (5, 10),
+		TrafficClass.LUA: (0.2, 1),
+	}
+
+	def __init__(self, rates: Optional[Dict[TrafficClass, Optional[Tuple[float, int]]]] = None):
+		self.buckets: Dict[TrafficClass, TokenBucket] = {}
+
+		for traffic, rate in (rates or {}).items():
+			self.set_rate(traffic, rate)
+
+	def set_rate(self, traffic: TrafficClass, rate: Optional[Tuple[float, int]]):
+		"""Changes the rate limit of a traffic class.
+
+		:param traffic: :class:`aiotfm.enums.TrafficClass` the class.
+		:param rate: Optional[Tuple[:class:`float`, :class:`int`]] the ``(rate, burst)`` of the
+			class, or ``None`` to disable its rate limit.
+		"""
+		if rate is None:
+			self.buckets.pop(traffic, None)
+		else:
+			self.buckets[traffic] = TokenBucket(*rate)
+
+	async def acquire(self, traffic: TrafficClass):
+		"""|coro|
+		Waits until a packet of the given class can be sent.
+
+		:param traffic: :class:`aiotfm.enums.TrafficClass` the packet's class.
+		"""
+		bucket = self.buckets.get(traffic)
+		if bucket is not None:
+			await bucket.acquire()
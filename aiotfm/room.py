@@ -5,6 +5,7 @@ from aiotfm.enums import GameMode
 from aiotfm.errors import AiotfmException
 from aiotfm.packet import Packet
 from aiotfm.player import Player
+from aiotfm.schema import Schema
 
 
 class Room:
@@ -134,6 +135,23 @@ class RoomList:
 		The list of gamemodes available.
 	"""
 
+	ENTRY_SCHEMA = Schema("RoomEntry", ("is_pinned", "bool"), ("language", "utf"), ("country", "utf"), ("name", "utf"))
+	PINNED_SCHEMA = Schema("PinnedRoom", ("player_count", "utf"), ("command", "utf"), ("args", "utf"))
+	ROOM_SCHEMA = Schema(
+		"Room", ("player_count", "u16"), ("limit", "u8"), ("is_funcorp", "bool"), ("is_modified", "bool")
+	)
+	MODIFIED_SCHEMA = Schema(
+		"ModifiedRoom",
+		("no_shaman_skills", "bool"),
+		("no_consumables", "bool"),
+		("no_adventure", "bool"),
+		("collision", "bool"),
+		("aie", "bool"),
+		("map_duration", "u8"),
+		("mice_mass", "u32"),
+		("rotation_size", "u8"),
+	)
+
 	def __init__(
 		self, gamemode: GameMode, rooms: List[RoomEntry], pinned_rooms: List[RoomEntry], gamemodes: List[GameMode]
 	):
@@ -144,21 +162,16 @@ class RoomList:
 
 	@classmethod
 	def from_packet(cls, packet: Packet):
-		gamemodes = [GameMode(packet.read8()) for _ in range(packet.read8())]
+		gamemodes = [GameMode(mode) for mode in packet.readBytes(packet.read8())]
 		gamemode = GameMode(packet.read8())
 		rooms: List[RoomEntry] = []
 		pinned: List[RoomEntry] = []
 
 		while packet.pos < len(packet.buffer):
-			is_pinned = packet.readBool()
-			language = packet.readUTF()
-			country = packet.readUTF()
-			name = packet.readUTF()
+			is_pinned, language, country, name = cls.ENTRY_SCHEMA.decode(packet)
 
 			if is_pinned:
-				player_count = packet.readUTF()
-				command = packet.readUTF()
-				args = packet.readUTF()
+				player_count, command, args = cls.PINNED_SCHEMA.decode(packet)
 
 				if player_count.isdigit():
 					player_count = int(player_count)
@@ -182,10 +195,7 @@ class RoomList:
 						RoomEntry(name, language, country, player_count, command=command, args=args, is_pinned=True)
 					)
 			else:
-				player_count = packet.read16()
-				limit = packet.read8()
-				is_funcorp = packet.readBool()
-				is_modified = packet.readBool()
+				player_count, limit, is_funcorp, is_modified = cls.ROOM_SCHEMA.decode(packet)
 
 				kwargs = {
 					"limit": limit,
@@ -194,17 +204,9 @@ class RoomList:
 
 				# Read the modified properties
 				if is_modified:
-					shaman_skills = not packet.readBool()
-					consumables = not packet.readBool()
-					adventure = not packet.readBool()
-					collision = packet.readBool()
-					aie = packet.readBool()
-					map_duration = packet.read8()
-					mice_mass = packet.read32()
-					map_rotation = []
-
-					for _ in range(0, packet.read8()):
-						map_rotation.append(packet.read8())
+					*flags, collision, aie, map_duration, mice_mass, rotation_size = cls.MODIFIED_SCHEMA.decode(packet)
+					shaman_skills, consumables, adventure = (not flag for flag in flags)
+					map_rotation = list(packet.readBytes(rotation_size))
 
 					# Append the room's specific properties
 					kwargs.update({
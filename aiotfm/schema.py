@@ -0,0 +1,135 @@
+import struct
+from typing import Callable, Dict, List, Tuple
+
+from aiotfm.packet import U16, Packet
+
+# Fixed size fields and their struct codes. Booleans are read as a byte equal to 1.
+FIXED_FIELDS: Dict[str, str] = {
+	"u8": "B",
+	"u16": "H",
+	"u32": "I",
+	"i8": "b",
+	"i16": "h",
+	"i32": "i",
+	"bool": "B",
+}
+# Variable size fields: an UTF-8 string prefixed by its length (two bytes).
+VARIABLE_FIELDS = ("utf",)
+
+
+class Schema:
+	"""Declares the wire layout of a record and compiles it into a decoder and an encoder.
+
+	Adjacent fixed size fields are coalesced into a single :class:`struct.Struct`, so that
+	a run of numbers is read or written with one call.
+
+	Parameters
+	----------
+	name: :class:`str`
+		The record's name, used in the generated code and in the repr.
+	fields: Tuple[:class:`str`, :class:`str`]
+		The fields, as ``(name, type)`` pairs in wire order. The types are the keys of
+		:data:`FIXED_FIELDS` and ``"utf"``. Fields named ``_`` are skipped when decoding and
+		written as zero (or an empty string) when encoding.
+
+	Attributes
+	----------
+	name: :class:`str`
+		The record's name.
+	fields: List[Tuple[:class:`str`, :class:`str`]]
+		The record's fields.
+	names: Tuple[:class:`str`]
+		The names of the fields that are decoded, in order.
+	source: :class:`str`
+		The generated source code of the decoder and the encoder.
+	"""
+
+	def __init__(self, name: str, *fields: Tuple[str, str]):
+		for field, kind in fields:
+			if kind not in FIXED_FIELDS and kind not in VARIABLE_FIELDS:
+				raise ValueError(f"Unknown type {kind!r} for the field {field!r} of {name}.")
+
+		self.name: str = name
+		self.fields: List[Tuple[str, str]] = list(fields)
+		self.names: Tuple[str, ...] = tuple(field for field, _ in fields if field != "_")
+		self.source: str = ""
+
+		self.decode: Callable[[Packet], tuple]
+		self.encode: Callable[..., Packet]
+		self.decode, self.encode = self._compile()
+
+	def __repr__(self):
+		fields = ", ".join(f"{field}: {kind}" for field, kind in self.fields)
+		return f"<Schema {self.name} ({fields})>"
+
+	def _groups(self) -> List[Tuple[str, List[Tuple[int, str, str]]]]:
+		"""Split the fields in runs of fixed size fields and single variable size fields."""
+		groups: List[Tuple[str, List[Tuple[int, str, str]]]] = []
+		for i, (field, kind) in enumerate(self.fields):
+			if kind in FIXED_FIELDS and groups and groups[-1][0] == "fixed":
+				groups[-1][1].append((i, field, kind))
+			else:
+				groups.append(("fixed" if kind in FIXED_FIELDS else kind, [(i, field, kind)]))
+		return groups
+
+	def _compile(self) -> Tuple[Callable, Callable]:
+		namespace = {"u16_unpack": U16.unpack_from, "u16_pack": U16.pack}
+		decoder = ["def decode(packet):", "\tbuffer = packet.buffer", "\tpos = packet.pos"]
+		encoder = ["\tbuffer = packet.buffer"]
+		arguments, values = [], []
+
+		def value(i: int, field: str, kind: str) -> str:
+			if field == "_":
+				return '""' if kind == "utf" else "0"
+			arguments.append(f"f{i}")
+			return f"(1 if f{i} else 0)" if kind == "bool" else f"f{i}"
+
+		for n, (group, members) in enumerate(self._groups()):
+			if group == "fixed":
+				record = struct.Struct(">" + "".join(FIXED_FIELDS[kind] for _, _, kind in members))
+				namespace[f"s{n}"] = record
+
+				targets = "".join(f"f{i}, " for i, _, _ in members)
+				decoder.append(f"\t{targets}= s{n}.unpack_from(buffer, pos)")
+				decoder.append(f"\tpos += {record.size}")
+				encoder.append(f"\tbuffer += s{n}.pack({', '.join(value(*member) for member in members)})")
+			else:
+				i, field, kind = members[0]
+				decoder.append("\tsize = u16_unpack(buffer, pos)[0]")
+				decoder.append(f"\tf{i} = buffer[pos + 2 : pos + 2 + size].decode()")
+				decoder.append("\tpos += 2 + size")
+
+				data = value(i, field, kind)
+				encoder.append(f"\tdata = {data}.encode() if isinstance({data}, str) else {data}")
+				encoder.append("\tbuffer += u16_pack(len(data))")
+				encoder.append("\tbuffer += data")
+
+			for i, field, kind in members:
+				if field != "_":
+					values.append(f"f{i} == 1" if kind == "bool" else f"f{i}")
+
+		decoder.append("\tpacket.pos = pos")
+		decoder.append(f"\treturn ({''.join(v + ', ' for v in values)})")
+		encoder.insert(0, f"def encode(packet, {', '.join(arguments)}):")
+		encoder.append("\treturn packet")
+
+		self.source = "\n".join(decoder + [""] + encoder) + "\n"
+		exec(compile(self.source, f"<schema {self.name}>", "exec"), namespace)  # noqa: S102
+		return namespace["decode"], namespace["encode"]
+
+	def decode_dict(self, packet: Packet) -> Dict[str, object]:
+		"""Decode a record from a packet into a dict of its named fields.
+
+		:param packet: :class:`aiotfm.Packet` the packet.
+		:return: :class:`dict` the decoded fields.
+		"""
+		return dict(zip(self.names, self.decode(packet)))
+
+	def encode_dict(self, packet: Packet, values: Dict[str, object]) -> Packet:
+		"""Encode a record from a dict of its named fields.
+
+		:param packet: :class:`aiotfm.Packet` the packet to write to.
+		:param values: :class:`dict` the fields' values.
+		:return: :class:`aiotfm.Packet` the packet.
+		"""
+		return self.encode(packet, *(values[name] for name in self.names))
@@ -1,6 +1,7 @@
 from typing import List, Optional, Set, Tuple, Union
 
 from aiotfm.packet import Packet
+from aiotfm.schema import Schema
 
 
 class Shop:
@@ -33,10 +34,13 @@ class Shop:
 		All shaman object available in the shop.
 	"""
 
+	SCHEMA = Schema("Shop", ("cheese", "u32"), ("fraise", "u32"), ("look", "utf"))
+
 	def __init__(self, packet: Packet):
-		self.cheese: int = packet.read32()
-		self.fraise: int = packet.read32()
-		self.look: str = packet.readUTF()
+		cheese, fraise, look = self.SCHEMA.decode(packet)
+		self.cheese: int = cheese
+		self.fraise: int = fraise
+		self.look: str = look
 
 		self.owned_items: Set[Item] = set(Item.from_packet(packet) for _ in range(packet.read32()))
 		self.items: Set[ShopItem] = set(ShopItem.from_packet(packet) for _ in range(packet.read32()))
@@ -131,6 +135,8 @@ class Item:
 		The item's colors.
 	"""
 
+	SCHEMA = Schema("Item", ("nbr_colors", "u8"), ("uid", "u32"))
+
 	def __init__(self, category: int, id_: int, colors: Optional[List[int]] = None):
 		self.category: int = int(category)
 		self.id: int = int(id_)
@@ -152,8 +158,7 @@ class Item:
 		:param packet: :class:`aiotfm.Packet`
 		:return: :class:`aiotfm.shop.Item`
 		"""
-		nbr_colors = packet.read8()
-		uid = packet.read32()
+		nbr_colors, uid = cls.SCHEMA.decode(packet)
 		cat = (uid - 10000) // 10000 if uid > 9999 else uid // 100
 
 		if uid < 99:
@@ -167,7 +172,7 @@ class Item:
 
 		colors = []
 		if nbr_colors > 0:
-			colors = [packet.read32() for i in range(nbr_colors - 1)]
+			colors = list(packet.read_many(f"{nbr_colors - 1}I"))
 
 		return cls(cat, id_, colors)
 
@@ -233,6 +238,18 @@ class ShopItem(Item):
 		The item's special data.
 	"""
 
+	SCHEMA = Schema(
+		"ShopItem",
+		("category", "u16"),
+		("id", "u16"),
+		("colors", "u8"),
+		("is_new", "bool"),
+		("flags", "u8"),
+		("cheese", "u32"),
+		("fraise", "u32"),
+		("has_special", "bool"),
+	)
+
 	def __init__(
 		self, category: int, id_: int, colors: int, is_new: bool, flags: int, cheese: int, fraise: int, special: int
 	):
@@ -271,16 +288,8 @@ class ShopItem(Item):
 		:param packet: :class:`aiotfm.Packet`
 		:return: :class:`aiotfm.shop.ShopItem`
 		"""
-		return cls(
-			packet.read16(),
-			packet.read16(),
-			packet.read8(),
-			packet.readBool(),
-			packet.read8(),
-			packet.read32(),
-			packet.read32(),
-			packet.read32() if packet.readBool() else 0,
-		)
+		*fields, has_special_price = cls.SCHEMA.decode(packet)
+		return cls(*fields, packet.read32() if has_special_price else 0)
 
 
 class Outfit:
@@ -306,6 +315,8 @@ class Outfit:
 
 	"""
 
+	FASHION_SCHEMA = Schema("Outfit", ("id", "u16"), ("look", "utf"), ("flags", "u8"))
+
 	def __init__(self, look: str, id_: int = -1, flags: int = -1):
 		self.look: str = look
 		self.id: int = id_
@@ -327,9 +338,7 @@ class Outfit:
 		:param packet: :class:`aiotfm.Packet`
 		:return: :class:`aiotfm.shop.Outfit`
 		"""
-		id_ = packet.read16()
-		look = packet.readUTF()
-		flags = packet.read8()
+		id_, look, flags = cls.FASHION_SCHEMA.decode(packet)
 		return cls(look, id_, flags)
 
 	@classmethod
@@ -434,6 +443,16 @@ class ShamanObject:
 
 	"""
 
+	SCHEMA = Schema(
+		"ShamanObject",
+		("id", "u32"),
+		("colors", "u8"),
+		("is_new", "bool"),
+		("flags", "u8"),
+		("cheese", "u32"),
+		("fraise", "u16"),
+	)
+
 	def __init__(self, id_: int, colors: int, is_new: bool, flags: int, cheese: int, fraise: int):
 		self.id: int = id_
 		self.colors: int = colors
@@ -456,7 +475,7 @@ class ShamanObject:
 		:param packet: :class:`aiotfm.Packet`
 		:return: :class:`aiotfm.shop.ShamanObject`
 		"""
-		return cls(packet.read32(), packet.read8(), packet.readBool(), packet.read8(), packet.read32(), packet.read16())
+		return cls(*cls.SCHEMA.decode(packet))
 
 
 class OwnedShamanObject:
@@ -482,6 +501,8 @@ class OwnedShamanObject:
 
 	"""
 
+	SCHEMA = Schema("OwnedShamanObject", ("id", "u16"), ("equiped", "bool"), ("nbr_colors", "u8"))
+
 	def __init__(self, id_: int, equiped: bool, colors: List[int]):
 		self.id: int = id_
 		self.equiped: bool = equiped
@@ -501,8 +522,7 @@ class OwnedShamanObject:
 		:param packet: :class:`aiotfm.Packet`
 		:return: :class:`aiotfm.shop.OwnedShamanObject`
 		"""
-		id_ = packet.read16()
-		equiped = packet.readBool()
-		colors = [packet.read32() for i in range(max(packet.read8() - 1, 0))]
+		id_, equiped, nbr_colors = cls.SCHEMA.decode(packet)
+		colors = list(packet.read_many(f"{max(nbr_colors - 1, 0)}I"))
 
 		return cls(id_, equiped, colors)
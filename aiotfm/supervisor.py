@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from aiotfm.client import Client
+from aiotfm.errors import AiotfmException, InvalidEvent
+from aiotfm.pool import ClientPool
+
+logger = logging.getLogger("aiotfm")
+
+
+def _whisper(message) -> dict:
+	return {
+		"author": message.author.username,
+		"receiver": message.receiver.username,
+		"community": int(message.community),
+		"content": message.content,
+		"sent": message.sent,
+	}
+
+
+def _channel_message(message) -> dict:
+	return {
+		"channel": message.channel.name,
+		"author": message.author.username,
+		"community": int(message.community),
+		"content": message.content,
+	}
+
+
+def _room_message(message) -> dict:
+	return {"author": message.author.username, "content": message.content}
+
+
+def _tribe_message(author: str, message: str) -> dict:
+	return {"author": author, "content": message}
+
+
+# The events forwarded to the coordinator, and how to turn their arguments into picklable data.
+FORWARDED_EVENTS: Dict[str, Callable[..., Any]] = {
+	"whisper": _whisper,
+	"channel_message": _channel_message,
+	"room_message": _room_message,
+	"tribe_message": _tribe_message,
+}
+
+
+def _forward_events(client: Client, worker: int, events: Dict[str, Callable], channel: multiprocessing.Queue):
+	"""Sends the client's events to the coordinator, on top of dispatching them as usual."""
+	dispatch = client.dispatch
+
+	def forward(event: str, *args, **kwargs):
+		serialize = events.get(event)
+		if serialize is not None:
+			try:
+				channel.put_nowait((worker, client.username, event, serialize(*args)))
+			except Exception as e:
+				logger.error("Unable to forward the event %s to the coordinator.", event, exc_info=e)
+		return dispatch(event, *args, **kwargs)
+
+	client.dispatch = forward
+
+
+def _run_worker(
+	worker: int,
+	accounts: Sequence[dict],
+	factory: Callable[..., Client],
+	events: Dict[str, Callable],
+	channel: multiprocessing.Queue,
+	pool_options: dict,
+):
+	"""The entry point of a worker process: runs its shard of the accounts in a :class:`ClientPool`."""
+	loop = asyncio.new_event_loop()
+	asyncio.set_event_loop(loop)
+
+	pool = ClientPool(loop, **pool_options)
+	for account in accounts:
+		client = factory(loop=loop)
+		_forward_events(client, worker, events, channel)
+		pool.add(client, **account)
+
+	try:
+		loop.add_signal_handler(signal.SIGTERM, pool.close)
+	except NotImplementedError:
+		pass  # The worker is killed right away instead.
+
+	try:
+		loop.run_until_complete(pool.start())
+	finally:
+		loop.close()
+
+
+class Supervisor:
+	"""Shards accounts across worker processes, each running its accounts in a :class:`aiotfm.pool.ClientPool`.
+
+	The workers forward some of their clients' events (whispers, chat messages) to the
+	coordinator over a local queue. A worker that crashes is restarted with its shard after
+	:attr:`restart_delay` seconds, the same way :meth:`aiotfm.Client.restart` restarts a client.
+
+	The events are registered with :meth:`event` and receive the worker's index, the client's
+	username and the event's data: ::
+
+		@supervisor.event
+		async def on_whisper(worker, username, data):
+			print(username, "received", data["content"], "from", data["author"])
+
+	Parameters
+	----------
+	accounts: Sequence[:class:`dict`]
+		The accounts to run, as the arguments of :meth:`aiotfm.Client.start`.
+	factory: Optional[Callable]
+		Creates the clients, called in the workers with the worker's event loop as ``loop``
+		keyword argument. Defaults to :class:`aiotfm.Client`. It is sent to the workers, so it
+		must be picklable, e.g. a class defined at the top level of a module.
+	workers: Optional[:class:`int`]
+		The number of worker processes. Defaults to the number of cores.
+	events: Optional[:class:`dict`]
+		The events to forward to the coordinator, and how to turn their arguments into picklable
+		data. Defaults to :data:`FORWARDED_EVENTS`.
+	restart_delay: Optional[:class:`float`]
+		The delay (in seconds) before restarting a crashed worker. Defaults to 5 seconds.
+	pool_options: Optional[:class:`dict`]
+		The arguments of the workers' :class:`aiotfm.pool.ClientPool`.
+
+	Attributes
+	----------
+	restarts: List[:class:`int`]
+		How many times each worker has been restarted.
+	"""
+
+	# How long (in seconds) the coordinator waits for an event before checking on the workers.
+	POLL_INTERVAL = 0.5
+
+	def __init__(
+		self,
+		accounts: Sequence[dict],
+		factory: Callable[..., Client] = Client,
+		workers: Optional[int] = None,
+		events: Optional[Dict[str, Callable]] = None,
+		restart_delay: float = 5.0,
+		pool_options: Optional[dict] = None,
+		loop: Optional[asyncio.AbstractEventLoop] = None,
+	):
+		self.loop: asyncio.AbstractEventLoop = loop or asyncio.get_event_loop()
+		self.accounts: List[dict] = list(accounts)
+		self.factory: Callable[..., Client] = factory
+		self.workers: int = max(1, min(workers or os.cpu_count() or 1, len(self.accounts)))
+		self.events: Dict[str, Callable] = FORWARDED_EVENTS if events is None else events
+		self.restart_delay: float = restart_delay
+		self.pool_options: dict = pool_options or {}
+
+		self.restarts: List[int] = [0] * self.workers
+		self._processes: List[Optional[multiprocessing.Process]] = [None] * self.workers
+		self._restart_at: Dict[int, float] = {}
+		# Forking a process running an event loop isn't safe, the workers start from scratch.
+		self._context = multiprocessing.get_context("spawn")
+		self._channel: multiprocessing.Queue = self._context.Queue()
+		self._closing: bool = False
+
+	def shard(self, worker: int) -> List[dict]:
+		"""Returns the accounts run by a worker.
+
+		:param worker: :class:`int` the worker's index.
+		:return: List[:class:`dict`] the worker's accounts.
+		"""
+		return self.accounts[worker :: self.workers]
+
+	def event(self, coro: Callable) -> Callable:
+		"""A decorator that registers an event of the coordinator."""
+		name = coro.__name__
+		if not name.startswith("on_"):
+			raise InvalidEvent(f"{name!r} isn't a correct event naming.")
+		if not asyncio.iscoroutinefunction(coro):
+			raise InvalidEvent(f"Couldn't register a non-coroutine function for the event {name}.")
+
+		setattr(self, name, coro)
+		return coro
+
+	def dispatch(self, event: str, *args):
+		"""Dispatches an event to the coordinator's handler, if any.
+
+		:param event: :class:`str` event's name. (without 'on_')
+		:param args: arguments to pass to the coro.
+		"""
+		coro = getattr(self, "on_" + event, None)
+		if coro is not None:
+			return asyncio.ensure_future(self._run_event(coro, event, *args), loop=self.loop)
+
+	async def _run_event(self, coro: Callable, event: str, *args):
+		try:
+			await coro(*args)
+		except Exception as e:
+			logger.error("An error occurred in the coordinator's event %s.", event, exc_info=e)
+
+	def _spawn(self, worker: int):
+		process = self._context.Process(
+			target=_run_worker,
+			args=(worker, self.shard(worker), self.factory, self.events, self._channel, self.pool_options),
+			name=f"aiotfm-worker-{worker}",
+			daemon=True,
+		)
+		process.start()
+		self._processes[worker] = process
+
+	def _receive(self) -> Optional[tuple]:
+		try:
+			return self._channel.get(timeout=self.POLL_INTERVAL)
+		except queue.Empty:
+			return None
+
+	def _check_workers(self) -> bool:
+		"""Restarts the crashed workers once their delay is over.
+
+		:return: :class:`bool` whether some workers are still running or restarting.
+		"""
+		now = self.loop.time()
+		running = False
+		for worker, process in enumerate(self._processes):
+			if worker in self._restart_at:
+				running = True
+				if now >= self._restart_at[worker]:
+					del self._restart_at[worker]
+					self.restarts[worker] += 1
+					self._spawn(worker)
+					# :desc: Called when a crashed worker is restarted.
+					# :param worker: :class:`int` the worker's index.
+					self.dispatch("worker_restart", worker)
+
+			elif process.exitcode is None:
+				running = True
+
+			elif process.exitcode != 0 and not self._closing:
+				logger.error("The worker %d crashed with the exit code %d.", worker, process.exitcode)
+				# :desc: Called when a worker crashed.
+				# :param worker: :class:`int` the worker's index.
+				# :param exitcode: :class:`int` the worker process' exit code.
+				self.dispatch("worker_crash", worker, process.exitcode)
+				self._restart_at[worker] = now + self.restart_delay
+				running = True
+
+		return running
+
+	async def start(self):
+		"""|coro|
+		Starts the workers and relays their events until :meth:`close` is called, or every
+		worker stopped on its own.
+		"""
+		if any(self._processes):
+			raise AiotfmException("The supervisor is already running.")
+
+		self._closing = False
+		for worker in range(self.workers):
+			self._spawn(worker)
+
+		try:
+			while self._check_workers():
+				message = await self.loop.run_in_executor(None, self._receive)
+				if message is not None:
+					worker, username, event, data = message
+					self.dispatch(event, worker, username, data)
+		finally:
+			self._closing = True
+			self._restart_at.clear()
+			await self.loop.run_in_executor(None, self._stop_workers)
+			self._processes = [None] * self.workers
+
+	def _stop_workers(self):
+		"""Asks the workers to close their clients, and kills the ones that don't stop in time."""
+		for process in self._processes:
+			if process is not None and process.exitcode is None:
+				process.terminate()
+
+		for process in self._processes:
+			if process is not None:
+				process.join(timeout=5)
+				if process.exitcode is None:
+					process.kill()
+					process.join()
+
+	def close(self):
+		"""Stops the workers and their clients."""
+		self._closing = True
+		for process in self._processes:
+			if process is not None and process.exitcode is None:
+				process.terminate()
+
+	def run(self):
+		"""A blocking call that runs the supervisor until it is closed."""
+		try:
+			self.loop.run_until_complete(self.start())
+		finally:
+			self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+			self.loop.close()
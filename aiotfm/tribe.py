@@ -3,6 +3,7 @@ from typing import List, Optional, Union
 from aiotfm.enums import Game, Permissions
 from aiotfm.packet import Packet
 from aiotfm.player import Player
+from aiotfm.schema import Schema
 from aiotfm.utils import Date
 
 
@@ -25,11 +26,14 @@ class Tribe:
 		The ranks' list of the tribe.
 	"""
 
+	SCHEMA = Schema("Tribe", ("id", "u32"), ("name", "utf"), ("welcomeMessage", "utf"), ("mapcode", "u32"))
+
 	def __init__(self, packet: Packet):
-		self.id: int = packet.read32()
-		self.name: str = packet.readUTF()
-		self.welcomeMessage: str = packet.readUTF()
-		self.mapcode: int = packet.read32()
+		id_, name, welcomeMessage, mapcode = self.SCHEMA.decode(packet)
+		self.id: int = id_
+		self.name: str = name
+		self.welcomeMessage: str = welcomeMessage
+		self.mapcode: int = mapcode
 		self.members: List[Member] = []
 		self.ranks: List[Rank] = []
 
@@ -78,16 +82,29 @@ class Member:
 		True if the member is online.
 	"""
 
+	SCHEMA = Schema(
+		"Member",
+		("id", "u32"),
+		("name", "utf"),
+		("gender", "u8"),
+		("avatar", "u32"),
+		("lastConnection", "u32"),
+		("rank_id", "u8"),
+		("game", "u32"),
+		("room", "utf"),
+	)
+
 	def __init__(self, tribe: Tribe, packet: Packet):
+		id_, name, gender, avatar, lastConnection, rank_id, game, room = self.SCHEMA.decode(packet)
 		self.tribe: Tribe = tribe
-		self.id: int = packet.read32()
-		self.name: str = packet.readUTF()
-		self.gender: int = packet.read8()
-		self.hasAvatar: bool = packet.read32() != 0
-		self.lastConnection: Date = Date.fromtimestamp(packet.read32())
-		self.rank_id: int = packet.read8()
-		self.game: Game = Game(packet.read32())
-		self.room: str = packet.readUTF()
+		self.id: int = id_
+		self.name: str = name
+		self.gender: int = gender
+		self.hasAvatar: bool = avatar != 0
+		self.lastConnection: Date = Date.fromtimestamp(lastConnection)
+		self.rank_id: int = rank_id
+		self.game: Game = Game(game)
+		self.room: str = room
 
 	@property
 	def rank(self) -> "Rank":
@@ -122,6 +139,8 @@ class Rank:
 		The rank's permissions.
 	"""
 
+	SCHEMA = Schema("Rank", ("name", "utf"), ("perm", "u32"))
+
 	def __init__(self, id_: int, name: str, perm: int):
 		self.id: int = id_
 		self.name: str = name
@@ -187,4 +206,4 @@ class Rank:
 		"""Reads a Tribe from a packet.
 		:param id: :class:`int` the tribe's id.
 		:param packet: :class:`aiotfm.Packet`"""
-		return cls(id_, packet.readUTF(), packet.read32())
+		return cls(id_, *cls.SCHEMA.decode(packet))
@@ -1,6 +1,6 @@
 from aiotfm.utils.date import Date
 from aiotfm.utils.get_keys import Keys, get_ip, get_keys
-from aiotfm.utils.locale import Locale, Translation
+from aiotfm.utils.locale import Locale, LocaleCache, LocaleStore, Translation
 from aiotfm.utils.shakikoo import shakikoo
 
-__all__ = ["shakikoo", "Date", "get_keys", "get_ip", "Translation", "Locale", "Keys"]
+__all__ = ["shakikoo", "Date", "get_keys", "get_ip", "Translation", "Locale", "LocaleCache", "LocaleStore", "Keys"]
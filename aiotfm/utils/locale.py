@@ -1,10 +1,18 @@
+import asyncio
+import json
+import logging
+import marshal
+import os
 import re
+import time
 import zlib
 
 import aiohttp
 
 from aiotfm.errors import InvalidLocale
 
+logger = logging.getLogger("aiotfm")
+
 
 class Translation:
 	"""Represents a translation item of the game.
@@ -49,13 +57,275 @@ class Translation:
 		return re.sub(r"%(\d+)", repl, self.value)
 
 
+def parse_table(data):
+	"""Decompress and parse a locale file.
+
+	:param data: :class:`bytes` the compressed locale file.
+	:return: :class:`dict` the translations, by key.
+	"""
+	content = zlib.decompress(data).decode("utf-8")
+	return {k: v for k, v in (t.split("=", 1) for t in content.split("\n-\n") if t)}
+
+
+async def fetch_table(locale):
+	"""|coro|
+	Download and parse the translation table of a locale.
+
+	:param locale: :class:`str` the locale name.
+	:return: :class:`dict` the translations, by key.
+	"""
+	async with aiohttp.ClientSession() as session:
+		async with session.get(Locale.BASE_URL.format(locale)) as r:
+			if r.status == 404:
+				raise InvalidLocale()
+
+			return parse_table(await r.read())
+
+
+def default_cache_directory():
+	"""Returns the directory where the locales are cached by default."""
+	base = os.environ.get("XDG_CACHE_HOME") or os.environ.get("LOCALAPPDATA")
+	if not base:
+		base = os.path.join(os.path.expanduser("~"), ".cache")
+	return os.path.join(base, "aiotfm")
+
+
+class LocaleCache:
+	"""Keeps the locale files and their parsed tables on disk, so that a restart doesn't
+	download nor parse them again.
+
+	For each locale, the cache holds the compressed file as downloaded, its translation table
+	serialized with :mod:`marshal`, and the file's validators (``ETag``, ``Last-Modified``).
+	A table younger than `max_age` is used as is. An older one is revalidated with a
+	conditional request, and used as is if the server is unreachable.
+
+	Parameters
+	----------
+	directory: Optional[:class:`str`]
+		Where the files are kept. Defaults to ``aiotfm`` in the user's cache directory.
+	max_age: Optional[:class:`float`]
+		How long (in seconds) a table is used before being revalidated. Defaults to an hour.
+	url: Optional[:class:`str`]
+		The locale files' URL, formatted with the locale name. Defaults to :attr:`Locale.BASE_URL`.
+	"""
+
+	MAX_AGE = 3600
+
+	def __init__(self, directory=None, max_age=MAX_AGE, url=None):
+		self.directory = directory or default_cache_directory()
+		self.max_age = max_age
+		self.url = url
+
+	def path(self, locale, extension):
+		"""Returns the path of one of a locale's cached files.
+
+		:param locale: :class:`str` the locale name.
+		:param extension: :class:`str` ``"gz"``, ``"table"`` or ``"meta"``.
+		"""
+		return os.path.join(self.directory, f"tfm-{locale}.{extension}")
+
+	def read(self, locale):
+		"""Reads a locale from the cache.
+
+		:param locale: :class:`str` the locale name.
+		:return: the table (or None if the locale isn't cached), its validators and its age in seconds.
+		"""
+		try:
+			with open(self.path(locale, "meta")) as f:
+				validators = json.load(f)
+			age = time.time() - os.stat(self.path(locale, "meta")).st_mtime
+		except (OSError, ValueError):
+			return None, {}, None
+
+		try:
+			with open(self.path(locale, "table"), "rb") as f:
+				return marshal.load(f), validators, age
+		except (OSError, EOFError, ValueError, TypeError):
+			pass
+
+		# The table is missing or was written by another version of Python: parse the file again.
+		try:
+			with open(self.path(locale, "gz"), "rb") as f:
+				table = parse_table(f.read())
+		except (OSError, ValueError, zlib.error):
+			return None, {}, None
+
+		self._write(locale, "table", marshal.dumps(table))
+		return table, validators, age
+
+	def write(self, locale, data, table, validators):
+		"""Writes a locale to the cache. Failing to do so is not an error, the cache is skipped.
+
+		:param locale: :class:`str` the locale name.
+		:param data: :class:`bytes` the compressed locale file.
+		:param table: :class:`dict` the parsed table.
+		:param validators: :class:`dict` the ``etag`` and ``last_modified`` of the file.
+		"""
+		self._write(locale, "gz", data)
+		self._write(locale, "table", marshal.dumps(table))
+		# The validators are written last, so that they never describe a file that isn't there.
+		self._write(locale, "meta", json.dumps(validators).encode())
+
+	def _write(self, locale, extension, data):
+		path = self.path(locale, extension)
+		try:
+			os.makedirs(self.directory, exist_ok=True)
+			with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+				f.write(data)
+			os.replace(f"{path}.{os.getpid()}.tmp", path)
+		except OSError as e:
+			logger.debug("Unable to write %s to the locale cache.", path, exc_info=e)
+
+	def _touch(self, locale):
+		try:
+			os.utime(self.path(locale, "meta"))
+		except OSError as e:
+			logger.debug("Unable to refresh the cached locale %s.", locale, exc_info=e)
+
+	async def fetch(self, locale):
+		"""|coro|
+		Returns the translation table of a locale, from the cache when it is fresh or still valid.
+		Can be used as the `fetch` function of a :class:`LocaleStore`.
+
+		:param locale: :class:`str` the locale name.
+		:return: :class:`dict` the translations, by key.
+		"""
+		table, validators, age = self.read(locale)
+		if table is not None and age < self.max_age:
+			return table
+
+		headers = {}
+		if table is not None:
+			if validators.get("etag"):
+				headers["If-None-Match"] = validators["etag"]
+			if validators.get("last_modified"):
+				headers["If-Modified-Since"] = validators["last_modified"]
+
+		try:
+			async with aiohttp.ClientSession() as session:
+				async with session.get((self.url or Locale.BASE_URL).format(locale), headers=headers) as r:
+					if r.status == 304 and table is not None:
+						self._touch(locale)
+						return table
+					if r.status == 404:
+						raise InvalidLocale()
+
+					r.raise_for_status()
+					data = await r.read()
+					validators = {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			if table is None:
+				raise
+			logger.warning("Unable to revalidate the locale %s, the cached one is used.", locale, exc_info=e)
+			return table
+
+		table = parse_table(data)
+		self.write(locale, data, table, validators)
+		return table
+
+
+class LocaleStore:
+	"""Keeps a single translation table per locale, shared by the :class:`Locale` of every client.
+
+	The tables are reference counted: a table is dropped once no :class:`Locale` uses it anymore.
+	Concurrent loads of the same locale share the same download.
+
+	Parameters
+	----------
+	fetch: Optional[Callable]
+		The coroutine function downloading and parsing a locale's table. Defaults to
+		:func:`fetch_table`.
+
+	Attributes
+	----------
+	tables: :class:`dict`[:class:`str`, :class:`dict`]
+		The loaded tables, by locale name.
+	"""
+
+	def __init__(self, fetch=None):
+		self.fetch = fetch or fetch_table
+		self.tables = {}
+		self._refs = {}
+		self._loading = {}
+
+	def __contains__(self, locale):
+		return locale in self.tables
+
+	def references(self, locale):
+		"""Returns the number of :class:`Locale` using a locale's table.
+
+		:param locale: :class:`str` the locale name.
+		:return: :class:`int` the number of references.
+		"""
+		return self._refs.get(locale, 0)
+
+	async def acquire(self, locale):
+		"""|coro|
+		Returns the table of a locale, loading it if needed. Must be balanced by :meth:`release`.
+
+		:param locale: :class:`str` the locale name.
+		:return: :class:`dict` the shared translation table.
+		"""
+		self._refs[locale] = self._refs.get(locale, 0) + 1
+		try:
+			if locale not in self.tables:
+				self.tables[locale] = await self._load(locale)
+			return self.tables[locale]
+		except BaseException:
+			self.release(locale)
+			raise
+
+	def release(self, locale):
+		"""Releases a reference to a locale's table. The table is dropped once it isn't used anymore.
+
+		:param locale: :class:`str` the locale name.
+		"""
+		refs = self._refs.get(locale, 0) - 1
+		if refs > 0:
+			self._refs[locale] = refs
+		else:
+			self._refs.pop(locale, None)
+			self.tables.pop(locale, None)
+
+	async def reload(self, locale):
+		"""|coro|
+		Downloads a locale's table again. The table is updated in place for every :class:`Locale`.
+
+		:param locale: :class:`str` the locale name.
+		:return: :class:`dict` the shared translation table.
+		"""
+		table = await self._load(locale)
+		if locale in self.tables and self.tables[locale] is not table:
+			self.tables[locale].clear()
+			self.tables[locale].update(table)
+		return self.tables.get(locale, table)
+
+	async def _load(self, locale):
+		"""|coro|
+		Fetches a locale's table, the concurrent calls for the same locale share one download.
+		"""
+		task = self._loading.get(locale)
+		if task is None:
+			task = asyncio.ensure_future(self.fetch(locale))
+			self._loading[locale] = task
+			task.add_done_callback(lambda _: self._loading.pop(locale, None))
+
+		# A caller that gives up doesn't cancel the download for the others.
+		return await asyncio.shield(task)
+
+
 class Locale:
 	"""Represents the locale file of the game.
 
+	The translation tables are shared with the other :class:`Locale` of the process, through
+	a :class:`LocaleStore`.
+
 	Parameters
 	----------
 	locale: :class:`str`
 		The locale name.
+	store: Optional[:class:`LocaleStore`]
+		The store of the translation tables. Defaults to the process-wide store.
 
 	Attributes
 	----------
@@ -63,13 +333,16 @@ class Locale:
 		Cached locales.
 	locale: :class:`str`
 		The locale name.
+	store: :class:`LocaleStore`
+		The store of the translation tables.
 	"""
 
 	BASE_URL = "http://transformice.com/langues/tfm-{}.gz"
 
-	def __init__(self, locale="en"):
+	def __init__(self, locale="en", store=None):
 		self._locale = locale
 		self.locales = {}
+		self.store = store or STORE
 
 	def __getitem__(self, key):
 		"""Return the translation of a key.
@@ -100,9 +373,11 @@ class Locale:
 		if locale is None:
 			locale = self._locale
 
-		# Deletes the locale then load it
-		del self.locales[locale]
-		await self.load(locale)
+		if locale not in self.locales:
+			raise KeyError(locale)
+
+		self._locale = locale
+		await self.store.reload(locale)
 
 	async def load(self, locale=None):
 		"""|coro|
@@ -115,17 +390,22 @@ class Locale:
 			self._locale = locale
 
 		# Check if the locale is cached
-		if self._locale in self.locales:
+		locale = self._locale
+		if locale in self.locales:
 			return
 
-		# Download the locale
-		async with aiohttp.ClientSession() as session:
-			async with session.get(self.BASE_URL.format(self._locale)) as r:
-				if r.status == 404:
-					raise InvalidLocale()
-
-				# Decompress the file and parse it
-				content = zlib.decompress(await r.read()).decode("utf-8")
-				table = {k: v for k, v in (t.split("=", 1) for t in content.split("\n-\n") if t)}
-				# Add the translation table
-				self.locales[self._locale] = table
+		table = await self.store.acquire(locale)
+		if locale in self.locales:
+			self.store.release(locale)  # Loaded concurrently
+		else:
+			self.locales[locale] = table
+
+	def unload(self):
+		"""Releases the loaded locales, so that the store can drop the tables nobody uses."""
+		for locale in self.locales:
+			self.store.release(locale)
+		self.locales.clear()
+
+
+# The store shared by every Locale of the process, backed by the on-disk cache.
+STORE = LocaleStore(LocaleCache().fetch)
@@ -0,0 +1,486 @@
+import asyncio
+import os
+import random
+import socket
+import time
+
+import pytest
+
+from aiotfm import Packet
+from aiotfm.packet import PacketPool, PrebuiltPacket
+from aiotfm.connection import Connection, TFMBufferedProtocol, TFMProtocol
+from aiotfm.enums import Priority
+from aiotfm.errors import AiotfmException, InvalidSocketData, PacketError
+
+
+class FakeClient:
+	bot_role = True
+
+	def __init__(self):
+		self.frames = []
+
+	def data_received(self, data, connection):
+		self.frames.append(bytes(data))
+
+	def dispatch(self, event, *args):
+		pass
+
+
+class FakeTransport:
+	def __init__(self):
+		self.writes = []
+		self.data = []
+		self.pending = 0
+
+	def write(self, data):
+		self.writes.append([data])
+
+	def writelines(self, data):
+		self.writes.append(list(data))
+		self.data.append(b''.join(data))
+
+	def get_write_buffer_size(self):
+		return self.pending
+
+
+class FakeConnection:
+	def __init__(self):
+		self.client = FakeClient()
+
+
+def make_protocol(cls=TFMProtocol):
+	return cls(FakeConnection())
+
+
+def feed_buffered(proto, data):
+	buf = proto.get_buffer(-1)
+	size = min(len(buf), len(data))
+	buf[:size] = data[:size]
+	proto.buffer_updated(size)
+	return size
+
+
+def make_burst(count, max_size=512):
+	payloads = [os.urandom(random.randint(0, max_size)) for _ in range(count)]
+	# The exported packet has a fingerprint byte after the header, strip it.
+	frames = [Packet(p).export()[:-len(p) - 1] + p for p in payloads]
+	return payloads, b''.join(frames)
+
+
+def test_single_frames():
+	proto = make_protocol()
+	proto.data_received(b'\x02AA\x00\x03BBB')
+
+	assert proto.connection.client.frames == [b'AA', b'', b'BBB']
+	assert proto.buffer == b''
+
+
+def test_split_header():
+	proto = make_protocol()
+	payload = bytes(300)
+	header = b'\xac\x02'
+
+	proto.data_received(header[:1])
+	proto.data_received(header[1:] + payload[:100])
+	assert proto.connection.client.frames == []
+
+	proto.data_received(payload[100:] + b'\x01')
+	assert proto.connection.client.frames == [payload]
+	assert proto.buffer == b'\x01'
+
+
+def test_invalid_header():
+	with pytest.raises(InvalidSocketData):
+		make_protocol().data_received(b'\xff' * 6)
+
+
+def test_burst():
+	payloads, burst = make_burst(5000)
+
+	proto = make_protocol()
+	proto.data_received(burst)
+	assert proto.connection.client.frames == payloads
+	assert proto.buffer == b''
+
+	proto = make_protocol()
+	pos = 0
+	while pos < len(burst):
+		size = random.randint(1, 4096)
+		proto.data_received(burst[pos : pos + size])
+		pos += size
+
+	assert proto.connection.client.frames == payloads
+	assert proto.buffer == b''
+
+
+def test_burst_benchmark():
+	# Multi-megabytes bursts, as a full room list or a shop would produce.
+	payloads, burst = make_burst(20000, 400)
+	payloads.extend([os.urandom(0x10000)] * 32)
+	burst += b''.join(Packet(p).export()[:3] + p for p in payloads[20000:])
+
+	proto = make_protocol()
+	start = time.perf_counter()
+	proto.data_received(burst)
+	elapsed = time.perf_counter() - start
+
+	assert len(proto.connection.client.frames) == len(payloads)
+	print(f'{len(burst) / 1e6:.1f} MB split into {len(payloads)} frames in {elapsed * 1000:.1f} ms')
+
+
+def test_buffered_protocol():
+	payloads, burst = make_burst(2000)
+	payloads.append(os.urandom(0x30000))
+	burst += Packet(payloads[-1]).export()[:3] + payloads[-1]
+
+	proto = make_protocol(TFMBufferedProtocol)
+	pos = 0
+	while pos < len(burst):
+		pos += feed_buffered(proto, burst[pos : pos + random.randint(1, 8192)])
+
+	assert proto.connection.client.frames == payloads
+	assert proto.size == 0
+	assert len(proto.buffer) >= 0x30000
+
+
+@pytest.mark.asyncio
+async def test_schedule_order():
+	conn = Connection('main', FakeClient(), asyncio.get_running_loop())
+	order = []
+
+	async def job(i, delay=0):
+		await asyncio.sleep(delay)
+		order.append(i)
+
+	conn.schedule(job(0, .05))
+	conn.schedule(job(1))
+	conn.schedule(job(2, .01))
+	await asyncio.sleep(.1)
+	assert order == [0, 1, 2]
+
+	conn.schedule(job(3, 1))
+	conn.close()
+	await asyncio.sleep(0)
+	assert conn._consumer is None
+
+
+@pytest.mark.asyncio
+async def test_send():
+	conn = Connection('main', FakeClient(), asyncio.get_running_loop())
+	conn.transport, conn.open = FakeTransport(), True
+	conn.fingerprint = 99
+
+	lua = Packet.new(29, 1).writeBytes(os.urandom(0x20000))
+	await conn.send(lua)
+	await conn.send(Packet.new(26, 26))
+
+	(header, payload), second = conn.transport.writes
+	assert payload is lua.buffer
+	assert header + payload == lua.export(99)
+	assert b''.join(second) == Packet.new(26, 26).export(0)
+	assert conn.fingerprint == 1
+
+
+@pytest.mark.asyncio
+async def test_send_pooled():
+	conn = Connection('main', FakeClient(), asyncio.get_running_loop())
+	conn.transport, conn.open = FakeTransport(), True
+	pool = PacketPool()
+
+	keep_alive = PrebuiltPacket(Packet.new(26, 26))
+	for _ in range(150):
+		await conn.send(keep_alive)
+	assert conn.transport.writes[-1] == [Packet.new(26, 26).export(49)]
+
+	with pytest.raises(PacketError):
+		await conn.send(keep_alive, cipher=True)
+
+	for _ in range(1000):
+		await conn.send(pool.acquire(28, 6).write8(1))
+	assert pool.created == 1 and pool.reused == 999
+
+	# The transport still holds the data, the packet is not recycled
+	conn.transport.pending = 10
+	packet = pool.acquire(28, 6)
+	await conn.send(packet)
+	assert len(pool) == 0 and packet.buffer == b'\x1c\x06'
+
+
+@pytest.mark.asyncio
+async def test_coalesce():
+	client = FakeClient()
+	client.bot_role = False
+	client.keys = type('Keys', (), {'msg': list(range(20))})
+
+	conn = Connection('main', client, asyncio.get_running_loop(), coalesce=True)
+	conn.transport, conn.open = FakeTransport(), True
+	conn.transport.is_closing = lambda: False
+	pool = PacketPool()
+
+	packets = [Packet.new(6, 6).writeString(f'message {i}') for i in range(10)]
+	for p in packets[:5]:
+		await conn.send(p.copy(), cipher=True)
+	await conn.send(PrebuiltPacket(Packet.new(26, 26)))
+	for p in packets[5:]:
+		await conn.send(pool.acquire().writeBytes(p))
+	assert conn.transport.writes == []
+
+	await asyncio.sleep(0)
+	assert len(conn.transport.writes) == 1
+	expected = [p.copy().xor_cipher(client.keys.msg, fp).export(fp) for fp, p in enumerate(packets[:5])]
+	expected.append(Packet.new(26, 26).export(5))
+	expected.extend(p.export(fp) for fp, p in enumerate(packets[5:], 6))
+	assert conn.transport.data[0] == b''.join(expected)
+	assert len(pool) == 5
+
+	# Pending packets are written before closing
+	conn.transport.write_eof = conn.transport.close = lambda: None
+	await conn.send(packets[0])
+	conn.close()
+	assert conn.transport.data[1] == packets[0].export(11)
+
+
+@pytest.mark.asyncio
+async def test_backpressure():
+	conn = Connection('main', FakeClient(), asyncio.get_running_loop(), max_queue=3)
+	conn.transport, conn.open = FakeTransport(), True
+	conn.transport.is_closing = lambda: False
+	packets = [Packet.new(6, 6).write8(i) for i in range(6)]
+
+	await conn.send(packets[0])
+	conn.protocol = TFMProtocol(conn)
+	conn.protocol.pause_writing()
+	assert conn.writing_paused
+
+	for packet in packets[1:4]:
+		await conn.send(packet)
+	assert conn.queue_depth == 3
+
+	# The queue is full: senders wait until it drains
+	blocked = asyncio.ensure_future(conn.send(packets[4]))
+	await asyncio.sleep(.01)
+	assert not blocked.done() and len(conn.transport.data) == 1
+
+	conn.protocol.resume_writing()
+	await asyncio.sleep(0)
+	assert conn.transport.data[1] == b''.join(p.export(fp) for fp, p in enumerate(packets[1:4], 1))
+	await blocked
+	await asyncio.sleep(0)
+	assert conn.transport.data[2] == packets[4].export(4)
+	assert conn.queue_depth == 0
+
+	# A closed connection wakes up the waiting senders
+	conn.pause_writing()
+	for packet in packets[:3]:
+		await conn.send(packet)
+	blocked = asyncio.ensure_future(conn.send(packets[5]))
+	await asyncio.sleep(0)
+	conn.transport.write_eof = conn.transport.close = lambda: None
+	conn.close()
+	with pytest.raises(AiotfmException):
+		await blocked
+
+
+@pytest.mark.asyncio
+async def test_backpressure_drop():
+	conn = Connection('main', FakeClient(), asyncio.get_running_loop(), max_queue=2, overflow='drop')
+	conn.transport, conn.open = FakeTransport(), True
+	conn.transport.is_closing = lambda: False
+
+	conn.pause_writing()
+	for i in range(5):
+		await conn.send(Packet.new(8, 5).write8(i), priority=Priority.LOW)
+	assert conn.queue_depth == 2 and conn.dropped == 3
+
+	blocked = asyncio.ensure_future(conn.send(Packet.new(6, 6)))
+	await asyncio.sleep(0)
+	assert not blocked.done()
+
+	conn.resume_writing()
+	await blocked
+	assert conn.dropped == 3
+
+	with pytest.raises(ValueError):
+		Connection('main', FakeClient(), asyncio.get_running_loop(), overflow='wait')
+
+
+@pytest.mark.asyncio
+async def test_backpressure_connection_lost():
+	conn = Connection('bulle', FakeClient(), asyncio.get_running_loop(), max_queue=1)
+	conn.transport, conn.open = FakeTransport(), True
+	conn.protocol = TFMProtocol(conn)
+
+	conn.protocol.pause_writing()
+	await conn.send(Packet.new(6, 6))
+	blocked = asyncio.ensure_future(conn.send(Packet.new(6, 6)))
+	await asyncio.sleep(0)
+	assert not blocked.done()
+
+	conn.protocol.connection_lost(None)
+	with pytest.raises(AiotfmException):
+		await asyncio.wait_for(blocked, 1)
+	assert conn.queue_depth == 0 and not conn.writing_paused
+
+
+@pytest.mark.asyncio
+async def test_slow_job_warning(caplog):
+	conn = Connection('main', FakeClient(), asyncio.get_running_loop())
+	conn.SLOW_JOB_THRESHOLD = .01
+
+	async def slow_handler():
+		await asyncio.sleep(.02)
+
+	conn.schedule(slow_handler())
+	conn.schedule(asyncio.sleep(0))
+	await asyncio.sleep(.05)
+	conn.close()
+
+	warnings = [r for r in caplog.records if r.levelname == 'WARNING']
+	assert len(warnings) == 1
+	assert 'slow_handler' in warnings[0].getMessage()
+
+
+@pytest.mark.asyncio
+async def test_priority_lanes():
+	conn = Connection('main', FakeClient(), asyncio.get_running_loop(), max_queue=4)
+	conn.transport, conn.open = FakeTransport(), True
+	conn.transport.is_closing = lambda: False
+	keep_alive = PrebuiltPacket(Packet.new(26, 26))
+
+	# A bot flooding a channel while the server doesn't keep up
+	conn.pause_writing()
+	await conn.send(Packet.new(8, 5), priority=Priority.LOW)
+	for i in range(3):
+		await conn.send(Packet.new(6, 6).write8(i))
+	blocked = asyncio.ensure_future(conn.send(Packet.new(6, 6).write8(3)))
+	await asyncio.sleep(0)
+	assert not blocked.done()
+
+	# Control packets skip the queue, even when it is full
+	await conn.send(keep_alive, priority=Priority.CONTROL)
+	conn.send_control(Packet.new(28, 6).write8(1))
+	assert conn.transport.data == [keep_alive.frames[0], Packet.new(28, 6).write8(1).export(1)]
+	assert conn.queue_depth == 4
+
+	# The normal lane is written before the low priority one
+	conn.resume_writing()
+	await blocked
+	await asyncio.sleep(0)
+	expected = [Packet.new(6, 6).write8(i) for i in range(3)] + [Packet.new(8, 5)]
+	assert conn.transport.data[2] == b''.join(p.export(fp) for fp, p in enumerate(expected, 2))
+	assert conn.transport.data[3] == Packet.new(6, 6).write8(3).export(6)
+
+
+def unused_port():
+	with socket.socket() as sock:
+		sock.bind(('127.0.0.1', 0))
+		return sock.getsockname()[1]
+
+
+@pytest.mark.asyncio
+async def test_connect_any():
+	loop = asyncio.get_running_loop()
+	accepted = []
+	server = await asyncio.start_server(lambda r, w: accepted.append(w), '127.0.0.1', 0)
+	good, refused, blackhole = server.sockets[0].getsockname()[1], unused_port(), unused_port()
+
+	# Attempts to the blackhole port never complete, like a firewalled port.
+	sock_connect = loop.sock_connect
+	attempted, sockets = [], []
+
+	async def fake_sock_connect(sock, address):
+		attempted.append(address[1])
+		sockets.append(sock)
+		if address[1] == blackhole:
+			await asyncio.sleep(60)
+		return await sock_connect(sock, address)
+
+	loop.sock_connect = fake_sock_connect
+	try:
+		conn = Connection('test', FakeClient(), loop)
+		start = time.monotonic()
+		await conn.connect_any('127.0.0.1', [blackhole, refused, good, blackhole], stagger=.1)
+		elapsed = time.monotonic() - start
+
+		# The refused port doesn't wait for the stagger delay and the last port is never tried.
+		assert elapsed < .5
+		assert attempted == [blackhole, refused, good]
+		assert conn.address == ('127.0.0.1', good)
+		assert conn.open
+		# The losing attempts are closed.
+		assert [sock.fileno() for sock in sockets[:2]] == [-1, -1]
+
+		failing = Connection('test', FakeClient(), loop)
+		failing.CONNECT_TIMEOUT = .2
+		with pytest.raises(ConnectionError):
+			await failing.connect_any('127.0.0.1', [refused, blackhole], stagger=.1)
+	finally:
+		loop.sock_connect = sock_connect
+		conn.close()
+		server.close()
+		for writer in accepted:
+			writer.close()
+
+
+@pytest.mark.asyncio
+async def test_wait_ready():
+	conn = Connection('test', FakeClient(), asyncio.get_running_loop())
+	protocol = conn._factory()
+
+	waiter = asyncio.ensure_future(conn.wait_ready())
+	await asyncio.sleep(0)
+	assert not waiter.done()
+
+	protocol.connection_made(FakeTransport())
+	await asyncio.wait_for(waiter, 1)
+	assert conn.open
+
+	protocol.connection_lost(None)
+	waiter = asyncio.ensure_future(conn.wait_ready())
+	await asyncio.sleep(0)
+	assert not waiter.done()
+	waiter.cancel()
+
+
+@pytest.mark.asyncio
+async def test_hold():
+	conn = Connection('test', FakeClient(), asyncio.get_running_loop())
+	conn.hold()
+
+	# The packets sent while connecting are queued, control packets can't be
+	await conn.send(Packet.new(6, 6))
+	with pytest.raises(AiotfmException):
+		await conn.send(Packet.new(26, 26), priority=Priority.CONTROL)
+
+	conn.transport, conn.open = FakeTransport(), True
+	conn.transport.is_closing = lambda: False
+	await conn.send(Packet.new(8, 5), priority=Priority.LOW)
+	await asyncio.sleep(0)
+	assert conn.queue_depth == 2
+
+	conn.release()
+	await asyncio.sleep(0)
+	assert conn.transport.data == [Packet.new(6, 6).export(0) + Packet.new(8, 5).export(1)]
+
+	# Closing a held connection drops its queue
+	conn = Connection('test', FakeClient(), asyncio.get_running_loop())
+	conn.hold()
+	await conn.send(Packet.new(6, 6))
+	conn.close()
+	assert conn.queue_depth == 0
+	with pytest.raises(AiotfmException):
+		await conn.send(Packet.new(6, 6))
+
+
+@pytest.mark.asyncio
+async def test_drain():
+	conn = Connection('test', FakeClient(), asyncio.get_running_loop())
+	assert await conn.drain(0)
+
+	event = asyncio.Event()
+	conn.schedule(event.wait())
+	assert not await conn.drain(.01)
+
+	event.set()
+	assert await conn.drain(1)
+	conn.close()
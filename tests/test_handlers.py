@@ -0,0 +1,305 @@
+import aiotfm
+import asyncio
+
+import pytest
+
+from aiotfm import Client, Packet, cp_handler, packet_handler
+from aiotfm.utils import Keys, Locale, LocaleStore
+
+
+class Bot(Client):
+	def __init__(self, *a, **kw):
+		super().__init__(*a, **kw)
+		self.handled = []
+
+	@packet_handler(5, 2)
+	def handle_new_map(self, conn, packet):
+		self.handled.append(('map', packet.read32()))
+
+	@cp_handler(65)
+	async def handle_tribe_message(self, conn, packet):
+		await asyncio.sleep(.01)
+		self.handled.append(('tribe', packet.readUTF()))
+
+	def _handle_joined_room(self, conn, packet):
+		self.handled.append(('room', packet.readBool()))
+
+
+def test_registry():
+	assert Bot._packet_handlers[(5 << 8) | 2] is Bot.handle_new_map
+	assert Bot._packet_handlers[(5 << 8) | 21] is Bot._handle_joined_room
+	assert Bot._cp_handlers[65] is Bot.handle_tribe_message
+
+	assert (5 << 8) | 2 not in Client._packet_handlers
+	assert Client._cp_handlers[65] is Client._handle_tribe_message
+
+
+@pytest.mark.asyncio
+async def test_dispatch_order():
+	bot = Bot(loop=asyncio.get_running_loop())
+
+	bot.data_received(Packet.new(60, 3).write16(65).writeUTF('hi').writeUTF('hello').buffer, bot.main)
+	bot.data_received(Packet.new(5, 2).write32(42).buffer, bot.main)
+	bot.data_received(Packet.new(5, 21).writeBool(True).buffer, bot.main)
+	await asyncio.sleep(.05)
+
+	assert bot.handled == [('tribe', 'hi'), ('map', 42), ('room', True)]
+	assert not await bot.handle_packet(bot.main, Packet.new(255, 255))
+
+
+@pytest.mark.asyncio
+async def test_lazy_parsing():
+	bot = Client(loop=asyncio.get_running_loop())
+
+	# Nobody listens to the shop nor the room list: the invalid packets are not decoded.
+	assert await bot.handle_packet(bot.main, Packet.new(8, 20))
+	assert await bot.handle_packet(bot.main, Packet.new(26, 35))
+
+	bot.data_received(Packet.new(31, 1).write16(0).buffer, bot.main)
+	assert bot._inventory_packet is not None
+	assert bot.inventory.items == {}
+	assert bot.inventory.client is bot
+	assert bot._inventory_packet is None
+
+	fut = bot.wait_for('on_room_list', timeout=1)
+	bot.data_received(Packet.new(26, 35).write8(1).write8(1).write8(1).buffer, bot.main)
+	roomlist = await fut
+	assert roomlist.rooms == []
+
+
+@pytest.mark.asyncio
+async def test_keyed_waiters():
+	bot = Client(loop=asyncio.get_running_loop())
+
+	first = asyncio.ensure_future(bot.wait_for('on_channel_who', key=1, timeout=1))
+	second = asyncio.ensure_future(bot.wait_for('on_channel_who', key=[2, 3], timeout=1))
+	expired = asyncio.ensure_future(bot.wait_for('on_raw_cp', key=42, timeout=.01))
+	await asyncio.sleep(0)
+	assert set(bot._keyed_waiters['on_channel_who']) == {1, 2, 3}
+
+	bot.dispatch('channel_who', 3, ['b'])
+	bot.dispatch('channel_who', 1, ['a'])
+	assert await first == (1, ['a'])
+	assert await second == (3, ['b'])
+
+	with pytest.raises(asyncio.TimeoutError):
+		await expired
+	await asyncio.sleep(0)
+	assert bot._keyed_waiters == {}
+
+	with pytest.raises(aiotfm.errors.InvalidEvent):
+		bot.wait_for('on_whisper', key=1)
+
+
+@pytest.mark.asyncio
+async def test_request_cp():
+	bot = Client(loop=asyncio.get_running_loop(), max_cp_requests=2)
+	sent = []
+
+	async def send(packet, cipher=False):
+		packet.pos = 2
+		sent.append((packet.read16(), packet.read32()))
+
+	bot.main.send = send
+	requests = [asyncio.ensure_future(bot.request_cp(58, timeout=1)) for _ in range(3)]
+	await asyncio.sleep(0)
+	assert bot.pending_cp_requests == 2
+	assert sent == [(58, 1), (58, 2)]
+
+	# Responses can come in any order, a wrong TC is ignored.
+	bot.data_received(Packet.new(60, 3).write16(60).write32(2).write8(0).buffer, bot.main)
+	bot.data_received(Packet.new(60, 3).write16(59).write32(2).write8(2).buffer, bot.main)
+	bot.data_received(Packet.new(60, 3).write16(59).write32(1).write8(1).buffer, bot.main)
+	await asyncio.sleep(.01)
+	assert sent[-1] == (58, 3)
+	bot.data_received(Packet.new(60, 3).write16(59).write32(3).write8(3).buffer, bot.main)
+
+	assert [(await r).read8() for r in requests] == [1, 2, 3]
+	assert bot.pending_cp_requests == 0
+
+	with pytest.raises(asyncio.TimeoutError):
+		await bot.request_cp(58, timeout=.01)
+	assert bot.pending_cp_requests == 0
+
+
+@pytest.mark.asyncio
+async def test_packet_pool():
+	bot = Client(loop=asyncio.get_running_loop())
+	sent = []
+
+	async def send(packet, cipher=False):
+		sent.append(bytes(packet))
+		packet.release()
+
+	bot.main.send = send
+	bot.main.send_control = lambda packet: sent.append(bytes(packet)) or packet.release()
+	# A bot that answers pings and relays chat all day allocates its packets once.
+	for i in range(500):
+		bot.data_received(Packet.new(28, 6).write8(i & 0xFF).buffer, bot.main)
+		await bot.whisper('Tigrounette#0001', 'pong')
+		await bot.sendChannelMessage('aiotfm', 'pong')
+		await asyncio.sleep(0)
+
+	assert len(sent) == 1500
+	assert sent.count(b'\x1c\x06\x00') == 2
+	assert bot.packet_pool.created <= 3
+	assert bot.packet_pool.created + bot.packet_pool.reused == 2500
+
+
+@pytest.mark.asyncio
+async def test_bulle_switch(monkeypatch):
+	bot = Client(loop=asyncio.get_running_loop())
+	connecting = []
+
+	async def connect(conn, host, port):
+		connecting.append(host)
+		await asyncio.sleep(1)
+
+	monkeypatch.setattr(aiotfm.Connection, 'connect', connect)
+
+	def switch(host):
+		return Packet.new(44, 1).write32(0).write32(1).write32(2).writeUTF(host).writeUTF('5555').buffer
+
+	bot.data_received(switch('1.1.1.1'), bot.main)
+	first = bot._bulle_task
+	await asyncio.sleep(0)
+
+	# A new switch cancels the connection still in progress
+	bot.data_received(switch('2.2.2.2'), bot.main)
+	await asyncio.sleep(0)
+	assert first.cancelled()
+	assert connecting == ['1.1.1.1', '2.2.2.2']
+
+	second = bot._bulle_task
+	bot._close_event = asyncio.Future()
+	bot.close()
+	await asyncio.sleep(0)
+	assert second.cancelled() and bot._bulle_task is None
+
+
+class Transport:
+	def __init__(self):
+		self.data = []
+		self.closed = False
+
+	def writelines(self, data):
+		self.data.append(b''.join(data))
+
+	def get_write_buffer_size(self):
+		return 0
+
+	def is_closing(self):
+		return self.closed
+
+	def write_eof(self):
+		pass
+
+	def close(self):
+		self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_bulle_switch_in_background(monkeypatch):
+	bot = Client(loop=asyncio.get_running_loop())
+	connected = asyncio.Event()
+
+	async def connect(conn, host, port):
+		await connected.wait()
+		conn.transport, conn.open = Transport(), True
+
+	monkeypatch.setattr(aiotfm.Connection, 'connect', connect)
+
+	def switch(host):
+		return Packet.new(44, 1).write32(0).write32(1).write32(2).writeUTF(host).writeUTF('5555').buffer
+
+	bot.data_received(switch('1.1.1.1'), bot.main)
+	connected.set()
+	await bot._bulle_task
+	previous = bot.bulle
+	assert bot.bulle_switch_latency is not None
+
+	# The previous bulle is busy handling a packet
+	handled = asyncio.Event()
+	previous.schedule(handled.wait())
+	connected.clear()
+	bot.data_received(switch('2.2.2.2'), bot.main)
+	await asyncio.sleep(0)
+
+	# The main connection's pipeline isn't blocked by the switch, the room traffic is queued
+	assert bot.main.idle
+	await bot.sendSmiley(1)
+	await bot.loadLua('print(1)')
+	assert bot.bulle.queue_depth == 2
+
+	connected.set()
+	await asyncio.sleep(.01)
+	# The handshake is written first, then the queued packets, by priority
+	assert bot.bulle.transport.data[0] == Packet.new(44, 1).write32(0).write32(1).write32(2).export(0)
+	assert bot.bulle.transport.data[1].endswith(b'print(1)' + Packet.new(8, 5).write8(1).export(2))
+	# The previous bulle is closed once drained
+	assert not previous.transport.closed
+
+	handled.set()
+	await bot._bulle_task
+	assert previous.transport.closed
+	assert not bot._bulle_task.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_locale_off_critical_path():
+	loaded = asyncio.Event()
+
+	async def fetch(locale):
+		await loaded.wait()
+		if locale == 'xx':
+			raise ConnectionError('Unable to download the locale.')
+		return {'hello': 'Hello %1'}
+
+	bot = Client(bot_role=True, loop=asyncio.get_running_loop())
+	bot.locale = Locale(store=LocaleStore(fetch))
+	messages, connected = [], asyncio.Event()
+
+	async def connect():
+		connected.set()
+
+	async def noop():
+		pass
+
+	@bot.event
+	async def on_server_message(message, *args):
+		messages.append(message.format(*args))
+
+	bot._connect, bot.sendHandshake = connect, noop
+	runner = asyncio.ensure_future(bot.start(keys=Keys()))
+
+	# The client is started while the locale is still loading
+	await asyncio.wait_for(connected.wait(), 1)
+	await asyncio.sleep(0)
+	assert not bot._locale_task.done()
+
+	bot.data_received(Packet.new(6, 20).writeBool(True).writeUTF('$hello').write8(1).writeUTF('world').buffer, bot.main)
+	await asyncio.sleep(.01)
+	assert bot.main.idle
+	assert messages == []
+
+	loaded.set()
+	await asyncio.sleep(.01)
+	assert messages == ['Hello world']
+
+	# A locale that can't be loaded isn't translated
+	bot.LOCALE_TIMEOUT = .05
+	loaded.clear()
+	await bot.locale.load('xx')
+	bot._locale_task = None
+	bot._load_locale()
+	bot.data_received(Packet.new(6, 20).writeBool(True).writeUTF('$hello').write8(0).buffer, bot.main)
+	await asyncio.sleep(.1)
+	assert messages[-1] == '$hello'
+
+	loaded.set()
+	await asyncio.sleep(.01)
+	assert bot._locale_task.done()
+	assert not runner.done()
+
+	bot.close()
+	await asyncio.wait_for(runner, 1)
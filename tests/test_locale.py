@@ -1,6 +1,13 @@
+import asyncio
+import os
+import zlib
+
+import aiohttp
 import pytest
+from aiohttp import web
 
-from aiotfm.utils import Locale
+from aiotfm.errors import InvalidLocale
+from aiotfm.utils import Locale, LocaleCache, LocaleStore
 
 
 _locale = None
@@ -33,3 +40,128 @@ async def test_load_another(locale: Locale):
 
 async def test_load_cache(locale: Locale):
 	await locale.load('en')
+
+
+class FakeServer:
+	def __init__(self):
+		self.downloads = []
+
+	async def fetch(self, locale):
+		self.downloads.append(locale)
+		count = len(self.downloads)
+		await asyncio.sleep(.01)
+		if locale == 'xx':
+			raise InvalidLocale()
+		return {'hello': f'hello in {locale} #{count}'}
+
+
+async def test_shared_store():
+	server = FakeServer()
+	store = LocaleStore(server.fetch)
+	locales = [Locale(store=store) for _ in range(100)]
+
+	# A fleet starting at once downloads each locale once
+	await asyncio.gather(*(locale.load() for locale in locales), Locale('fr', store).load())
+	assert sorted(server.downloads) == ['en', 'fr']
+	assert store.references('en') == 100
+	assert all(locale.locales['en'] is locales[0].locales['en'] for locale in locales)
+	assert str(locales[42]['$hello']) == 'hello in en #1'
+
+	# A reload is seen by every locale
+	await locales[0].reload()
+	assert str(locales[42]['hello']) == 'hello in en #3'
+	assert store.references('en') == 100
+
+	for locale in locales:
+		locale.unload()
+	assert 'en' not in store
+	assert 'fr' in store
+
+	with pytest.raises(InvalidLocale):
+		await Locale('xx', store).load()
+	assert store.references('xx') == 0
+
+
+async def test_concurrent_load():
+	server = FakeServer()
+	locale = Locale(store=LocaleStore(server.fetch))
+	await asyncio.gather(locale.load(), locale.load())
+
+	assert server.downloads == ['en']
+	locale.unload()
+	assert locale.store.references('en') == 0
+
+
+class LocaleServer:
+	"""A local stand-in for the game's locale files, supporting conditional requests."""
+
+	def __init__(self):
+		self.version = 1
+		self.requests = []
+
+	def file(self):
+		return zlib.compress(f'hello=Hello v{self.version}\n-\nbye=Bye'.encode())
+
+	async def handle(self, request):
+		locale = request.match_info['locale']
+		etag = f'"{self.version}"'
+		self.requests.append((locale, request.headers.get('If-None-Match')))
+
+		if locale == 'xx':
+			return web.Response(status=404)
+		if request.headers.get('If-None-Match') == etag:
+			return web.Response(status=304)
+		return web.Response(body=self.file(), headers={'ETag': etag})
+
+	async def __aenter__(self):
+		app = web.Application()
+		app.router.add_get('/tfm-{locale}.gz', self.handle)
+		self.runner = web.AppRunner(app)
+		await self.runner.setup()
+		site = web.TCPSite(self.runner, '127.0.0.1', 0)
+		await site.start()
+		port = site._server.sockets[0].getsockname()[1]
+		self.url = f'http://127.0.0.1:{port}/tfm-{{}}.gz'
+		return self
+
+	async def __aexit__(self, *exc):
+		await self.runner.cleanup()
+
+
+async def test_disk_cache(tmp_path):
+	async with LocaleServer() as server:
+		cache = LocaleCache(str(tmp_path), url=server.url)
+
+		# Cold start: the file is downloaded and cached
+		assert (await cache.fetch('en'))['hello'] == 'Hello v1'
+		assert sorted(os.listdir(tmp_path)) == ['tfm-en.gz', 'tfm-en.meta', 'tfm-en.table']
+
+		# Restart: the fresh table is loaded from the disk, without any request
+		assert (await cache.fetch('en'))['bye'] == 'Bye'
+		assert len(server.requests) == 1
+
+		# The stale table is revalidated
+		cache.max_age = 0
+		assert (await cache.fetch('en'))['hello'] == 'Hello v1'
+		assert server.requests[-1] == ('en', '"1"')
+
+		server.version = 2
+		assert (await cache.fetch('en'))['hello'] == 'Hello v2'
+		assert len(server.requests) == 3
+
+		# A table written by another version of Python is parsed again from the file
+		(tmp_path / 'tfm-en.table').write_bytes(b'garbage')
+		assert (await cache.fetch('en'))['hello'] == 'Hello v2'
+
+		with pytest.raises(InvalidLocale):
+			await cache.fetch('xx')
+
+	# The server is gone: the stale table is used, a locale never cached can't be loaded
+	assert (await cache.fetch('en'))['hello'] == 'Hello v2'
+	with pytest.raises(aiohttp.ClientError):
+		await cache.fetch('fr')
+
+	store = LocaleStore(LocaleCache(str(tmp_path), url=server.url).fetch)
+	locale = Locale(store=store)
+	await locale.load()
+	assert str(locale['$hello']) == 'Hello v2'
@@ -1,7 +1,10 @@
 import os
+import struct
+import time
 import pytest
 
 from aiotfm import Packet
+from aiotfm.packet import PacketPool, PrebuiltPacket, xxtea_decode, xxtea_encode
 from aiotfm.errors import XXTEAInvalidKeys, XXTEAInvalidPacket
 
 
@@ -84,16 +87,95 @@ def test_write():
 	assert Packet().write32(0x0100000000).buffer == bytes(4)
 
 
+def test_read_many():
+	pkt = Packet(bytes(range(13)))
+
+	assert pkt.read_many('BBH') == (0, 1, 0x0203)
+	assert pkt.read_many('<H') == (0x0504,)
+	assert pkt.read_many('2BI') == (6, 7, 0x08090a0b)
+	assert pkt.pos == 12
+
+	with pytest.raises(struct.error):
+		pkt.read_many('H')
+
+
+def test_write_many():
+	pkt = Packet().write_many('BBH', 0, 1, 0x0203).write_many('<H', 0x0504)
+	assert pkt.buffer == bytes(range(6))
+
+	player = Packet().writeUTF('aiotfm').write_many('IBBHBHBB', 42, 1, 0, 12, 3, 250, 2, 1).writeUTF('')
+	player.writeUTF('1;0,0').write_many('BIIIIB', 0, 0x78583A, 0x95D9D6, 0, 0xFFFFFFFF, 0)
+
+	from aiotfm.player import Player
+	mouse = Player.from_packet(player)
+	assert (mouse.username, mouse.pid, mouse.isShaman, mouse.score, mouse.title_stars) == ('aiotfm', 42, True, 12, 1)
+	assert (mouse.look, mouse.mouseColor, mouse.nameColor) == ('1;0,0', 0x78583A, -1)
+
+
 def test_export():
 	assert Packet(bytes(8)).export()[:2] == b'\x08\x00'
 	assert Packet(bytes(256)).export(0x41)[:3] == b'\x80\x02A'
 
 
+def test_export_parts():
+	pkt = Packet(bytes(256))
+	header, payload = pkt.export_parts(0x41)
+
+	assert header == b'\x80\x02A'
+	assert payload is pkt.buffer
+	assert header + payload == pkt.export(0x41)
+	assert Packet().export_parts() == (b'\x00\x00', b'')
+
+
+def test_pool():
+	pool = PacketPool(size=1)
+	first, second = pool.acquire(28, 6), pool.acquire()
+	assert first.buffer == b'\x1c\x06' and second.buffer == b''
+	assert pool.stats == {'idle': 0, 'created': 2, 'reused': 0, 'released': 0}
+
+	assert first.write8(1).release()
+	assert not first.release()  # already released
+	assert not second.release()  # the pool is full
+	assert not Packet().release()  # not pooled
+
+	packet = pool.acquire((60, 3))
+	assert packet is first and packet.buffer == b'\x3c\x03' and packet.pos == 0
+	assert pool.acquire(0x1a1a).buffer == b'\x1a\x1a'
+	assert pool.stats == {'idle': 0, 'created': 3, 'reused': 1, 'released': 1}
+
+
+def test_prebuilt():
+	prebuilt = PrebuiltPacket(Packet.new(26, 26))
+
+	assert len(prebuilt.frames) == 100
+	assert prebuilt.frames[42] == Packet.new(26, 26).export(42)
+
+
 def test_xor():
 	key = bytes(range(20))
 	pkt = os.urandom(256)
 	assert Packet(b'00aiotfm').xor_cipher(key, 0).buffer == b'00\x60klpck'
 	assert Packet(pkt).xor_cipher(key, 45).xor_cipher(key, 45).buffer == pkt
+	assert Packet(b'00').xor_cipher(key, 0).buffer == b'00'
+
+
+def xor_reference(buffer, key, fp):
+	return buffer[:2] + bytes(byte ^ key[i % 20] for i, byte in enumerate(buffer[2:], fp + 1))
+
+
+def test_xor_benchmark():
+	key = list(os.urandom(20))
+	pkt = os.urandom(64 * 1024)
+
+	start = time.perf_counter()
+	expected = xor_reference(pkt, key, 99)
+	reference = time.perf_counter() - start
+
+	start = time.perf_counter()
+	assert Packet(pkt).xor_cipher(key, 99).buffer == expected
+	elapsed = time.perf_counter() - start
+
+	print(f'64 KB xor_cipher: {elapsed * 1000:.2f} ms, {reference / elapsed:.0f}x faster than per byte')
 
 
 def test_xxtea():
@@ -106,3 +188,55 @@ def test_xxtea():
 	key = bytes(range(4))
 	assert Packet(b'00aiotfm').cipher(key).buffer == b'00\x00\x02\xb7\xef\xee\x9en\xbf\n\xa1'
 	assert Packet(b'0087654321').cipher(key).buffer == b'00\x00\x02\xd2F\x90\xb51z\x7fu'
+
+
+def xxtea_reference(v, n, key):
+	delta, sum_, z = 0x9E3779B9, 0, v[-1]
+	for _ in range(6 + 52 // n):
+		sum_ = (sum_ + delta) & 0xFFFFFFFF
+		e = sum_ >> 2 & 3
+		for p in range(n):
+			y = v[(p + 1) % n]
+			z = v[p] = (
+				v[p] + (((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4)) ^ ((sum_ ^ y) + (key[(p & 3) ^ e] ^ z)))
+			) & 0xFFFFFFFF
+	return v
+
+
+def test_xxtea_decode():
+	key = [0x12345678, 0x9abcdef0, 0x0fedcba9, 0x87654321]
+
+	for n in (1, 2, 3, 7, 64):
+		v = list(struct.unpack(f'>{n}I', os.urandom(n * 4)))
+		encoded = xxtea_encode(v.copy(), n, key)
+		assert encoded == xxtea_reference(v.copy(), n, key)
+		# A single word block can't be deciphered, XXTEA needs at least two.
+		if n > 1:
+			assert xxtea_decode(encoded, n, key) == v
+		else:
+			with pytest.raises(XXTEAInvalidPacket):
+				xxtea_decode(encoded, n, key)
+
+	# A captured login packet deciphers back to its content
+	pkt = Packet(b'00aiotfm').cipher(bytes(range(4)))
+	pkt.pos = 2
+	n = pkt.read16()
+	chunks = xxtea_decode(list(struct.unpack(f'>{n}I', pkt.readBytes(n * 4))), n, bytes(range(4)))
+	assert struct.pack(f'>{n}I', *chunks) == b'aiotfm\x00\x00'
+
+
+def test_xxtea_benchmark():
+	key = [0x12345678, 0x9abcdef0, 0x0fedcba9, 0x87654321]
+	v = list(struct.unpack('>64I', os.urandom(256)))
+
+	start = time.perf_counter()
+	for _ in range(200):
+		xxtea_reference(v.copy(), 64, key)
+	reference = time.perf_counter() - start
+
+	start = time.perf_counter()
+	for _ in range(200):
+		xxtea_encode(v.copy(), 64, key)
+	elapsed = time.perf_counter() - start
+
+	print(f'200 xxtea_encode of 256 bytes: {elapsed * 1000:.1f} ms, {reference / elapsed:.2f}x faster than reference')
@@ -0,0 +1,110 @@
+import asyncio
+import time
+import tracemalloc
+
+import pytest
+
+from aiotfm import Client, ClientPool
+from aiotfm.errors import AiotfmException
+
+
+class PooledClient(Client):
+	"""A client that doesn't connect, it runs until closed."""
+
+	def __init__(self, *a, fail=False, **kw):
+		super().__init__(*a, **kw)
+		self.fail = fail
+		self.started_at = None
+		self.keep_alives = []
+
+	async def start(self, **kwargs):
+		self.started_at = time.monotonic()
+		if self.fail:
+			raise ConnectionError('Unable to connect.')
+
+		self._close_event = asyncio.Future()
+		await self._close_event
+
+	def send_keep_alive(self):
+		self.keep_alives.append(time.monotonic())
+
+
+@pytest.mark.asyncio
+async def test_staggered_logins():
+	loop = asyncio.get_running_loop()
+	pool = ClientPool(loop, login_interval=.02)
+	clients = [pool.add(PooledClient(loop=loop)) for _ in range(5)]
+	assert not any(client.keep_alive for client in clients)
+
+	runner = asyncio.ensure_future(pool.start())
+	await asyncio.sleep(.05)
+	assert pool.health().starting > 0
+
+	await asyncio.sleep(.1)
+	starts = [client.started_at for client in clients]
+	assert all(b - a >= .015 for a, b in zip(starts, starts[1:]))
+
+	pool.close()
+	await asyncio.wait_for(runner, 1)
+	assert pool.health().stopped == 5
+
+
+@pytest.mark.asyncio
+async def test_keep_alive_wheel():
+	loop = asyncio.get_running_loop()
+	pool = ClientPool(loop, login_interval=0, keep_alive_interval=.1, tick=.02)
+	clients = [pool.add(PooledClient(loop=loop)) for _ in range(10)]
+
+	runner = asyncio.ensure_future(pool.start())
+	await asyncio.sleep(.31)
+	pool.close()
+	await asyncio.wait_for(runner, 1)
+
+	# Every client is kept alive about once per interval, two clients per tick.
+	assert all(2 <= len(client.keep_alives) <= 4 for client in clients)
+	ticks = sorted(round(t, 2) for client in clients for t in client.keep_alives)
+	assert max(map(ticks.count, ticks)) <= 4
+
+
+@pytest.mark.asyncio
+async def test_health():
+	loop = asyncio.get_running_loop()
+	pool = ClientPool(loop, login_interval=0)
+	pool.add(PooledClient(loop=loop))
+	pool.add(PooledClient(loop=loop, fail=True))
+	removed = pool.add(PooledClient(loop=loop))
+	pool.remove(removed)
+	assert removed.keep_alive
+
+	with pytest.raises(AiotfmException):
+		pool.add(pool.clients[0])
+	other = asyncio.new_event_loop()
+	with pytest.raises(AiotfmException):
+		pool.add(PooledClient(loop=other))
+	other.close()
+
+	runner = asyncio.ensure_future(pool.start())
+	await asyncio.sleep(.01)
+	health = pool.health()
+	assert (health.clients, health.starting, health.stopped, health.failed) == (2, 0, 1, 1)
+	assert removed.started_at is None
+
+	pool.close()
+	await asyncio.wait_for(runner, 1)
+
+
+@pytest.mark.asyncio
+async def test_footprint():
+	loop = asyncio.get_running_loop()
+	pool = ClientPool(loop)
+
+	tracemalloc.start()
+	try:
+		for _ in range(1000):
+			pool.add(Client(loop=loop))
+		size, _ = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+
+	# 1,000 idle accounts fit in a few megabytes
+	assert size / 1000 < 32 * 1024
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import pytest
+
+from aiotfm import Client
+from aiotfm.enums import TrafficClass
+from aiotfm.ratelimit import RateLimiter, TokenBucket
+
+
+@pytest.mark.asyncio
+async def test_burst_and_refill():
+	bucket = TokenBucket(rate=20, burst=3)
+
+	start = time.monotonic()
+	for _ in range(3):
+		await bucket.acquire()
+	assert time.monotonic() - start < .02
+	assert bucket.throttled == 0
+
+	# The bucket is empty: one token every 50 ms
+	for _ in range(2):
+		await bucket.acquire()
+	elapsed = time.monotonic() - start
+	assert .09 <= elapsed < .2
+	assert bucket.throttled == 2
+
+
+@pytest.mark.asyncio
+async def test_fifo():
+	bucket = TokenBucket(rate=50, burst=1)
+	order = []
+
+	async def take(i):
+		await bucket.acquire()
+		order.append(i)
+
+	await asyncio.gather(*[take(i) for i in range(5)])
+	assert order == [0, 1, 2, 3, 4]
+
+
+def test_invalid():
+	with pytest.raises(ValueError):
+		TokenBucket(rate=0)
+	with pytest.raises(ValueError):
+		TokenBucket(rate=1, burst=0)
+	with pytest.raises(ValueError):
+		RateLimiter({TrafficClass.LUA: (-1, 1)})
+
+
+@pytest.mark.asyncio
+async def test_limiter():
+	assert RateLimiter().buckets == {}
+	assert Client(loop=asyncio.get_running_loop()).rate_limiter.buckets == {}
+
+	limiter = RateLimiter(RateLimiter.DEFAULT_RATES)
+	assert set(limiter.buckets) == set(TrafficClass)
+
+	limiter.set_rate(TrafficClass.LUA, (20, 1))
+	await limiter.acquire(TrafficClass.LUA)
+	start = time.monotonic()
+	await limiter.acquire(TrafficClass.LUA)
+	assert time.monotonic() - start >= .04
+
+	# Each class has its own budget
+	start = time.monotonic()
+	await limiter.acquire(TrafficClass.WHISPER)
+	assert time.monotonic() - start < .02
+
+	limiter.set_rate(TrafficClass.LUA, None)
+	start = time.monotonic()
+	for _ in range(100):
+		await limiter.acquire(TrafficClass.LUA)
+	assert time.monotonic() - start < .02
@@ -0,0 +1,140 @@
+import time
+
+import pytest
+
+from aiotfm import Packet
+from aiotfm.enums import Game, GameMode
+from aiotfm.friend import Friend
+from aiotfm.player import Player, Profile
+from aiotfm.room import RoomList
+from aiotfm.schema import Schema
+from aiotfm.shop import ShopItem
+from aiotfm.tribe import Member, Rank, Tribe
+
+
+def test_compile():
+	schema = Schema('Record', ('a', 'u8'), ('b', 'u16'), ('_', 'u32'), ('name', 'utf'), ('flag', 'bool'), ('c', 'i32'))
+
+	assert schema.names == ('a', 'b', 'name', 'flag', 'c')
+	# Adjacent fixed size fields are read with a single struct
+	assert schema.source.count('.unpack_from(buffer, pos)') == 2
+
+	with pytest.raises(ValueError):
+		Schema('Record', ('a', 'u64'))
+
+
+def test_decode():
+	schema = Schema('Record', ('a', 'u8'), ('b', 'u16'), ('_', 'u32'), ('name', 'utf'), ('flag', 'bool'), ('c', 'i32'))
+	packet = Packet(b'\x01\x00\x02\xde\xad\xbe\xef\x00\x06aiotfm\x01\xff\xff\xff\xfe\x42')
+
+	assert schema.decode(packet) == (1, 2, 'aiotfm', True, -2)
+	assert packet.read8() == 0x42
+
+	packet.pos = 0
+	assert schema.decode_dict(packet) == {'a': 1, 'b': 2, 'name': 'aiotfm', 'flag': True, 'c': -2}
+
+
+def test_encode():
+	schema = Schema('Record', ('a', 'u8'), ('b', 'u16'), ('_', 'u32'), ('name', 'utf'), ('flag', 'bool'), ('c', 'i32'))
+
+	packet = schema.encode(Packet(), 1, 2, 'aiotfm', True, -2)
+	assert packet.buffer == b'\x01\x00\x02\x00\x00\x00\x00\x00\x06aiotfm\x01\xff\xff\xff\xfe'
+
+	values = {'a': 1, 'b': 2, 'name': b'aiotfm', 'flag': False, 'c': 0}
+	assert schema.decode_dict(schema.encode_dict(Packet(), values)) == {**values, 'name': 'aiotfm'}
+
+
+def test_models():
+	packet = Friend.SCHEMA.encode(Packet(), 42, 'Tigrounette#0001', 1, 0, True, False, 4, '', 1600000000)
+	friend = Friend(None, packet, isSoulmate=True)
+	assert (friend.id, friend.name, friend.hasAvatar, friend.isAddedBack, friend.game) == (
+		42, 'Tigrounette#0001', False, True, Game.TRANSFORMICE
+	)
+
+	packet = Tribe.SCHEMA.encode(Packet(), 7, 'aiotfm', 'Hello', 0).write16(1)
+	Member.SCHEMA.encode(packet, 42, 'Tigrounette#0001', 1, 5, 1600000000, 0, 1, 'en-1')
+	Rank.SCHEMA.encode(packet.write16(1), 'Leader', 0xFFFF)
+	tribe = Tribe(packet)
+	assert (tribe.name, tribe.members[0].name, tribe.members[0].room, tribe.ranks[0].name) == (
+		'aiotfm', 'Tigrounette#0001', 'en-1', 'Leader'
+	)
+
+	packet = ShopItem.SCHEMA.encode(Packet(), 1, 2, 0, True, 0, 100, 20, True).write32(3)
+	item = ShopItem.from_packet(packet)
+	assert (item.category, item.id, item.is_new, item.cheese, item.special) == (1, 2, True, 100, 3)
+	assert packet.pos == len(packet.buffer)
+
+
+def test_room_list():
+	packet = Packet().write8(2).write8(1).write8(9).write8(1)
+	RoomList.ENTRY_SCHEMA.encode(packet, False, 'en', 'gb', 'aiotfm')
+	RoomList.ROOM_SCHEMA.encode(packet, 12, 20, False, True)
+	RoomList.MODIFIED_SCHEMA.encode(packet, True, False, False, True, False, 60, 1000, 2).write8(1).write8(9)
+	RoomList.ENTRY_SCHEMA.encode(packet, True, 'en', 'gb', 'module')
+	RoomList.PINNED_SCHEMA.encode(packet, '42', 'mjj', '#module')
+
+	room_list = RoomList.from_packet(packet)
+	assert room_list.gamemode == GameMode.NORMAL
+	assert room_list.gamemodes == [GameMode.NORMAL, GameMode.RACING]
+
+	room, pinned = room_list.rooms[0], room_list.pinned_rooms[0]
+	assert (room.name, room.player_count, room.limit, room.is_modified) == ('aiotfm', 12, 20, True)
+	assert (room.shaman_skills, room.consumables, room.collision, room.map_rotation) == (False, True, True, [1, 9])
+	assert (pinned.name, pinned.player_count, pinned.command) == ('module', 42, 'mjj')
+
+
+def test_profile():
+	packet = Profile.SCHEMA.encode(Packet(), 'Tigrounette#0001', 42, 1600000000, 10, 1, '', 'Soulmate#0000')
+	packet.write_many('10IH', *range(10), 17).write16(1).write_many('HB', 17, 2)
+	packet.writeUTF('1;0').write16(100).write16(2).write_many('HH', 5, 1).write8(0)
+	packet.write8(3).write8(2).write8(3).write8(4).writeBool(True).write32(7)
+
+	profile = Profile(packet)
+	assert (profile.username, profile.tribe, profile.soulmate, profile.title) == (
+		'Tigrounette#0001', None, 'Soulmate#0000', 17
+	)
+	assert (profile.titles_stars, profile.badges, profile.orbs, profile.adventurePoints) == ({17: 2}, {5: 1}, {3, 4}, 7)
+
+
+def player_reference(packet):
+	name = packet.readUTF()
+	pid = packet.read32()
+	kwargs = {
+		'isShaman': packet.readBool(),
+		'isDead': packet.read8() > 0,
+		'score': packet.read16(),
+		'cheeses': packet.read8(),
+		'title': packet.read16(),
+		'title_stars': packet.read8() - 1,
+		'gender': packet.read8(),
+	}
+	packet.readUTF()
+	look = packet.readUTF()
+	packet.readBool()
+	kwargs.update(mouseColor=packet.read32(), shamanColor=packet.read32())
+	packet.read32()
+	color = packet.read32()
+	packet.read8()
+	return Player(name, pid=pid, look=look, color=color, nameColor=-1 if color == 0xFFFFFFFF else color, **kwargs)
+
+
+def test_player_benchmark():
+	packet = Player.SCHEMA.encode(
+		Packet(), 'Tigrounette#0001', 42, True, 0, 12, 3, 250, 2, 1, '1;0,0,0,0,0,0,0,0,0', 0x78583A, 0x95D9D6, 0xFFFFFFFF
+	)
+
+	mouse = Player.from_packet(packet)
+	assert vars(mouse) == vars(player_reference(Packet(packet.buffer)))
+	assert (mouse.pid, mouse.isShaman, mouse.title_stars, mouse.nameColor) == (42, True, 1, -1)
+
+	start = time.perf_counter()
+	for _ in range(20000):
+		player_reference(Packet(packet.buffer))
+	reference = time.perf_counter() - start
+
+	start = time.perf_counter()
+	for _ in range(20000):
+		Player.from_packet(Packet(packet.buffer))
+	elapsed = time.perf_counter() - start
+
+	print(f'20000 Player.from_packet: {elapsed * 1000:.1f} ms, {reference / elapsed:.2f}x faster than field by field')
@@ -0,0 +1,61 @@
+import asyncio
+import os
+
+import pytest
+
+from aiotfm import Client
+from aiotfm.supervisor import Supervisor
+
+
+class ShardClient(Client):
+	"""A client that doesn't connect: it reports its process then runs until closed."""
+
+	async def start(self, username, crash_marker=None):
+		self.username = username
+		if crash_marker is not None and not os.path.exists(crash_marker):
+			open(crash_marker, 'w').close()
+			os._exit(3)
+
+		self._close_event = asyncio.Future()
+		self.dispatch('tribe_message', username, str(os.getpid()))
+		await self._close_event
+
+
+@pytest.mark.asyncio
+async def test_supervisor(tmp_path):
+	accounts = [{'username': f'bot{i}'} for i in range(3)]
+	accounts.append({'username': 'crashy', 'crash_marker': str(tmp_path / 'crashed')})
+
+	supervisor = Supervisor(
+		accounts, ShardClient, workers=2, restart_delay=.1, pool_options={'login_interval': 0},
+		loop=asyncio.get_running_loop(),
+	)
+	supervisor.POLL_INTERVAL = .05
+	assert supervisor.shard(1) == [accounts[1], accounts[3]]
+
+	messages, crashes = {}, []
+	everyone = asyncio.Event()
+
+	@supervisor.event
+	async def on_tribe_message(worker, username, data):
+		assert data['author'] == username
+		messages[username] = (worker, int(data['content']))
+		if len(messages) == 4:
+			everyone.set()
+
+	@supervisor.event
+	async def on_worker_crash(worker, exitcode):
+		crashes.append((worker, exitcode))
+
+	runner = asyncio.ensure_future(supervisor.start())
+	await asyncio.wait_for(everyone.wait(), 30)
+
+	# The accounts are sharded over two processes, the crashed one has been restarted.
+	assert crashes == [(1, 3)]
+	assert supervisor.restarts == [0, 1]
+	assert messages['bot0'][0] == messages['bot2'][0] == 0
+	assert messages['bot1'][0] == messages['crashy'][0] == 1
+	assert len({pid for _, pid in messages.values()} | {os.getpid()}) == 3
+
+	supervisor.close()
+	await asyncio.wait_for(runner, 10)